@@ -0,0 +1,339 @@
+import re
+
+from index_texte import normaliser
+
+
+# *************************************************************
+# dans ce script, on repère dans les descriptions les
+# abréviations et les formules des catalogues de vente:
+# "L. a. s." (lettre autographe signée), "in-4" (le format),
+# "1 p. 1/2" (une page et demie), "très rare", "déchirure"...
+# on en tire des champs structurés: le type de document, le
+# format, la fraction de page et l'état du document.
+#
+# chercher chaque terme avec sa propre expression régulière
+# demande de relire toute la description une fois par terme.
+# on construit plutôt un *automate d'Aho-Corasick*, qui trouve
+# tous les termes en lisant la description une seule fois:
+# 1. on range tous les termes dans un *arbre préfixe* ("trie"):
+#    chaque nœud correspond à un début de terme, chaque branche
+#    à un caractère. "l. a." et "l. a. s." partagent leurs 5
+#    premiers nœuds.
+# 2. on ajoute à chaque nœud un *lien d'échec*: le nœud du plus
+#    long suffixe du texte lu qui est aussi un début de terme.
+#    quand le caractère suivant ne prolonge aucun terme, on suit
+#    ce lien au lieu de recommencer au début.
+# 3. on lit la description caractère par caractère, en passant
+#    de nœud en nœud. quand on arrive au nœud d'un terme complet,
+#    on a trouvé ce terme.
+#
+# les descriptions et les termes sont normalisés (minuscules,
+# sans accents: voir `index_texte.py`), et les espaces multiples
+# sont réduits à une seule espace. un terme n'est retenu que s'il
+# n'est pas collé à une lettre ou un chiffre. quand deux termes
+# se chevauchent, on garde le plus à gauche, puis le plus long:
+# dans "l. a. s.", on garde "l. a. s." et pas "l. a.".
+#
+# crédits:
+# - code: Paul Kervegan, 2023. code sous licence `GNU GPLv3.0`
+# *************************************************************
+
+
+# les termes à chercher, normalisés, et la valeur que chacun donne à son champ.
+# pour les termes qui contiennent ". ", la variante sans espace ("l.a.s.") est
+# ajoutée automatiquement (voir `variantes()`).
+TERMES = {
+    "type_document": {
+        "l. a. s.": "lettre autographe signee",
+        "l. aut. sig.": "lettre autographe signee",
+        "l. aut. s.": "lettre autographe signee",
+        "lettre autographe signee": "lettre autographe signee",
+        "l. a.": "lettre autographe",
+        "l. aut.": "lettre autographe",
+        "lettre autographe": "lettre autographe",
+        "l. s.": "lettre signee",
+        "l. sig.": "lettre signee",
+        "lettre signee": "lettre signee",
+        "p. a. s.": "piece autographe signee",
+        "piece autographe signee": "piece autographe signee",
+        "p. a.": "piece autographe",
+        "piece autographe": "piece autographe",
+        "p. s.": "piece signee",
+        "piece signee": "piece signee",
+        "billet autographe": "billet",
+        "billet": "billet",
+        "manuscrit autographe": "manuscrit autographe",
+        "manuscrit": "manuscrit",
+        "fragment": "fragment",
+        "copie": "copie",
+        "quittance": "quittance",
+        "apostille": "apostille",
+    },
+    "format": {
+        **{ f"{prefixe}in-{taille}": f"{nom}in-{taille}"
+            for taille in (4, 8, 12, 16, 18, 24, 32)
+            for prefixe, nom in (("", ""), ("pet. ", "petit "), ("gr. ", "grand ")) },
+        "in-fol.": "in-folio",
+        "in-fol": "in-folio",
+        "in-folio": "in-folio",
+        "pet. in-fol.": "petit in-folio",
+        "gr. in-fol.": "grand in-folio",
+    },
+    "fraction_page": {
+        **{ terme.format(fraction=fraction): valeur
+            for fraction, valeur in (("1/4", 0.25), ("1/3", 1 / 3), ("1/2", 0.5), ("2/3", 2 / 3), ("3/4", 0.75))
+            for terme in ("p. {fraction}", "{fraction} p.", "{fraction} de p.", "{fraction} de page", "pages {fraction}") },
+    },
+    "etat": {
+        "rare": "rare",
+        "tres rare": "tres rare",
+        "rarissime": "tres rare",
+        "dechirure": "dechirure",
+        "dechirures": "dechirure",
+        "dechire": "dechirure",
+        "dechiree": "dechirure",
+        "tache": "taches",
+        "taches": "taches",
+        "tachee": "taches",
+        "piqure": "piqures",
+        "piqures": "piqures",
+        "mouillure": "mouillure",
+        "mouillures": "mouillure",
+        "restauree": "restauration",
+        "restauration": "restauration",
+        "rognee": "rognure",
+        "rogne": "rognure",
+        "mutilee": "mutilation",
+        "deterioree": "deterioration",
+        "cachet": "cachet",
+        "cachets": "cachet",
+        "bel etat": "bon etat",
+        "bon etat": "bon etat",
+        "mauvais etat": "mauvais etat",
+    },
+}
+
+# les champs ajoutés aux entrées, et leur valeur quand aucun terme n'est trouvé
+CHAMPS = {"type_document": "", "format": "", "fraction_page": "", "etat": []}
+
+# une suite d'espaces, de tabulations ou de retours à la ligne
+MOTIF_ESPACES = re.compile(r"\s+")
+
+
+def variantes(terme):
+    """
+    >>> variantes("l. a. s.")
+    ['l. a. s.', 'l.a.s.']
+
+    :param terme: un terme normalisé
+    :returns: le terme et sa variante sans espace après les points
+    """
+    sans_espace = terme.replace(". ", ".")
+    return [terme, sans_espace] if sans_espace != terme else [terme]
+
+
+def preparer(description):
+    """
+    :param description: une description
+    :returns: la description normalisée (voir `normaliser()` dans `index_texte.py`),
+              avec une seule espace entre deux mots
+    """
+    return MOTIF_ESPACES.sub(" ", normaliser(description))
+
+
+def lister_termes(termes=TERMES):
+    """
+    :param termes: un dictionnaire comme `TERMES`
+    :returns: la liste des `(terme, champ, valeur)`, variantes comprises
+    """
+    return [
+        (variante, champ, valeur)
+        for champ, valeurs in termes.items()
+        for terme, valeur in valeurs.items()
+        for variante in variantes(terme)
+    ]
+
+
+def _colle(texte, debut, fin):
+    """
+    :returns: `True` si le passage `texte[debut:fin]` touche une lettre ou un chiffre
+    """
+    return (debut > 0 and texte[debut - 1].isalnum()) or (fin < len(texte) and texte[fin].isalnum())
+
+
+def _selectionner(trouves):
+    """
+    parmi des passages trouvés `(debut, fin, numero)`, garder les passages qui ne se
+    chevauchent pas, en préférant le plus à gauche, puis le plus long.
+    """
+    selection = []
+    fin_precedente = 0
+    for debut, fin, numero in sorted(trouves, key=lambda passage: (passage[0], -passage[1])):
+        if debut >= fin_precedente:
+            selection.append((debut, fin, numero))
+            fin_precedente = fin
+    return selection
+
+
+class AhoCorasick:
+    """
+    un automate d'Aho-Corasick, qui trouve tous les termes d'un dictionnaire
+    en lisant un texte une seule fois.
+
+    >>> automate = AhoCorasick(["l. a.", "l. a. s.", "in-4"])
+    >>> automate.trouver("l. a. s., 2 p. in-4")
+    [(0, 5, 0), (0, 8, 1), (15, 19, 2)]  # (début, fin, numéro du terme)
+
+    les nœuds de l'arbre sont numérotés; le nœud 0 est la racine.
+    - `transitions[noeud]` associe à chaque caractère le nœud suivant. une fois
+      l'automate construit, les liens d'échec y sont déjà suivis: on passe d'un
+      nœud à l'autre avec une seule recherche dans un dictionnaire par caractère.
+    - `sorties[noeud]` est la liste des numéros des termes qui finissent à ce nœud,
+      y compris ceux atteints en suivant les liens d'échec.
+    """
+
+    def __init__(self, termes):
+        """
+        :param termes: la liste des termes à chercher
+        """
+        self.termes = list(termes)
+        self.longueurs = [ len(terme) for terme in self.termes ]
+        self.transitions = [{}]
+        self.sorties = [[]]
+
+        # 1. l'arbre préfixe
+        for numero, terme in enumerate(self.termes):
+            noeud = 0
+            for caractere in terme:
+                suivant = self.transitions[noeud].get(caractere)
+                if suivant is None:
+                    suivant = self.transitions[noeud][caractere] = len(self.transitions)
+                    self.transitions.append({})
+                    self.sorties.append([])
+                noeud = suivant
+            self.sorties[noeud].append(numero)
+
+        # 2. les liens d'échec, calculés en parcourant l'arbre en largeur: le lien
+        # d'un nœud pointe toujours vers un nœud moins profond, déjà traité.
+        echecs = [0] * len(self.transitions)
+        file = list(self.transitions[0].values())
+        for noeud in file:
+            for caractere, suivant in list(self.transitions[noeud].items()):
+                file.append(suivant)
+                # le plus long suffixe de `noeud + caractere` qui est un début de terme
+                echec = echecs[noeud]
+                while echec and caractere not in self.transitions[echec]:
+                    echec = echecs[echec]
+                echec = self.transitions[echec].get(caractere, 0)
+                echecs[suivant] = echec
+                self.sorties[suivant] = self.sorties[suivant] + self.sorties[echecs[suivant]]
+            # on recopie les transitions du lien d'échec que le nœud n'a pas:
+            # l'automate n'a plus besoin de suivre les liens pendant la lecture.
+            if noeud:
+                for caractere, suivant in self.transitions[echecs[noeud]].items():
+                    self.transitions[noeud].setdefault(caractere, suivant)
+
+    def trouver(self, texte):
+        """
+        :param texte: le texte où chercher les termes
+        :returns: la liste des passages trouvés, `(debut, fin, numero du terme)`,
+                  y compris ceux qui se chevauchent
+        """
+        transitions = self.transitions
+        sorties = self.sorties
+        trouves = []
+        noeud = 0
+        for fin, caractere in enumerate(texte, 1):
+            noeud = transitions[noeud].get(caractere, 0)
+            if sorties[noeud]:
+                for numero in sorties[noeud]:
+                    trouves.append((fin - self.longueurs[numero], fin, numero))
+        return trouves
+
+
+class Extracteur:
+    """
+    extraire les champs de `TERMES` d'une description.
+
+    >>> extracteur = Extracteur()
+    >>> extracteur.extraire("L. a. s., 1 p. 1/2 in-4. Très rare, petite déchirure.")
+    {'type_document': 'lettre autographe signee', 'format': 'in-4', 'fraction_page': 0.5, 'etat': ['dechirure', 'tres rare']}
+    """
+
+    def __init__(self, termes=TERMES):
+        """
+        :param termes: un dictionnaire comme `TERMES`
+        """
+        self.termes = lister_termes(termes)
+        self.automate = AhoCorasick([ terme for terme, _, _ in self.termes ])
+
+    def passages(self, texte):
+        """
+        :param texte: une description préparée avec `preparer()`
+        :returns: les passages retenus, `(debut, fin, numero du terme)`
+        """
+        return _selectionner(
+            passage for passage in self.automate.trouver(texte) if not _colle(texte, passage[0], passage[1])
+        )
+
+    def extraire(self, description):
+        """
+        :param description: une description
+        :returns: un dictionnaire avec les champs de `CHAMPS`. pour `type_document`,
+                  `format` et `fraction_page`, on garde le premier terme trouvé;
+                  `etat` est la liste triée de tous les états trouvés.
+        """
+        return _champs(self.termes, self.passages(preparer(description)))
+
+    def enrichir(self, entrees):
+        """
+        ajouter les champs de `CHAMPS` à des entrées structurées.
+
+        :param entrees: des dictionnaires produits par `structure()` ou `iter_structure()`
+        :returns: un générateur des mêmes dictionnaires, complétés
+        """
+        for entree in entrees:
+            entree.update(self.extraire(entree["description"]))
+            yield entree
+
+
+class ExtracteurNaif(Extracteur):
+    """
+    la même extraction qu'`Extracteur`, mais avec une expression régulière par
+    terme: chaque description est relue une fois par terme. sert de point de
+    comparaison (voir `benchmark.py`).
+    """
+
+    def __init__(self, termes=TERMES):
+        self.termes = lister_termes(termes)
+        self.motifs = [ re.compile(re.escape(terme)) for terme, _, _ in self.termes ]
+
+    def passages(self, texte):
+        """
+        :param texte: une description préparée avec `preparer()`
+        :returns: les passages retenus, `(debut, fin, numero du terme)`
+        """
+        trouves = []
+        for numero, motif in enumerate(self.motifs):
+            for passage in motif.finditer(texte):
+                if not _colle(texte, passage.start(), passage.end()):
+                    trouves.append((passage.start(), passage.end(), numero))
+        return _selectionner(trouves)
+
+
+def _champs(termes, passages):
+    """
+    :param termes: la liste des `(terme, champ, valeur)`
+    :param passages: les passages retenus, `(debut, fin, numero du terme)`
+    :returns: les champs de `CHAMPS`
+    """
+    champs = { champ: valeur for champ, valeur in CHAMPS.items() if champ != "etat" }
+    etat = set()
+    for _, _, numero in passages:
+        _, champ, valeur = termes[numero]
+        if champ == "etat":
+            etat.add(valeur)
+        elif champs[champ] == "":
+            champs[champ] = valeur
+    champs["etat"] = sorted(etat)
+    return champs
@@ -0,0 +1,166 @@
+from collections import Counter  # pour compter les entrées de chaque groupe en une seule fois
+from itertools import compress, filterfalse  # pour filtrer une colonne à l'aide d'une autre
+from operator import not_
+import math
+
+from corpus import ANNEE_MANQUANTE
+
+
+# *************************************************************
+# dans ce script, on calcule des statistiques sur le prix des
+# manuscrits (nombre de ventes, prix médian, prix moyen,
+# centiles...) en regroupant les entrées selon une ou plusieurs
+# clés: année de vente, année d'écriture, genre, monnaie, auteur.ice.
+#
+# `axes()` (dans `fouille_texte.py`) fait le même travail pour
+# une seule clé (l'année de vente) et une seule statistique (la
+# médiane). `agreger()` généralise ce calcul à un `Corpus`
+# (voir `corpus.py`) et calcule tous les groupes en un seul appel:
+# 1. on compte les entrées par groupe avec `Counter`
+# 2. on répartit les prix connus dans un "seau" par groupe
+# 3. on trie chaque seau: médiane et centiles se lisent alors
+#    directement dans la liste triée.
+#
+# crédits:
+# - code: Paul Kervegan, 2023. code sous licence `GNU GPLv3.0`
+# *************************************************************
+
+
+# les clés de regroupement possibles. pour les clés encodées, on indique
+# le nom de la liste de valeurs du `Corpus` qui permet de décoder la colonne.
+CLES = {
+    "date_vente": None,
+    "date_creation": None,
+    "genre": "valeurs_genre",
+    "monnaie": "valeurs_monnaie",
+    "auteur": "valeurs_auteur",
+}
+
+
+def agreger(corpus, cles=("date_vente",), centiles=()):
+    """
+    calculer, pour chaque groupe d'entrées partageant les mêmes valeurs pour
+    `cles`, des statistiques sur le prix en francs constants:
+
+    >>> agreger(corpus, cles=("genre", "date_vente"), centiles=(10, 90))
+    {
+        ("roman", 1879): {"nombre": 3, "nombre_prix": 2, "mediane": 12.5, "moyenne": 12.5, "p10": 10.5, "p90": 14.5},
+        ...
+    }
+
+    - `nombre`: le nombre d'entrées du groupe (avec ou sans prix)
+    - `nombre_prix`: le nombre d'entrées du groupe qui ont un prix
+    - `mediane`, `moyenne` et les centiles `p...`: calculés sur les prix connus.
+      ils valent `None` si aucune entrée du groupe n'a de prix.
+
+    :param corpus: un `Corpus`. pour regrouper par genre, on peut réunir
+                   les corpus de plusieurs genres avec `Corpus.etendre()`
+    :param cles: les noms des clés de regroupement, parmi `CLES`
+    :param centiles: les centiles à calculer, entre 0 et 100. ils sont calculés
+                     par interpolation linéaire entre les deux prix les plus proches
+    :returns: un dictionnaire associant à chaque groupe (un tuple de valeurs,
+              dans l'ordre de `cles`) ses statistiques. une année manquante vaut `""`.
+    """
+    for cle in cles:
+        if cle not in CLES:
+            raise ValueError(f"clé de regroupement inconnue: {cle} (clés possibles: {', '.join(CLES)})")
+
+    # on construit la colonne des groupes: pour une seule clé, c'est la colonne
+    # elle-même; pour plusieurs clés, chaque groupe est un tuple de codes.
+    colonnes = [ getattr(corpus, cle) for cle in cles ]
+    if len(colonnes) == 1:
+        groupes = colonnes[0]
+    else:
+        groupes = list(zip(*colonnes))
+
+    # 1. compter les entrées par groupe
+    nombres = Counter(groupes)
+
+    # 2. répartir les prix connus par groupe. un prix manquant vaut `NaN`:
+    #    `compress()` garde les groupes des entrées qui ont un prix et
+    #    `filterfalse()` garde les prix qui ne sont pas `NaN`.
+    prix = corpus.prix_constant
+    avec_prix = map(not_, map(math.isnan, prix))
+    seaux = {}
+    for groupe, valeur in zip(compress(groupes, avec_prix), filterfalse(math.isnan, prix)):
+        seau = seaux.get(groupe)
+        if seau is None:
+            seaux[groupe] = [valeur]
+        else:
+            seau.append(valeur)
+
+    # 3. trier chaque seau et calculer les statistiques
+    decodage = [ _decodeur(corpus, cle) for cle in cles ]
+    resultat = {}
+    for groupe, nombre in nombres.items():
+        codes = groupe if len(cles) > 1 else (groupe,)
+        seau = seaux.get(groupe, [])
+        seau.sort()
+        statistiques = {
+            "nombre": nombre,
+            "nombre_prix": len(seau),
+            "mediane": mediane(seau),
+            "moyenne": sum(seau) / len(seau) if seau else None,
+        }
+        for valeur in centiles:
+            statistiques[f"p{valeur:g}"] = centile(seau, valeur)
+        resultat[tuple(decoder(code) for decoder, code in zip(decodage, codes))] = statistiques
+
+    return resultat
+
+
+def axes_depuis_agregat(agregat):
+    """
+    traduire le résultat de `agreger(corpus, cles=("date_vente",))` en axes
+    identiques à ceux que renvoie `axes()` dans `fouille_texte.py`.
+
+    :param agregat: le résultat de `agreger()`, regroupé par année de vente seulement
+    :returns: `x`, `y_prix`, `y_count`, comme `axes()`
+    """
+    annees = [ groupe[0] for groupe in agregat ]
+    x = list(range(min(annees), max(annees) + 1))
+    y_prix = {}
+    y_count = {}
+    for annee in x:
+        statistiques = agregat.get((annee,))
+        if statistiques is None:
+            y_prix[annee] = 0
+            y_count[annee] = 0
+        else:
+            y_prix[annee] = statistiques["mediane"] if statistiques["nombre_prix"] > 0 else 0
+            y_count[annee] = statistiques["nombre"]
+    return x, y_prix, y_count
+
+
+def _decodeur(corpus, cle):
+    """
+    renvoyer une fonction qui traduit un code de la colonne `cle` en valeur lisible
+    """
+    if CLES[cle] is None:
+        return lambda annee: "" if annee == ANNEE_MANQUANTE else annee
+    return getattr(corpus, CLES[cle]).__getitem__
+
+
+def mediane(valeurs):
+    """
+    médiane d'une liste triée, calculée comme `statistics.median()`
+    """
+    n = len(valeurs)
+    if n == 0:
+        return None
+    milieu = n // 2
+    if n % 2 == 1:
+        return valeurs[milieu]
+    return (valeurs[milieu - 1] + valeurs[milieu]) / 2
+
+
+def centile(valeurs, valeur):
+    """
+    centile `valeur` (entre 0 et 100) d'une liste triée, par interpolation linéaire
+    """
+    if not valeurs:
+        return None
+    position = (len(valeurs) - 1) * valeur / 100
+    bas = math.floor(position)
+    haut = math.ceil(position)
+    return valeurs[bas] + (valeurs[haut] - valeurs[bas]) * (position - bas)
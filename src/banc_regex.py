@@ -0,0 +1,432 @@
+import multiprocessing  # pour interrompre une expression régulière trop lente
+import argparse  # pour lire les arguments passés en ligne de commande
+import datetime
+import json
+import math
+import time
+import re
+import os
+
+from fouille_texte import MOTIF_CHAMPS, MOTIF_ENTREE_VIDE, genres_disponibles, read_text
+
+
+# *************************************************************
+# dans ce script, on compare des *variantes* d'expressions
+# régulières, pour choisir un motif à partir de mesures plutôt
+# qu'au jugé. c'est un "banc d'essai".
+#
+# les variantes sont regroupées en *familles*: des motifs qui
+# cherchent la même chose (un prix, une entrée vide...). la
+# première variante d'une famille est la *référence*. pour
+# chaque variante, on mesure:
+# 1. l'accord avec la référence: trouve-t-elle les mêmes
+#    choses, sur les exemples de `regex_exemples.txt` et sur
+#    les entrées des catalogues? quand une ligne d'exemple est
+#    annotée (`# cibler` ou `# ne pas cibler`), on vérifie aussi
+#    que la variante fait ce qui est attendu.
+# 2. le débit: le nombre d'entrées des catalogues traitées par
+#    seconde.
+# 3. le pire cas: le temps sur des textes *adversaires*, construits
+#    pour faire échouer le motif le plus lentement possible.
+#
+# pourquoi un pire cas?
+# ~~~~~~~~~~~~~~~~~~~~~
+# le module `re` essaie les possibilités une par une, et revient
+# en arrière quand une possibilité échoue ("backtracking"). quand
+# un texte peut être découpé de plusieurs façons par le motif, il
+# essaie tous les découpages avant d'abandonner:
+# - `\d+\.?\d*` sur "1111" peut couper entre `\d+` et `\d*` à
+#   chaque chiffre: si la suite du motif échoue, le temps est
+#   *quadratique* en nombre de chiffres. `\d+(?:\.\d*)?` trouve
+#   exactement les mêmes nombres, mais d'une seule façon.
+# - `^(\w+\s?)*$` sur "aaaa!" peut découper les "a" de 2 ** n
+#   façons: le temps est *exponentiel*. c'est le "retour arrière
+#   catastrophique": 30 lettres suffisent à bloquer python.
+# on mesure donc chaque variante sur des textes adversaires de
+# taille croissante (8, 16, 32... caractères) et on estime
+# l'*exposant* de la croissance: 1 pour un temps linéaire, 2 pour
+# un temps quadratique. comme on ne peut pas interrompre une
+# expression régulière, chaque mesure est faite dans un processus
+# séparé, arrêté après `temps_max` secondes.
+#
+#   python src/banc_regex.py
+#   python src/banc_regex.py --familles prix --temps-max 0.5
+#
+# crédits:
+# - code: Paul Kervegan, 2023. code sous licence `GNU GPLv3.0`
+# *************************************************************
+
+
+# le fichier d'exemples, à la racine du dépôt
+REGEX_EXEMPLES = os.path.join(os.path.abspath(os.path.dirname(__file__)), os.pardir, "regex_exemples.txt")
+
+# le dossier où sont enregistrés les résultats
+DOSSIER_RESULTATS = os.path.join(os.path.abspath(os.path.dirname(__file__)), os.pardir, "out", "benchmark")
+
+# les tailles des textes adversaires, et le temps au-delà duquel une mesure est arrêtée
+TAILLES_ADVERSAIRES = tuple(2 ** puissance for puissance in range(3, 17))
+TEMPS_MAX = 1.0
+
+# une mesure de pire cas répète la recherche pendant au moins ce temps, pour
+# pouvoir mesurer précisément des recherches de quelques microsecondes
+DUREE_MIN_MESURE = 0.01
+
+# une annotation à la fin d'une ligne d'exemple: `# cibler`, `# ne pas cibler`
+MOTIF_ANNOTATION = re.compile(r"\s+#\s*(?P<note>.*)$")
+
+# les familles de variantes. pour chaque famille:
+# - `section`: le titre de la section de `regex_exemples.txt` à utiliser, ou `None`
+# - `catalogues`: si `True`, mesurer aussi l'accord et le débit sur les catalogues
+# - `mode`: `search` (le motif est-il trouvé?) ou `finditer` (toutes les occurrences
+#   et leurs sous-groupes)
+# - `variantes`: `nom: (motif, drapeaux)`. la première est la référence.
+# - `adversaires`: `nom: fonction`, qui construit un texte adversaire de taille `n`
+FAMILLES = {
+    "entree_vide": {
+        "section": "cibler les lignes vides",
+        "catalogues": True,
+        "mode": "search",
+        "variantes": {
+            "historique": (r"^(\n|\s)*$", re.MULTILINE),
+            "actuelle": (MOTIF_ENTREE_VIDE.pattern, MOTIF_ENTREE_VIDE.flags),
+            "texte_entier": (r"\A\s*\Z", 0),
+        },
+        "adversaires": {
+            "espaces": lambda n: " " * n + "x",
+            "retours_a_la_ligne": lambda n: "\n" * n + "x",
+            "lignes_blanches": lambda n: " \n" * n + "x",
+        },
+    },
+    "prix": {
+        "section": "cibler prix, monnaie et prix décimaux",
+        "catalogues": True,
+        "mode": "finditer",
+        "variantes": {
+            "historique": (r"Prix: (\d+\.?\d*) ([A-Z]+)", 0),
+            "sans_ambiguite": (r"Prix: (\d+(?:\.\d*)?) ([A-Z]+)", 0),
+            "decimales_completes": (r"Prix: (\d+(?:\.\d+)?) ([A-Z]+)", 0),
+            "classe": (r"Prix: ([\d.]+) ([A-Z]+)", 0),
+        },
+        "adversaires": {
+            "chiffres_sans_monnaie": lambda n: "Prix: " + "1" * n + " x",
+            "points_sans_monnaie": lambda n: "Prix: 1" + "." * n + " x",
+        },
+    },
+    "chiffres": {
+        "section": "cibler les chiffres",
+        "catalogues": True,
+        "mode": "finditer",
+        "variantes": {
+            "historique": (r"\d+\.?\d*", 0),
+            "sans_ambiguite": (r"\d+(?:\.\d*)?", 0),
+            "decimales_completes": (r"\d+(?:\.\d+)?", 0),
+        },
+        "adversaires": {
+            "chiffres": lambda n: "1" * n,
+            "nombres": lambda n: "1.1 " * (n // 4),
+        },
+    },
+    "champs": {
+        "section": None,
+        "catalogues": True,
+        "mode": "finditer",
+        "variantes": {
+            "actuelle": (MOTIF_CHAMPS.pattern, MOTIF_CHAMPS.flags),
+            "sans_ambiguite": (MOTIF_CHAMPS.pattern.replace(r"\d+\.?\d*", r"\d+(?:\.\d*)?"), MOTIF_CHAMPS.flags),
+        },
+        "adversaires": {
+            "prix_sans_monnaie": lambda n: "Prix: " + "1" * n + " x",
+            "dimensions_sans_pages": lambda n: "Dimensions: " + "1" * n + " x",
+        },
+    },
+    # une démonstration: ce motif n'est utilisé nulle part dans le projet. il
+    # n'est pas mesuré sur les catalogues, où il pourrait bloquer python.
+    "mots": {
+        "section": None,
+        "catalogues": False,
+        "mode": "search",
+        "variantes": {
+            "catastrophique": (r"^(\w+\s?)*$", 0),
+            "classe": (r"^[\w\s]*$", 0),
+            "possessive": (r"^(?:\w+\s?)*+$", 0),  # quantificateur possessif, python 3.11 ou plus
+        },
+        "adversaires": {
+            "lettres": lambda n: "a" * n + "!",
+            "mots": lambda n: "ab " * (n // 3) + "!",
+        },
+    },
+}
+
+
+def lire_exemples(chemin=REGEX_EXEMPLES):
+    """
+    lire les sections de `regex_exemples.txt`. les sections sont séparées par
+    une ligne de tirets et commencent par un titre (`# cibler ...`).
+
+    :param chemin: le chemin du fichier d'exemples
+    :returns: un dictionnaire `{titre: [(ligne, attendu), ...]}`. `attendu` vaut
+              `True` pour une ligne annotée `# cibler`, `False` pour `# ne pas ... cibler`,
+              et `None` pour une ligne sans annotation. l'annotation est retirée de la ligne.
+    """
+    with open(chemin, mode="r", encoding="utf-8") as fh:
+        texte = fh.read()
+    sections = {}
+    for section in re.split(r"^-{10,}$", texte, flags=re.MULTILINE):
+        lignes = section.strip("\n").split("\n")
+        if not lignes or not lignes[0].startswith("#"):
+            continue
+        exemples = []
+        for ligne in lignes[1:]:
+            annotation = MOTIF_ANNOTATION.search(ligne)
+            attendu = None
+            if annotation and "cibler" in annotation["note"]:
+                attendu = "ne pas" not in annotation["note"]
+                ligne = ligne[:annotation.start()]
+            exemples.append((ligne, attendu))
+        sections[lignes[0].lstrip("#").strip()] = exemples
+    return sections
+
+
+def lire_catalogues(dossier=None):
+    """
+    :param dossier: le dossier des catalogues (par défaut, `in/`)
+    :returns: les entrées brutes de tous les catalogues, découpées comme dans
+              `structure()` mais sans retirer les entrées vides
+    """
+    entrees = []
+    for genre in genres_disponibles(dossier):
+        entrees.extend(read_text(genre, dossier).split("\n\n\n"))
+    return entrees
+
+
+def resultat(regex, mode, texte):
+    """
+    :returns: pour le mode `search`, `True` si le motif est trouvé dans `texte`;
+              pour le mode `finditer`, la liste des positions et des sous-groupes
+              de toutes les occurrences
+    """
+    if mode == "search":
+        return regex.search(texte) is not None
+    return [ (trouve.start(), trouve.end(), trouve.groups()) for trouve in regex.finditer(texte) ]
+
+
+def accord(reference, variante, mode, textes, attendus=None, exemples_max=3):
+    """
+    comparer une variante à la référence sur des textes.
+
+    :param reference: la référence compilée
+    :param variante: la variante compilée
+    :param mode: `search` ou `finditer`
+    :param textes: une liste de textes
+    :param attendus: pour chaque texte, `True`, `False` ou `None` (voir `lire_exemples()`)
+    :param exemples_max: le nombre maximal de désaccords gardés en exemple
+    :returns: un dictionnaire: la part des textes où les deux motifs trouvent (ou
+              non) quelque chose (`accord_presence`), la part des textes où ils
+              trouvent exactement la même chose (`accord_exact`), quelques
+              désaccords, et le nombre de résultats conformes aux annotations
+    """
+    presence = exact = 0
+    desaccords = []
+    conformes = annotes = 0
+    for position, texte in enumerate(textes):
+        attendu_reference = resultat(reference, mode, texte)
+        obtenu = resultat(variante, mode, texte)
+        presence += bool(attendu_reference) == bool(obtenu)
+        if attendu_reference == obtenu:
+            exact += 1
+        elif len(desaccords) < exemples_max:
+            desaccords.append({"texte": texte[:80], "reference": attendu_reference, "variante": obtenu})
+        if attendus is not None and attendus[position] is not None:
+            annotes += 1
+            conformes += bool(obtenu) == attendus[position]
+    nombre = max(len(textes), 1)
+    mesure = {
+        "textes": len(textes),
+        "accord_presence": presence / nombre,
+        "accord_exact": exact / nombre,
+        "desaccords": desaccords,
+    }
+    if annotes:
+        mesure["annotations_conformes"] = f"{conformes}/{annotes}"
+    return mesure
+
+
+def debit(regex, mode, textes, repetitions=3):
+    """
+    :returns: le nombre de textes traités par seconde et le débit en Mo/s
+              (le meilleur de `repetitions` essais)
+    """
+    if mode == "search":
+        traiter = lambda: [ regex.search(texte) for texte in textes ]
+    else:
+        traiter = lambda: [ list(regex.finditer(texte)) for texte in textes ]
+    secondes = None
+    for _ in range(repetitions):
+        debut = time.perf_counter()
+        traiter()
+        duree = time.perf_counter() - debut
+        secondes = duree if secondes is None else min(secondes, duree)
+    octets = sum(len(texte.encode("utf-8")) for texte in textes)
+    return {
+        "textes_par_seconde": len(textes) / secondes if secondes else None,
+        "mo_par_seconde": octets / 1e6 / secondes if secondes else None,
+    }
+
+
+def _chronometrer(motif, drapeaux, mode, texte, connexion):
+    """
+    dans un processus séparé: mesurer une recherche sur `texte` et envoyer
+    la durée moyenne d'une recherche à `connexion`.
+    """
+    regex = re.compile(motif, drapeaux)
+    repetitions = 0
+    debut = time.perf_counter()
+    while True:
+        resultat(regex, mode, texte)
+        repetitions += 1
+        duree = time.perf_counter() - debut
+        if duree >= DUREE_MIN_MESURE:
+            break
+    connexion.send(duree / repetitions)
+
+
+def pire_cas(motif, drapeaux, mode, adversaire, tailles=TAILLES_ADVERSAIRES, temps_max=TEMPS_MAX):
+    """
+    mesurer une variante sur des textes adversaires de tailles croissantes.
+    les mesures s'arrêtent à la première taille qui dépasse `temps_max`.
+
+    :param motif: le motif de la variante
+    :param drapeaux: les drapeaux de la variante (`re.MULTILINE`...)
+    :param mode: `search` ou `finditer`
+    :param adversaire: une fonction qui construit un texte adversaire de taille `n`
+    :param tailles: les tailles des textes adversaires
+    :param temps_max: le temps maximal d'une mesure, en secondes
+    :returns: un dictionnaire: les mesures `[taille, secondes]`, la taille à partir
+              de laquelle une recherche dépasse `temps_max` (ou `None`), et l'exposant
+              de la croissance entre les deux dernières mesures
+    """
+    mesures = []
+    depasse = None
+    for taille in tailles:
+        reception, envoi = multiprocessing.Pipe(duplex=False)
+        processus = multiprocessing.Process(
+            target=_chronometrer, args=(motif, drapeaux, mode, adversaire(taille), envoi)
+        )
+        processus.start()
+        # la première recherche peut durer `temps_max`, les répétitions `DUREE_MIN_MESURE`
+        termine = reception.poll(temps_max + DUREE_MIN_MESURE)
+        if termine:
+            secondes = reception.recv()
+        processus.terminate()
+        processus.join()
+        if not termine or secondes > temps_max:
+            depasse = taille
+            break
+        mesures.append([taille, secondes])
+
+    exposant = None
+    if len(mesures) >= 2:
+        (taille_1, secondes_1), (taille_2, secondes_2) = mesures[-2:]
+        exposant = math.log(secondes_2 / secondes_1) / math.log(taille_2 / taille_1)
+    return {"mesures": mesures, "depasse": depasse, "exposant": exposant}
+
+
+def evaluer(familles=None, dossier=None, repetitions=3, temps_max=TEMPS_MAX, exemples=REGEX_EXEMPLES):
+    """
+    évaluer toutes les variantes des familles choisies.
+
+    :param familles: les noms des familles, parmi `FAMILLES` (par défaut, toutes)
+    :param dossier: le dossier des catalogues (par défaut, `in/`)
+    :param repetitions: le nombre d'essais pour mesurer le débit
+    :param temps_max: le temps maximal d'une mesure de pire cas, en secondes
+    :param exemples: le chemin du fichier d'exemples
+    :returns: `{famille: {variante: mesures}}`
+    """
+    sections = lire_exemples(exemples)
+    entrees = lire_catalogues(dossier)
+    resultats = {}
+    for nom_famille in familles or FAMILLES:
+        famille = FAMILLES[nom_famille]
+        mode = famille["mode"]
+        variantes = famille["variantes"]
+        nom_reference = next(iter(variantes))
+        reference = re.compile(*variantes[nom_reference])
+        resultats[nom_famille] = {}
+        for nom, (motif, drapeaux) in variantes.items():
+            mesures = {"motif": motif}
+            try:
+                regex = re.compile(motif, drapeaux)
+            except re.error as erreur:
+                # par exemple un quantificateur possessif avant python 3.11
+                mesures["erreur"] = str(erreur)
+                resultats[nom_famille][nom] = mesures
+                continue
+            if famille["section"] is not None:
+                lignes, attendus = zip(*sections[famille["section"]])
+                mesures["exemples"] = accord(reference, regex, mode, lignes, attendus)
+            if famille["catalogues"]:
+                mesures["catalogues"] = accord(reference, regex, mode, entrees)
+                mesures["catalogues"].update(debit(regex, mode, entrees, repetitions))
+            mesures["pire_cas"] = {
+                nom_adversaire: pire_cas(motif, drapeaux, mode, adversaire, temps_max=temps_max)
+                for nom_adversaire, adversaire in famille["adversaires"].items()
+            }
+            resultats[nom_famille][nom] = mesures
+    return resultats
+
+
+def afficher(resultats):
+    """
+    afficher les résultats de `evaluer()` sous forme de tableau
+    """
+    for nom_famille, variantes in resultats.items():
+        print(f"\n{nom_famille}")
+        for nom, mesures in variantes.items():
+            if "erreur" in mesures:
+                print(f"  {nom:<20} | motif invalide: {mesures['erreur']}")
+                continue
+            colonnes = [f"  {nom:<20}"]
+            if "exemples" in mesures:
+                exemples = mesures["exemples"]
+                colonnes.append(f"exemples {exemples['accord_exact']:6.1%}")
+                if "annotations_conformes" in exemples:
+                    colonnes.append(f"annotations {exemples['annotations_conformes']:>5}")
+            if "catalogues" in mesures:
+                catalogues = mesures["catalogues"]
+                colonnes.append(f"catalogues {catalogues['accord_exact']:6.1%}")
+                colonnes.append(f"{catalogues['textes_par_seconde']:>10.0f} entrées/s")
+            print(" | ".join(colonnes))
+            for nom_adversaire, cas in mesures["pire_cas"].items():
+                taille, secondes = cas["mesures"][-1] if cas["mesures"] else (0, 0.0)
+                exposant = "      -" if cas["exposant"] is None else f"n^{cas['exposant']:.1f}"
+                depasse = f" | > temps max à n={cas['depasse']}" if cas["depasse"] else ""
+                print(f"      {nom_adversaire:<22} | n={taille:<6} {secondes * 1e3:10.3f} ms | {exposant}{depasse}")
+
+
+def enregistrer(resultats, sortie=None):
+    """
+    :param resultats: les résultats de `evaluer()`
+    :param sortie: le chemin du fichier JSON. par défaut, un fichier daté dans `out/benchmark/`
+    :returns: le chemin du fichier
+    """
+    if sortie is None:
+        sortie = os.path.join(DOSSIER_RESULTATS, f"regex_{datetime.datetime.now():%Y%m%d_%H%M%S}.json")
+    if not os.path.isdir(os.path.dirname(os.path.abspath(sortie))):
+        os.makedirs(os.path.dirname(os.path.abspath(sortie)))
+    with open(sortie, mode="w", encoding="utf-8") as fh:
+        json.dump(resultats, fh, indent=2, ensure_ascii=False)
+    return sortie
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="comparer des variantes d'expressions régulières")
+    parser.add_argument("--familles", nargs="+", choices=list(FAMILLES), help="les familles à évaluer (par défaut, toutes)")
+    parser.add_argument("--dossier", help="le dossier des catalogues (par défaut, `in/`)")
+    parser.add_argument("--repetitions", type=int, default=3, help="nombre d'essais par mesure de débit")
+    parser.add_argument("--temps-max", type=float, default=TEMPS_MAX, help="temps maximal d'une mesure de pire cas, en secondes")
+    parser.add_argument("--sortie", help="fichier JSON où enregistrer les résultats")
+    arguments = parser.parse_args()
+
+    resultats = evaluer(arguments.familles, arguments.dossier, arguments.repetitions, arguments.temps_max)
+    afficher(resultats)
+    print(enregistrer(resultats, arguments.sortie))
@@ -0,0 +1,326 @@
+from itertools import repeat
+import sqlite3  # base de données SQL enregistrée dans un seul fichier, incluse dans python
+import os
+
+from corpus import Corpus, ANNEE_MANQUANTE
+from cache import empreinte_fichier
+from fouille_texte import VERSION_ANALYSEUR, chemin_catalogue, iter_structure, structure_entree
+from agregation import axes_depuis_agregat
+
+
+# *************************************************************
+# dans ce script, on enregistre les entrées des catalogues dans
+# une base de données SQLite, au lieu de relire et restructurer
+# les fichiers texte à chaque analyse.
+#
+# SQLite, c'est quoi?
+# ~~~~~~~~~~~~~~~~~~~
+# une base de données SQL complète, stockée dans un seul fichier
+# et incluse dans python (module `sqlite3`). les données sont
+# rangées dans des *tables* (des tableaux avec des colonnes
+# typées) et interrogées avec le langage SQL:
+#   SELECT auteur, prix_constant FROM entrees WHERE date_vente = 1879
+#
+# la base contient 3 tables:
+# - `entrees`: une ligne par entrée de catalogue, avec son genre.
+#   des *index* sur le genre, l'année de vente, l'auteur.ice et
+#   le prix permettent de retrouver des lignes sans parcourir
+#   toute la table (comme l'index à la fin d'un livre).
+# - `resume`: pour chaque genre et chaque année de vente, le
+#   nombre d'entrées, le nombre de prix, la somme et la médiane
+#   des prix. c'est un *résumé précalculé*: les graphiques
+#   sont créés à partir de cette petite table, quelle que soit
+#   la taille du corpus. à chaque chargement, on ne recalcule
+#   que les lignes des années qui ont reçu de nouvelles entrées.
+# - `catalogues`: l'empreinte de chaque catalogue texte importé,
+#   pour ne pas le réimporter s'il n'a pas changé.
+#
+# les entrées sont chargées en une seule *transaction*, avec
+# `executemany()`: une seule requête préparée pour toutes les
+# lignes, et une seule écriture sur le disque à la fin (au lieu
+# d'une par ligne). si le chargement échoue, la base revient à
+# son état d'avant.
+#
+# crédits:
+# - code: Paul Kervegan, 2023. code sous licence `GNU GPLv3.0`
+# *************************************************************
+
+
+# le chemin par défaut de la base, dans le dossier `in/`
+CHEMIN_BASE = os.path.join(os.path.abspath(os.path.dirname(__file__)), os.pardir, "in", "catalogues.sqlite")
+
+# le schéma de la base. `IF NOT EXISTS`: on peut l'exécuter sur une base existante.
+# l'index `entrees_genre_vente_prix` sert à la fois pour le genre, pour le
+# couple (genre, année de vente) et pour trier les prix d'une année (médiane).
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entrees (
+    id INTEGER PRIMARY KEY,
+    genre TEXT NOT NULL,
+    identifiant TEXT,
+    auteur TEXT NOT NULL,
+    date_creation INTEGER,
+    date_vente INTEGER,
+    prix REAL,
+    prix_constant REAL,
+    monnaie TEXT NOT NULL,
+    description TEXT NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS entrees_identifiant ON entrees (genre, identifiant);
+CREATE INDEX IF NOT EXISTS entrees_genre_vente_prix ON entrees (genre, date_vente, prix_constant);
+CREATE INDEX IF NOT EXISTS entrees_vente ON entrees (date_vente);
+CREATE INDEX IF NOT EXISTS entrees_auteur ON entrees (auteur);
+CREATE INDEX IF NOT EXISTS entrees_prix ON entrees (prix_constant);
+
+CREATE TABLE IF NOT EXISTS resume (
+    genre TEXT NOT NULL,
+    date_vente INTEGER NOT NULL,
+    nombre INTEGER NOT NULL,
+    nombre_prix INTEGER NOT NULL,
+    somme_prix REAL NOT NULL,
+    mediane REAL,
+    PRIMARY KEY (genre, date_vente)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS catalogues (
+    genre TEXT PRIMARY KEY,
+    empreinte TEXT NOT NULL,
+    version INTEGER NOT NULL
+);
+"""
+
+# les colonnes de `entrees` remplies à partir d'une entrée structurée
+COLONNES = ("auteur", "date_creation", "date_vente", "prix", "prix_constant", "monnaie", "description")
+NUMERIQUES = ("date_creation", "date_vente", "prix", "prix_constant")
+
+
+class BaseCatalogues:
+    """
+    une base SQLite contenant les entrées des catalogues.
+
+    >>> with BaseCatalogues() as base:
+    ...     base.importer_catalogue("roman")   # depuis `in/catalogue_roman.txt`
+    ...     corpus = base.corpus("roman")      # un `Corpus` (voir `corpus.py`)
+    ...     x, y_prix, y_count = base.axes("roman")
+
+    les entrées d'un genre viennent soit d'un catalogue texte (`importer_catalogue()`),
+    soit directement de la récolte (`charger_jeu_de_donnees()`): importer un
+    catalogue remplace toutes les entrées de son genre.
+    """
+
+    def __init__(self, chemin=None):
+        """
+        :param chemin: le chemin du fichier de la base (par défaut, `CHEMIN_BASE`).
+                       il est créé s'il n'existe pas.
+        """
+        if not chemin:
+            chemin = CHEMIN_BASE
+        dossier = os.path.dirname(os.path.abspath(chemin))
+        if not os.path.isdir(dossier):
+            os.makedirs(dossier)
+        self.connexion = sqlite3.connect(chemin)
+        # le journal WAL ("write-ahead log") permet de lire la base pendant
+        # qu'un autre programme y écrit.
+        self.connexion.execute("PRAGMA journal_mode = WAL")
+        self.connexion.executescript(SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *erreur):
+        self.fermer()
+
+    def fermer(self):
+        self.connexion.close()
+
+    def charger(self, genre, entrees, identifiants=None):
+        """
+        ajouter des entrées à la base, en une seule transaction, puis mettre
+        à jour le résumé des années concernées.
+
+        :param genre: le genre des entrées
+        :param entrees: des dictionnaires produits par `structure()` ou `iter_structure()`
+        :param identifiants: les identifiants des entrées (par exemple ceux de
+                             l'API Katabase), dans le même ordre, ou `None`. une
+                             entrée dont l'identifiant est déjà dans la base est ignorée.
+        :returns: le nombre d'entrées ajoutées
+        """
+        # `with self.connexion`: une transaction, validée à la fin du bloc ou annulée en cas d'erreur
+        with self.connexion:
+            ajoutees, annees = self._inserer(genre, entrees, identifiants)
+            self._rafraichir(genre, annees)
+        return ajoutees
+
+    def _inserer(self, genre, entrees, identifiants=None):
+        """
+        insérer des entrées avec `executemany()`, dans la transaction en cours.
+
+        :returns: le nombre d'entrées ajoutées et l'ensemble de leurs années de vente
+        """
+        annees = set()
+
+        def lignes():
+            # un générateur: `executemany()` lit les lignes une par une, sans
+            # qu'on ait besoin de construire une liste de toutes les lignes.
+            for entree, identifiant in zip(entrees, repeat(None) if identifiants is None else identifiants):
+                annees.add(entree["date_vente"])
+                # une valeur numérique manquante (`""`) devient `NULL`
+                yield (genre, identifiant, *(
+                    None if entree[colonne] == "" and colonne in NUMERIQUES else entree[colonne]
+                    for colonne in COLONNES
+                ))
+
+        avant = self.connexion.total_changes
+        self.connexion.executemany(
+            f"INSERT OR IGNORE INTO entrees (genre, identifiant, {', '.join(COLONNES)}) "
+            f"VALUES ({', '.join('?' * (len(COLONNES) + 2))})",
+            lignes()
+        )
+        return self.connexion.total_changes - avant, annees
+
+    def charger_jeu_de_donnees(self, genre, dataset):
+        """
+        ajouter les entrées d'un jeu de données récolté (voir `creation_corpus.py`),
+        sans passer par un fichier texte. les entrées sont structurées comme si
+        elles avaient été écrites par `make_text()` puis relues par `structure()`:
+        les valeurs de la base sont les mêmes dans les deux cas.
+
+        :param genre: le genre des entrées
+        :param dataset: un jeu de données nettoyé par `clean_dataset()`
+        :returns: le nombre d'entrées ajoutées: les entrées déjà récoltées sont ignorées
+        """
+        from creation_corpus import value_to_text
+
+        return self.charger(
+            genre,
+            ( structure_entree(value_to_text(value)) for value in dataset.values() ),
+            [ str(identifiant) for identifiant in dataset ]
+        )
+
+    def importer_catalogue(self, genre, dossier=None):
+        """
+        importer le catalogue texte d'un genre, s'il a changé depuis le dernier import.
+
+        :param genre: le genre du catalogue
+        :param dossier: le dossier des catalogues (par défaut, `in/`)
+        :returns: le nombre d'entrées importées (0 si le catalogue n'a pas changé)
+        """
+        chemin = chemin_catalogue(genre, dossier)
+        empreinte = empreinte_fichier(chemin)
+        if self.connexion.execute(
+            "SELECT 1 FROM catalogues WHERE genre = ? AND empreinte = ? AND version = ?",
+            (genre, empreinte, VERSION_ANALYSEUR)
+        ).fetchone():
+            return 0
+
+        with self.connexion:
+            # les années du résumé qui vont disparaître doivent aussi être recalculées
+            anciennes = [ ligne[0] for ligne in self.connexion.execute(
+                "SELECT date_vente FROM resume WHERE genre = ?", (genre,)
+            ) ]
+            self.connexion.execute("DELETE FROM entrees WHERE genre = ?", (genre,))
+            self.connexion.execute("DELETE FROM resume WHERE genre = ?", (genre,))
+            self.connexion.execute(
+                "INSERT OR REPLACE INTO catalogues VALUES (?, ?, ?)", (genre, empreinte, VERSION_ANALYSEUR)
+            )
+            nombre, annees = self._inserer(genre, iter_structure(genre, dossier=dossier))
+            self._rafraichir(genre, annees.union(anciennes))
+        return nombre
+
+    def _rafraichir(self, genre, annees):
+        """
+        recalculer les lignes du résumé pour un genre et des années de vente.
+        chaque calcul ne lit que les entrées de l'année, grâce à l'index
+        `entrees_genre_vente_prix`: la médiane est lue directement à sa position
+        dans les prix triés (`LIMIT ... OFFSET ...`).
+
+        :param genre: le genre
+        :param annees: les années de vente à recalculer (`""` pour une année manquante)
+        """
+        for annee in annees:
+            annee = None if annee == "" or annee == ANNEE_MANQUANTE else annee
+            # `IS` compare aussi les valeurs manquantes (`NULL`), contrairement à `=`
+            nombre, nombre_prix, somme = self.connexion.execute(
+                "SELECT COUNT(*), COUNT(prix_constant), TOTAL(prix_constant) FROM entrees "
+                "WHERE genre = ? AND date_vente IS ?", (genre, annee)
+            ).fetchone()
+            cle = ANNEE_MANQUANTE if annee is None else annee
+            if nombre == 0:
+                self.connexion.execute("DELETE FROM resume WHERE genre = ? AND date_vente = ?", (genre, cle))
+                continue
+            mediane = None
+            if nombre_prix > 0:
+                # les deux prix du milieu si leur nombre est pair, sinon celui du milieu
+                milieu = [ ligne[0] for ligne in self.connexion.execute(
+                    "SELECT prix_constant FROM entrees WHERE genre = ? AND date_vente IS ? "
+                    "AND prix_constant IS NOT NULL ORDER BY prix_constant LIMIT ? OFFSET ?",
+                    (genre, annee, 2 - nombre_prix % 2, (nombre_prix - 1) // 2)
+                ) ]
+                mediane = sum(milieu) / len(milieu) if len(milieu) == 2 else milieu[0]
+            self.connexion.execute(
+                "INSERT OR REPLACE INTO resume VALUES (?, ?, ?, ?, ?, ?)",
+                (genre, cle, nombre, nombre_prix, somme, mediane)
+            )
+
+    def genres(self):
+        """
+        :returns: la liste triée des genres de la base
+        """
+        return [ ligne[0] for ligne in self.connexion.execute("SELECT DISTINCT genre FROM resume ORDER BY genre") ]
+
+    def iter_entrees(self, genre):
+        """
+        :param genre: le genre des entrées
+        :returns: un générateur de dictionnaires, identiques à ceux de `structure()`,
+                  dans l'ordre où les entrées ont été chargées
+        """
+        curseur = self.connexion.execute(
+            f"SELECT {', '.join(COLONNES)} FROM entrees WHERE genre = ? ORDER BY id", (genre,)
+        )
+        for ligne in curseur:
+            yield { colonne: "" if valeur is None else valeur for colonne, valeur in zip(COLONNES, ligne) }
+
+    def corpus(self, genre):
+        """
+        :param genre: le genre des entrées
+        :returns: les entrées du genre, sous la forme d'un `Corpus` (voir `corpus.py`)
+        """
+        return Corpus.depuis_entrees(self.iter_entrees(genre), genre=genre)
+
+    def agregat(self, genres=None):
+        """
+        lire le résumé, au format de `agreger(corpus, cles=("genre", "date_vente"))`
+        (voir `agregation.py`), sans les centiles.
+
+        :param genres: les genres à lire, ou `None` pour tous les genres
+        :returns: un dictionnaire `{(genre, annee): statistiques}`. une année manquante vaut `""`.
+        """
+        requete = "SELECT genre, date_vente, nombre, nombre_prix, somme_prix, mediane FROM resume"
+        parametres = ()
+        if genres is not None:
+            parametres = tuple(genres)
+            requete += f" WHERE genre IN ({', '.join('?' * len(parametres))})"
+        resultat = {}
+        for genre, annee, nombre, nombre_prix, somme, mediane in self.connexion.execute(requete, parametres):
+            resultat[(genre, "" if annee == ANNEE_MANQUANTE else annee)] = {
+                "nombre": nombre,
+                "nombre_prix": nombre_prix,
+                "mediane": mediane,
+                "moyenne": somme / nombre_prix if nombre_prix else None,
+            }
+        return resultat
+
+    def axes(self, genre):
+        """
+        :param genre: le genre du corpus
+        :returns: `x`, `y_prix`, `y_count`, comme `axes()` (voir `fouille_texte.py`),
+                  calculés à partir du résumé. les entrées sans année de vente
+                  n'ont pas de place sur l'axe des années et sont ignorées.
+        """
+        agregat = {
+            (annee,): statistiques for (_, annee), statistiques in self.agregat((genre,)).items()
+            if annee != ""
+        }
+        if not agregat:
+            return [], {}, {}
+        return axes_depuis_agregat(agregat)
+
@@ -0,0 +1,241 @@
+import argparse  # pour lire les arguments passés en ligne de commande
+import datetime
+import platform
+import subprocess
+import tracemalloc  # pour mesurer la mémoire utilisée par python
+import json
+import time
+import sys
+import os
+
+from abreviations import Extracteur, ExtracteurNaif
+from fouille_texte import read_text, structure, axes, align_y_to_x, figures
+from generateur_catalogue import generer_catalogue, VERSION_GENERATEUR
+
+
+# *************************************************************
+# dans ce script, on mesure les performances de `fouille_texte.py`
+# sur des catalogues synthétiques de tailles croissantes (voir
+# `generateur_catalogue.py`).
+#
+# chaque étape (`read_text`, `structure`, `axes`, `align_y_to_x`,
+# `figures`, l'extraction des abréviations) est mesurée séparément:
+# - son temps d'exécution (le meilleur de plusieurs essais)
+# - le pic de mémoire qu'elle utilise, mesuré avec `tracemalloc`
+#   lors d'un passage séparé, car `tracemalloc` ralentit python.
+#
+# l'extraction des abréviations (voir `abreviations.py`) est
+# mesurée deux fois: avec l'automate d'Aho-Corasick, et avec une
+# expression régulière par terme (`abreviations_naif`).
+#
+# on mesure aussi le temps entre le lancement de
+# `python src/cli.py structure --jsonl` et l'écriture de la première
+# entrée structurée: c'est surtout le temps d'importer les modules.
+#
+# les résultats sont enregistrés en JSON, pour comparer deux
+# versions du code:
+#
+#   python src/benchmark.py --tailles 1000 10000 100000
+#   python src/benchmark.py --comparer ancien.json nouveau.json
+#
+# crédits:
+# - code: Paul Kervegan, 2023. code sous licence `GNU GPLv3.0`
+# *************************************************************
+
+
+# le dossier où sont écrits les catalogues synthétiques et les résultats
+DOSSIER_BENCHMARK = os.path.join(os.path.abspath(os.path.dirname(__file__)), os.pardir, "out", "benchmark")
+
+# les tailles de catalogue mesurées par défaut
+TAILLES = (1000, 10000, 100000)
+
+
+def mesurer(fonction, repetitions=3):
+    """
+    mesurer le temps d'exécution et le pic de mémoire d'une fonction.
+
+    :param fonction: une fonction sans argument
+    :param repetitions: le nombre d'essais pour mesurer le temps
+    :returns: un dictionnaire `{"secondes": ..., "pic_memoire": ...}` et le
+              résultat de la fonction
+    """
+    secondes = None
+    for _ in range(repetitions):
+        debut = time.perf_counter()
+        resultat = fonction()
+        duree = time.perf_counter() - debut
+        secondes = duree if secondes is None else min(secondes, duree)
+
+    # la mémoire est mesurée lors d'un passage à part
+    del resultat
+    tracemalloc.start()
+    resultat = fonction()
+    _, pic = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {"secondes": secondes, "pic_memoire": pic}, resultat
+
+
+def temps_premiere_entree(genre, dossier, repetitions=3):
+    """
+    mesurer le temps entre le lancement de `cli.py structure --jsonl` dans un
+    nouveau processus python et la lecture de la première entrée qu'il écrit.
+
+    :param genre: le genre du catalogue
+    :param dossier: le dossier du catalogue
+    :param repetitions: le nombre d'essais (on garde le meilleur)
+    :returns: le temps en secondes
+    """
+    commande = [
+        sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "cli.py"),
+        "structure", genre, "--jsonl", "--dossier", dossier
+    ]
+    secondes = None
+    for _ in range(repetitions):
+        debut = time.perf_counter()
+        with subprocess.Popen(commande, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL) as processus:
+            processus.stdout.readline()
+            duree = time.perf_counter() - debut
+            processus.kill()
+        secondes = duree if secondes is None else min(secondes, duree)
+    return secondes
+
+
+def mesurer_taille(nombre, dossier=DOSSIER_BENCHMARK, repetitions=3, graine=0):
+    """
+    mesurer toutes les étapes sur un catalogue synthétique de `nombre` entrées.
+    le catalogue est créé s'il n'existe pas encore. son nom contient la graine et
+    la version du générateur: un catalogue créé par une autre version de
+    `generateur_catalogue.py` n'est jamais réutilisé.
+
+    :param nombre: le nombre d'entrées du catalogue
+    :param dossier: le dossier des catalogues synthétiques
+    :param repetitions: le nombre d'essais pour mesurer le temps
+    :param graine: la graine du générateur (voir `generer_catalogue()`)
+    :returns: les mesures de chaque étape
+    """
+    dossier_catalogues = os.path.join(dossier, "catalogues")
+    genre = f"synthetique_{nombre}_v{VERSION_GENERATEUR}_g{graine}"
+    chemin = os.path.join(dossier_catalogues, f"catalogue_{genre}.txt")
+    if not os.path.isfile(chemin):
+        generer_catalogue(chemin, nombre, graine)
+
+    etapes = {}
+    etapes["read_text"], texte = mesurer(lambda: read_text(genre, dossier_catalogues), repetitions)
+    etapes["structure"], corpus = mesurer(lambda: structure(texte), repetitions)
+    etapes["axes"], (x, y_prix, y_count) = mesurer(lambda: axes(corpus), repetitions)
+    # comme dans `visualize()`: 4 genres, 2 axes des ordonnées par genre
+    etapes["align_y_to_x"], _ = mesurer(
+        lambda: [ align_y_to_x(x, y) for _ in range(4) for y in (y_prix, y_count) ],
+        repetitions
+    )
+    # `figures()` calcule aussi les axes de chacun des 4 corpus
+    etapes["figures"], _ = mesurer(lambda: figures(corpus, corpus, corpus, corpus), repetitions)
+    for nom, extracteur in (("abreviations", Extracteur()), ("abreviations_naif", ExtracteurNaif())):
+        etapes[nom], _ = mesurer(lambda: [ extracteur.extraire(entree["description"]) for entree in corpus ], repetitions)
+
+    for mesure in etapes.values():
+        mesure["entrees_par_seconde"] = nombre / mesure["secondes"] if mesure["secondes"] > 0 else None
+
+    return {
+        "entrees": nombre,
+        "graine": graine,
+        "version_generateur": VERSION_GENERATEUR,
+        "taille_octets": os.path.getsize(chemin),
+        "premiere_entree_secondes": temps_premiere_entree(genre, dossier_catalogues, repetitions),
+        "etapes": etapes
+    }
+
+
+def lancer(tailles=TAILLES, dossier=DOSSIER_BENCHMARK, repetitions=3, sortie=None):
+    """
+    mesurer toutes les tailles et enregistrer les résultats en JSON.
+
+    :param tailles: les nombres d'entrées des catalogues à mesurer
+    :param dossier: le dossier des catalogues synthétiques et des résultats
+    :param repetitions: le nombre d'essais pour mesurer le temps
+    :param sortie: le chemin du fichier de résultats. par défaut, un fichier
+                   daté dans `out/benchmark/`
+    :returns: le chemin du fichier de résultats
+    """
+    maintenant = datetime.datetime.now()
+    resultats = {
+        "date": maintenant.isoformat(timespec="seconds"),
+        "commit": _commit(),
+        "python": platform.python_version(),
+        "plateforme": platform.platform(),
+        "mesures": []
+    }
+    for nombre in tailles:
+        mesures = mesurer_taille(nombre, dossier, repetitions)
+        resultats["mesures"].append(mesures)
+        for etape, mesure in mesures["etapes"].items():
+            print(f"{nombre:>10} entrées | {etape:<13} | {mesure['secondes']:10.4f} s | {mesure['pic_memoire'] / 1e6:10.1f} Mo")
+        print(f"{nombre:>10} entrées | 1re entrée    | {mesures['premiere_entree_secondes']:10.4f} s")
+
+    if sortie is None:
+        sortie = os.path.join(dossier, f"resultats_{maintenant:%Y%m%d_%H%M%S}.json")
+    if not os.path.isdir(os.path.dirname(os.path.abspath(sortie))):
+        os.makedirs(os.path.dirname(os.path.abspath(sortie)))
+    with open(sortie, mode="w", encoding="utf-8") as fh:
+        json.dump(resultats, fh, indent=2)
+    return sortie
+
+
+def comparer(ancien, nouveau, seuil=1.1):
+    """
+    comparer deux fichiers de résultats et afficher, pour chaque taille et
+    chaque étape, le rapport entre le nouveau temps et l'ancien.
+
+    :param ancien: le chemin des résultats de référence
+    :param nouveau: le chemin des nouveaux résultats
+    :param seuil: au-delà de ce rapport, une étape est considérée comme ralentie
+    :returns: la liste des étapes ralenties, sous la forme `(entrees, etape, rapport)`
+    """
+    with open(ancien, mode="r", encoding="utf-8") as fh:
+        ancien = { mesure["entrees"]: mesure for mesure in json.load(fh)["mesures"] }
+    with open(nouveau, mode="r", encoding="utf-8") as fh:
+        nouveau = { mesure["entrees"]: mesure for mesure in json.load(fh)["mesures"] }
+
+    ralentissements = []
+    for nombre in sorted(set(ancien) & set(nouveau)):
+        # des mesures sur deux catalogues différents ne sont pas comparables
+        entrees = [ (mesure.get("version_generateur"), mesure.get("graine")) for mesure in (ancien[nombre], nouveau[nombre]) ]
+        if entrees[0] != entrees[1]:
+            print(f"{nombre:>10} entrées | attention: catalogues différents (version du générateur, graine): {entrees[0]} et {entrees[1]}")
+        for etape, mesure in nouveau[nombre]["etapes"].items():
+            if etape not in ancien[nombre]["etapes"]:
+                continue
+            rapport = mesure["secondes"] / ancien[nombre]["etapes"][etape]["secondes"]
+            marque = " <= ralentissement" if rapport > seuil else ""
+            print(f"{nombre:>10} entrées | {etape:<13} | x{rapport:.2f}{marque}")
+            if rapport > seuil:
+                ralentissements.append((nombre, etape, rapport))
+    return ralentissements
+
+
+def _commit():
+    """
+    :returns: l'identifiant du commit git actuel, ou `None` hors d'un dépôt git
+    """
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="mesurer les performances de fouille_texte.py")
+    parser.add_argument("--tailles", type=int, nargs="+", default=TAILLES, help="nombres d'entrées des catalogues (de 1000 à 10000000)")
+    parser.add_argument("--repetitions", type=int, default=3, help="nombre d'essais par mesure de temps")
+    parser.add_argument("--sortie", help="fichier JSON où enregistrer les résultats")
+    parser.add_argument("--comparer", nargs=2, metavar=("ANCIEN", "NOUVEAU"), help="comparer deux fichiers de résultats")
+    arguments = parser.parse_args()
+
+    if arguments.comparer:
+        comparer(*arguments.comparer)
+    else:
+        print(lancer(arguments.tailles, repetitions=arguments.repetitions, sortie=arguments.sortie))
@@ -0,0 +1,218 @@
+import hashlib  # pour calculer l'empreinte (le "hash") d'un fichier
+import pickle  # pour enregistrer des objets python dans un fichier binaire
+import os
+
+
+# *************************************************************
+# dans ce script, on gère un cache sur le disque: au lieu de
+# relire et restructurer un catalogue à chaque exécution, on
+# enregistre le résultat de la structuration dans `cache/` et
+# on le recharge tant que le catalogue n'a pas changé.
+#
+# comment sait-on qu'un catalogue n'a pas changé? chaque entrée
+# du cache est identifiée par une *clé* construite à partir:
+# - du chemin du catalogue
+# - de sa taille et de sa date de modification
+# - d'une empreinte (hash SHA-256) de son contenu
+# - de la version de l'analyseur: si on modifie la manière de
+#   structurer un catalogue, on change la version et les anciens
+#   résultats ne sont plus utilisés.
+# si l'un de ces éléments change, la clé change et on
+# restructure le catalogue.
+#
+# le cache a une taille maximale: quand elle est dépassée, on
+# supprime les entrées utilisées le moins récemment.
+#
+# crédits:
+# - code: Paul Kervegan, 2023. code sous licence `GNU GPLv3.0`
+# *************************************************************
+
+
+# le dossier du cache, à la racine du dépôt
+DOSSIER_CACHE = os.path.join(os.path.abspath(os.path.dirname(__file__)), os.pardir, "cache")
+
+# la taille maximale du cache, en octets
+TAILLE_MAX_CACHE = 256 * 1024 * 1024
+
+# la taille des blocs lus pour calculer l'empreinte d'un fichier
+TAILLE_BLOC_HASH = 1024 * 1024
+
+
+def empreinte_fichier(chemin):
+    """
+    calculer l'empreinte SHA-256 du contenu d'un fichier, en le lisant
+    par blocs pour ne pas le charger entièrement en mémoire.
+
+    :param chemin: le chemin du fichier
+    :returns: l'empreinte, en chaîne hexadécimale
+    """
+    empreinte = hashlib.sha256()
+    with open(chemin, mode="rb") as fh:
+        for bloc in iter(lambda: fh.read(TAILLE_BLOC_HASH), b""):
+            empreinte.update(bloc)
+    return empreinte.hexdigest()
+
+
+def chemin_entree(chemin, version, dossier=DOSSIER_CACHE):
+    """
+    construire le chemin de l'entrée du cache pour le fichier `chemin`.
+
+    le nom du fichier de cache a deux parties:
+    - une empreinte du chemin seul, qui permet de retrouver toutes les
+      entrées d'un même catalogue (voir `invalider()`)
+    - une empreinte de la clé complète (chemin, taille, date de modification,
+      contenu, version)
+
+    :param chemin: le chemin du catalogue
+    :param version: la version de l'analyseur
+    :param dossier: le dossier du cache
+    :returns: le chemin du fichier de cache
+    """
+    chemin = os.path.abspath(chemin)
+    infos = os.stat(chemin)
+    cle = f"{chemin}|{infos.st_size}|{infos.st_mtime_ns}|{empreinte_fichier(chemin)}|{version}"
+    prefixe = hashlib.sha256(chemin.encode("utf-8")).hexdigest()[:16]
+    return os.path.join(dossier, f"{prefixe}-{hashlib.sha256(cle.encode('utf-8')).hexdigest()}.pickle")
+
+
+def charger(chemin, structurer, version, dossier=DOSSIER_CACHE, taille_max=TAILLE_MAX_CACHE):
+    """
+    renvoyer le résultat de `structurer(chemin)`, depuis le cache si
+    possible. si le résultat n'est pas dans le cache, on le calcule et
+    on l'enregistre dans le cache.
+
+    :param chemin: le chemin du catalogue
+    :param structurer: la fonction qui structure le catalogue, appelée avec `chemin`
+    :param version: la version de l'analyseur
+    :param dossier: le dossier du cache
+    :param taille_max: la taille maximale du cache, en octets
+    :returns: le catalogue structuré
+    """
+    fichier_cache = chemin_entree(chemin, version, dossier)
+
+    if os.path.isfile(fichier_cache):
+        try:
+            with open(fichier_cache, mode="rb") as fh:
+                resultat = pickle.load(fh)
+        except Exception:
+            # une entrée abîmée (par exemple, un programme interrompu pendant
+            # l'écriture) ou périmée (une classe comme `Corpus` a changé depuis
+            # l'enregistrement: `AttributeError`, `ImportError`...) est ignorée:
+            # on restructure le catalogue.
+            pass
+        else:
+            # on met à jour la date de modification de l'entrée: c'est elle
+            # qui indique quand l'entrée a été utilisée pour la dernière fois.
+            try:
+                os.utime(fichier_cache)
+            except FileNotFoundError:
+                pass  # supprimée entre temps par `evincer()`, dans un autre processus
+            return resultat
+
+    resultat = structurer(chemin)
+
+    if not os.path.isdir(dossier):
+        os.makedirs(dossier)
+    # on écrit d'abord dans un fichier temporaire, puis on le renomme: un
+    # autre programme qui lit le cache ne verra jamais un fichier à moitié écrit.
+    fichier_temporaire = f"{fichier_cache}.{os.getpid()}.tmp"
+    with open(fichier_temporaire, mode="wb") as fh:
+        pickle.dump(resultat, fh, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(fichier_temporaire, fichier_cache)
+
+    # on remplace les anciennes entrées du même catalogue et on fait de la place
+    for fichier in _entrees(dossier, _prefixe(fichier_cache)):
+        if fichier != fichier_cache:
+            _supprimer(fichier)
+    evincer(dossier, taille_max)
+
+    return resultat
+
+
+def invalider(chemin=None, dossier=DOSSIER_CACHE):
+    """
+    supprimer du cache les entrées d'un catalogue, ou tout le cache.
+
+    :param chemin: le chemin du catalogue. si `None`, on vide tout le cache
+    :param dossier: le dossier du cache
+    """
+    if not os.path.isdir(dossier):
+        return
+    prefixe = None
+    if chemin is not None:
+        prefixe = hashlib.sha256(os.path.abspath(chemin).encode("utf-8")).hexdigest()[:16]
+    for fichier in _entrees(dossier, prefixe):
+        _supprimer(fichier)
+
+
+def evincer(dossier=DOSSIER_CACHE, taille_max=TAILLE_MAX_CACHE):
+    """
+    supprimer les entrées utilisées le moins récemment jusqu'à ce que la
+    taille totale du cache soit inférieure à `taille_max`.
+
+    :param dossier: le dossier du cache
+    :param taille_max: la taille maximale du cache, en octets
+    """
+    evincer_fichiers(dossier, taille_max, lambda nom: nom.endswith(".pickle"))
+
+
+def evincer_fichiers(dossier, taille_max, filtre, taille=os.path.getsize, supprimer=None):
+    """
+    supprimer les entrées d'un cache sur le disque utilisées le moins récemment,
+    jusqu'à ce que sa taille totale soit inférieure à `taille_max`. la date de
+    modification du fichier d'une entrée indique sa dernière utilisation.
+
+    ce cache, celui des réponses de l'API (`cache_http.py`) et celui des
+    graphiques (`rendu.py`) utilisent tous cette fonction.
+
+    :param dossier: le dossier du cache
+    :param taille_max: la taille maximale du cache, en octets
+    :param filtre: une fonction qui reçoit le nom d'un fichier du dossier et renvoie
+                   `True` si ce fichier est une entrée du cache
+    :param taille: une fonction qui reçoit le chemin d'une entrée et renvoie sa taille,
+                   en octets. par défaut, la taille du fichier
+    :param supprimer: une fonction qui supprime une entrée à partir de son chemin.
+                      par défaut, on supprime le fichier
+    """
+    if not os.path.isdir(dossier):
+        return
+    if supprimer is None:
+        supprimer = _supprimer
+    entrees = []
+    for nom in os.listdir(dossier):
+        if not filtre(nom):
+            continue
+        fichier = os.path.join(dossier, nom)
+        try:
+            entrees.append((os.stat(fichier).st_mtime_ns, taille(fichier), fichier))
+        except FileNotFoundError:
+            continue  # supprimée entre temps, par un autre thread ou un autre processus
+    entrees.sort()  # de la moins récemment utilisée à la plus récemment utilisée
+
+    taille_totale = sum(entree[1] for entree in entrees)
+    for _, taille_entree, fichier in entrees:
+        if taille_totale <= taille_max:
+            break
+        supprimer(fichier)
+        taille_totale -= taille_entree
+
+
+def _prefixe(fichier_cache):
+    return os.path.basename(fichier_cache).split("-")[0]
+
+
+def _entrees(dossier, prefixe=None):
+    """
+    lister les fichiers du cache, éventuellement seulement ceux d'un catalogue
+    """
+    return [
+        os.path.join(dossier, nom) for nom in os.listdir(dossier)
+        if nom.endswith(".pickle") and (prefixe is None or nom.startswith(f"{prefixe}-"))
+    ]
+
+
+def _supprimer(fichier):
+    try:
+        os.remove(fichier)
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,334 @@
+from collections import Counter
+import threading
+import hashlib
+import pickle
+import time
+import json
+import os
+
+from cache import DOSSIER_CACHE, evincer_fichiers
+
+
+# *************************************************************
+# dans ce script, on garde sur le disque les réponses de l'API
+# Katabase, pour ne pas retélécharger à chaque récolte des
+# données de ventes qui ne changent presque jamais.
+#
+# chaque réponse est enregistrée dans `cache/http/`, en deux
+# fichiers: le texte de la réponse (`.corps`), tel quel, et ses
+# métadonnées (`.pickle`: date, en-têtes de version...). le texte
+# est écrit morceau par morceau pendant le téléchargement, et relu
+# de même: il n'est jamais en mémoire d'un seul coup. les deux
+# fichiers sont nommés d'après une *clé* calculée à partir de
+# l'URL et des paramètres de la
+# requête, *normalisés*: on ne garde que les paramètres qui
+# définissent la requête (`level`, `format`, `sell_date`, `name`),
+# sans tenir compte des majuscules, des espaces autour des valeurs
+# ni de l'ordre des paramètres. "Voltaire" et " voltaire" donnent
+# donc la même clé.
+#
+# une réponse a une *durée de vie*:
+# - tant qu'elle est *fraîche* (plus récente que la durée de vie),
+#   on la réutilise sans contacter le serveur.
+# - ensuite, on demande au serveur si elle a changé: c'est la
+#   *revalidation*. si le serveur avait envoyé un identifiant de
+#   version (en-tête `ETag`) ou une date de modification
+#   (`Last-Modified`), on les lui renvoie (`If-None-Match`,
+#   `If-Modified-Since`). si rien n'a changé, le serveur répond
+#   "304 Not Modified", sans renvoyer les données, et la réponse
+#   enregistrée redevient fraîche.
+#
+# en mode *hors ligne*, on n'utilise que le cache, même pour des
+# réponses qui ne sont plus fraîches: une requête absente du cache
+# provoque une erreur `AbsentDuCache`.
+#
+# comme le cache des corpus (`cache.py`), ce cache a une taille
+# maximale: au-delà, les réponses utilisées le moins récemment
+# sont supprimées (leurs deux fichiers ensemble).
+#
+# crédits:
+# - code: Paul Kervegan, 2023. code sous licence `GNU GPLv3.0`
+# *************************************************************
+
+
+# le dossier des réponses enregistrées
+DOSSIER_CACHE_HTTP = os.path.join(DOSSIER_CACHE, "http")
+
+# la durée de vie d'une réponse (7 jours), en secondes
+DUREE_VIE = 7 * 24 * 3600
+
+# la taille maximale du cache, en octets
+TAILLE_MAX_CACHE_HTTP = 64 * 1024 * 1024
+
+# les paramètres qui définissent une requête: les autres ne font pas partie de la clé
+PARAMETRES_CLE = ("level", "format", "sell_date", "name")
+
+# la taille des morceaux de texte relus depuis le cache, en caractères
+TAILLE_MORCEAU = 64 * 1024
+
+
+class AbsentDuCache(Exception):
+    """
+    en mode hors ligne, une requête dont la réponse n'est pas dans le cache
+    """
+
+
+class CacheHTTP:
+    """
+    un cache sur le disque des réponses HTTP.
+
+    >>> cache = CacheHTTP(duree_vie=24 * 3600)
+    >>> entree = cache.lire(url, params)
+    >>> if entree is not None and cache.est_frais(entree):
+    ...     morceaux = cache.corps(entree)                  # sans contacter le serveur (ou `None`)
+    >>> r = session.get(url, params=params, headers=cache.entetes_conditionnels(entree), stream=True)
+    >>> if r.status_code == 304:
+    ...     morceaux = cache.corps(cache.revalider(entree, r.headers))
+    >>> else:
+    ...     with cache.enregistrement(url, params, r.headers) as copie:
+    ...         for morceau in copie.copier(r.iter_content(decode_unicode=True)):
+    ...             ...                                     # écrit dans le cache au passage
+    """
+
+    def __init__(self, dossier=DOSSIER_CACHE_HTTP, duree_vie=DUREE_VIE, taille_max=TAILLE_MAX_CACHE_HTTP, hors_ligne=False):
+        """
+        :param dossier: le dossier des réponses enregistrées
+        :param duree_vie: la durée de vie d'une réponse, en secondes
+        :param taille_max: la taille maximale du cache, en octets
+        :param hors_ligne: si `True`, ne jamais contacter le serveur
+        """
+        self.dossier = dossier
+        self.duree_vie = duree_vie
+        self.taille_max = taille_max
+        self.hors_ligne = hors_ligne
+        # nombre de réponses servies depuis le cache (`fraiches`), revalidées
+        # par le serveur (`revalidees`) ou téléchargées (`telechargees`)
+        self.statistiques = Counter()
+        self.verrou = threading.Lock()  # le cache peut être utilisé par plusieurs threads
+
+    def compter(self, nom):
+        with self.verrou:
+            self.statistiques[nom] += 1
+
+    def chemin(self, url, params):
+        """
+        :param url: l'URL de la requête
+        :param params: les paramètres de la requête
+        :returns: le chemin du fichier des métadonnées de la réponse, construit à partir
+                  de la clé normalisée. le texte est dans le fichier `chemin_corps()`
+        """
+        cle = json.dumps([url.strip().rstrip("?"), cle_parametres(params)])
+        return os.path.join(self.dossier, f"{hashlib.sha256(cle.encode('utf-8')).hexdigest()}.pickle")
+
+    def lire(self, url, params):
+        """
+        :returns: les métadonnées de la réponse enregistrée pour cette requête, ou `None`.
+                  c'est un dictionnaire: `date` (la date d'enregistrement ou de dernière
+                  revalidation), `etag` et `last_modified`. le texte se lit avec `corps()`
+        """
+        chemin = self.chemin(url, params)
+        try:
+            with open(chemin, mode="rb") as fh:
+                entree = pickle.load(fh)
+            # la date de modification des fichiers indique leur dernière utilisation (voir
+            # `cache.evincer_fichiers()`): une réponse qu'on vient de lire ne sera pas supprimée la première.
+            os.utime(chemin)
+            os.utime(chemin_corps(chemin))
+        except (OSError, EOFError, pickle.UnpicklingError):
+            # absente, abîmée, supprimée entre temps par un autre thread qui fait de la
+            # place, ou enregistrée par une ancienne version de ce script: on la retélécharge
+            return None
+        return entree
+
+    def corps(self, entree):
+        """
+        relire le texte d'une réponse enregistrée, morceau par morceau.
+
+        :param entree: la réponse enregistrée, renvoyée par `lire()` ou `revalider()`
+        :returns: un générateur des morceaux du texte, ou `None` si le texte a été
+                  supprimé depuis `lire()` par un autre thread qui fait de la place:
+                  la réponse est alors à retélécharger, comme une réponse absente
+        """
+        # le fichier est ouvert tout de suite, et non à la première lecture: une fois
+        # ouvert, on peut le lire jusqu'au bout même s'il est supprimé entre temps.
+        try:
+            fh = open(chemin_corps(self.chemin(entree["url"], entree["params"])), mode="r", encoding="utf-8", newline="")
+        except FileNotFoundError:
+            return None
+        return _morceaux_fichier(fh)
+
+    def est_frais(self, entree):
+        """
+        :returns: `True` si la réponse est plus récente que la durée de vie
+        """
+        return time.time() - entree["date"] < self.duree_vie
+
+    def entetes_conditionnels(self, entree):
+        """
+        :param entree: la réponse enregistrée, ou `None`
+        :returns: les en-têtes à envoyer pour demander au serveur si la réponse a changé
+        """
+        entetes = {}
+        if entree is not None:
+            if entree["etag"]:
+                entetes["If-None-Match"] = entree["etag"]
+            if entree["last_modified"]:
+                entetes["If-Modified-Since"] = entree["last_modified"]
+        return entetes
+
+    def enregistrement(self, url, params, entetes):
+        """
+        enregistrer une réponse pendant qu'on la télécharge: voir `Enregistrement`.
+
+        :param url: l'URL de la requête
+        :param params: les paramètres de la requête
+        :param entetes: les en-têtes de la réponse
+        :returns: un `Enregistrement`, à utiliser avec `with`
+        """
+        entree = {
+            "url": url,
+            "params": dict(cle_parametres(params)),  # normalisés
+            "date": time.time(),
+            "etag": entetes.get("ETag"),
+            "last_modified": entetes.get("Last-Modified")
+        }
+        return Enregistrement(self, entree)
+
+    def revalider(self, entree, entetes):
+        """
+        le serveur a répondu "304 Not Modified": la réponse enregistrée redevient fraîche.
+
+        :param entree: la réponse enregistrée
+        :param entetes: les en-têtes de la réponse 304, qui peuvent contenir un nouvel `ETag`
+        :returns: la réponse enregistrée, mise à jour
+        """
+        entree = dict(entree, date=time.time())
+        entree["etag"] = entetes.get("ETag", entree["etag"])
+        entree["last_modified"] = entetes.get("Last-Modified", entree["last_modified"])
+        self._ecrire(self.chemin(entree["url"], entree["params"]), entree)
+        return entree
+
+    def vider(self):
+        """
+        supprimer toutes les réponses enregistrées
+        """
+        if os.path.isdir(self.dossier):
+            for nom in os.listdir(self.dossier):
+                if nom.endswith((".pickle", ".corps")):
+                    _supprimer(os.path.join(self.dossier, nom))
+
+    def _ecrire(self, chemin, entree):
+        # comme dans `cache.charger()`: un fichier temporaire puis un renommage,
+        # pour qu'un autre thread ne lise jamais une réponse à moitié écrite
+        fichier_temporaire = fichier_temporaire_de(chemin)
+        with open(fichier_temporaire, mode="wb") as fh:
+            pickle.dump(entree, fh, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(fichier_temporaire, chemin)
+
+class Enregistrement:
+    """
+    écrire dans le cache le texte d'une réponse au fur et à mesure qu'il arrive.
+
+    le texte est écrit dans un fichier temporaire. à la fin du bloc `with`, s'il n'y
+    a pas eu d'erreur, le fichier temporaire remplace l'ancien texte et les métadonnées
+    sont enregistrées; sinon (réponse interrompue ou invalide), il est supprimé:
+    une réponse incomplète n'est jamais servie depuis le cache.
+
+    >>> with cache.enregistrement(url, params, r.headers) as copie:
+    ...     resultats = decoder(copie.copier(morceaux))
+    """
+
+    def __init__(self, cache, entree):
+        """
+        :param cache: le `CacheHTTP`
+        :param entree: les métadonnées de la réponse
+        """
+        self.cache = cache
+        self.entree = entree
+        self.chemin = cache.chemin(entree["url"], entree["params"])
+        self.fichier_temporaire = fichier_temporaire_de(chemin_corps(self.chemin))
+        self.fh = None
+
+    def __enter__(self):
+        os.makedirs(self.cache.dossier, exist_ok=True)
+        self.fh = open(self.fichier_temporaire, mode="w", encoding="utf-8", newline="")
+        return self
+
+    def copier(self, morceaux):
+        """
+        :param morceaux: le texte de la réponse, morceau par morceau
+        :returns: un générateur des mêmes morceaux, écrits dans le fichier au passage
+        """
+        for morceau in morceaux:
+            self.fh.write(morceau)
+            yield morceau
+
+    def __exit__(self, type_erreur, erreur, trace):
+        self.fh.close()
+        if type_erreur is not None:
+            _supprimer(self.fichier_temporaire)
+            return
+        # le texte d'abord: des métadonnées n'existent jamais sans leur texte
+        os.replace(self.fichier_temporaire, chemin_corps(self.chemin))
+        self.cache._ecrire(self.chemin, self.entree)
+        # une réponse compte pour la taille de ses deux fichiers, supprimés ensemble
+        evincer_fichiers(
+            self.cache.dossier, self.cache.taille_max, lambda nom: nom.endswith(".pickle"),
+            taille=_taille_reponse, supprimer=_supprimer_reponse
+        )
+
+
+def chemin_corps(chemin):
+    """
+    :param chemin: le chemin du fichier des métadonnées d'une réponse
+    :returns: le chemin du fichier de son texte
+    """
+    return f"{os.path.splitext(chemin)[0]}.corps"
+
+
+def fichier_temporaire_de(chemin):
+    """
+    :returns: un fichier temporaire propre au processus et au thread, à renommer en `chemin`
+    """
+    return f"{chemin}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+
+def cle_parametres(params):
+    """
+    :param params: les paramètres d'une requête
+    :returns: les paramètres de `PARAMETRES_CLE`, normalisés: une liste triée de
+              couples `[nom, valeur]`, valeurs en minuscules et sans espaces autour
+    """
+    return sorted(
+        [ nom, str(valeur).strip().lower() ] for nom, valeur in params.items()
+        if nom in PARAMETRES_CLE
+    )
+
+
+def _morceaux_fichier(fh):
+    with fh:
+        yield from iter(lambda: fh.read(TAILLE_MORCEAU), "")
+
+
+def _taille_reponse(chemin):
+    """
+    :param chemin: le chemin du fichier des métadonnées d'une réponse
+    :returns: la taille de ses deux fichiers, en octets
+    """
+    try:
+        taille_corps = os.path.getsize(chemin_corps(chemin))
+    except FileNotFoundError:
+        taille_corps = 0
+    return os.path.getsize(chemin) + taille_corps
+
+
+def _supprimer_reponse(chemin):
+    _supprimer(chemin)
+    _supprimer(chemin_corps(chemin))
+
+
+def _supprimer(fichier):
+    try:
+        os.remove(fichier)
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,291 @@
+import argparse  # pour lire les arguments passés en ligne de commande
+import json
+import sys
+import os
+
+
+# *************************************************************
+# ce script est le point d'entrée en ligne de commande du
+# projet. il propose 8 sous-commandes:
+#
+#   python src/cli.py recolte              # récupérer les catalogues depuis l'API Katabase
+#   python src/cli.py structure idees      # structurer un catalogue
+#   python src/cli.py agregation --cles genre date_vente
+#   python src/cli.py termes --par genre   # termes les plus fréquents des descriptions
+#   python src/cli.py doublons roman       # reventes probables d'un même manuscrit
+#   python src/cli.py requete --vente-min 1870 --vente-max 1890 --prix-min 100
+#   python src/cli.py base                 # importer les catalogues dans une base SQLite
+#   python src/cli.py rendu                # créer les graphiques
+#
+# (on peut aussi écrire `harvest`, `parse`, `aggregate`, `terms`,
+# `duplicates`, `query`, `store` et `render`)
+#
+# chaque sous-commande n'importe que ce dont elle a besoin:
+# `requests` n'est chargé que pour `recolte`, plotly et kaleido
+# que pour `rendu`. structurer un catalogue ne demande donc pas
+# de charger ces librairies, qui sont longues à importer.
+#
+# crédits:
+# - code: Paul Kervegan, 2023. code sous licence `GNU GPLv3.0`
+# *************************************************************
+
+
+def genres_demandes(arguments):
+    """
+    :returns: les genres indiqués sur la ligne de commande ou, si aucun ne l'est, tous
+              les catalogues `catalogue_{genre}.txt` du dossier de la sous-commande
+              (`--dossier`, ou `in/`)
+    """
+    if arguments.genres:
+        return arguments.genres
+    from fouille_texte import genres_disponibles
+    return genres_disponibles(getattr(arguments, "dossier", None))
+
+
+def recolte(arguments):
+    """
+    récupérer les catalogues depuis l'API Katabase (voir `creation_corpus.py`)
+    """
+    from creation_corpus import pipeline
+    from recolte import URL_KATAPI
+    pipeline(
+        instrumenter=not arguments.sans_rapport,
+        profilage=arguments.profilage,
+        base=arguments.base,
+        url=arguments.url or URL_KATAPI,
+        concurrence=arguments.concurrence,
+        debit=arguments.debit,
+        cache=not arguments.sans_cache,
+        hors_ligne=arguments.hors_ligne,
+        duree_vie=arguments.duree_vie * 3600,
+        fenetres=arguments.fenetres
+    )
+
+
+def structure(arguments):
+    """
+    structurer les catalogues. avec `--jsonl`, chaque entrée est écrite sur la
+    sortie standard dès qu'elle est lue, une entrée JSON par ligne; sinon, on
+    affiche le nombre d'entrées de chaque genre. avec `--abreviations`, les
+    entrées JSON sont complétées par les champs de `abreviations.py`.
+    """
+    from fouille_texte import iter_structure, structure_cache, structure_corpus
+
+    for genre in genres_demandes(arguments):
+        if arguments.jsonl:
+            entrees = iter_structure(genre, dossier=arguments.dossier)
+            if arguments.abreviations:
+                from abreviations import Extracteur
+                entrees = Extracteur().enrichir(entrees)
+            for entree in entrees:
+                sys.stdout.write(json.dumps(entree, ensure_ascii=False) + "\n")
+            sys.stdout.flush()
+        elif arguments.dossier is None:
+            print(genre, len(structure_cache(genre)))
+        else:
+            print(genre, len(structure_corpus(genre, dossier=arguments.dossier)))
+
+
+def agregation(arguments):
+    """
+    afficher les statistiques de `agreger()` (voir `agregation.py`), un groupe
+    par ligne, en JSON.
+    """
+    from agregation import agreger
+    from corpus import Corpus
+    from fouille_texte import structure_cache
+
+    corpus = Corpus()
+    for genre in genres_demandes(arguments):
+        corpus.etendre(structure_cache(genre))
+    resultat = agreger(corpus, cles=tuple(arguments.cles), centiles=tuple(arguments.centiles))
+    for groupe in sorted(resultat, key=lambda groupe: [ str(valeur) for valeur in groupe ]):
+        print(json.dumps({"groupe": list(groupe), **resultat[groupe]}, ensure_ascii=False))
+
+
+def termes(arguments):
+    """
+    afficher les termes les plus fréquents des descriptions (voir `vectorisation.py`),
+    un groupe par ligne, en JSON.
+    """
+    from vectorisation import vectoriser_genres
+
+    termes_documents = vectoriser_genres(genres_demandes(arguments), n_min=arguments.n_min, n_max=arguments.n_max, bits=arguments.bits)
+    resultat = termes_documents.termes_frequents(arguments.nombre, par=arguments.par, n=arguments.n)
+    for groupe in sorted(resultat, key=str):
+        print(json.dumps({"groupe": groupe, "termes": resultat[groupe]}, ensure_ascii=False))
+
+
+def doublons(arguments):
+    """
+    afficher les reventes probables d'un même manuscrit (voir `doublons.py`),
+    un groupe par ligne, en JSON, avec l'année et le prix de chaque vente.
+    """
+    from doublons import Doublons
+    from fouille_texte import iter_structure
+
+    recherche = Doublons(seuil=arguments.seuil)
+    entrees = []  # on ne garde que ce qu'on affiche
+    for genre in genres_demandes(arguments):
+        for entree in iter_structure(genre, dossier=arguments.dossier):
+            recherche.ajouter(entree)
+            entrees.append((genre, entree["auteur"], entree["description"].strip()))
+    for groupe, ventes in zip(recherche.groupes(), recherche.trajectoires()):
+        genre, auteur, description = entrees[groupe[0]]
+        print(json.dumps({"genre": genre, "auteur": auteur, "description": description, "ventes": ventes}, ensure_ascii=False))
+
+
+def requete(arguments):
+    """
+    afficher les entrées qui vérifient des conditions (voir `requetes.py`), une
+    entrée par ligne, en JSON. avec `--expliquer`, on affiche seulement le plan
+    de la requête.
+    """
+    from corpus import Corpus
+    from requetes import Requetes
+    from fouille_texte import structure_cache
+
+    corpus = Corpus()
+    for genre in genres_demandes(arguments):
+        corpus.etendre(structure_cache(genre))
+    conditions = [
+        (champ, operateur, valeur) for champ, operateur, valeur in (
+            ("date_vente", ">=", arguments.vente_min),
+            ("date_vente", "<=", arguments.vente_max),
+            ("date_creation", ">=", arguments.creation_min),
+            ("date_creation", "<=", arguments.creation_max),
+            ("prix_constant", ">=", arguments.prix_min),
+            ("prix_constant", "<=", arguments.prix_max),
+            ("auteur", "==", arguments.auteur),
+        ) if valeur is not None
+    ]
+    requetes = Requetes(corpus)
+    if arguments.expliquer:
+        print(json.dumps(requetes.expliquer(*conditions), ensure_ascii=False))
+        return
+    for entree in requetes.entrees(*conditions):
+        print(json.dumps(entree.vers_dict(), ensure_ascii=False))
+
+
+def base(arguments):
+    """
+    importer les catalogues texte dans une base SQLite (voir `base_donnees.py`)
+    et afficher le nombre d'entrées importées pour chaque genre. un catalogue
+    qui n'a pas changé depuis le dernier import n'est pas relu.
+    """
+    from base_donnees import BaseCatalogues
+
+    with BaseCatalogues(arguments.chemin) as catalogues:
+        for genre in genres_demandes(arguments):
+            print(genre, catalogues.importer_catalogue(genre, dossier=arguments.dossier))
+
+
+def rendu(arguments):
+    """
+    structurer les 4 catalogues et créer les graphiques (voir `fouille_texte.pipeline()`)
+    """
+    from fouille_texte import pipeline
+    pipeline(
+        instrumenter=not arguments.sans_rapport,
+        profilage=arguments.profilage,
+        interactif=not arguments.sans_affichage,
+        formats=tuple(arguments.formats),
+        base=arguments.base,
+        incremental=arguments.incremental
+    )
+
+
+def analyseur():
+    """
+    :returns: l'analyseur des arguments de la ligne de commande
+    """
+    parser = argparse.ArgumentParser(description="fouille de texte sur les catalogues Katabase")
+    sous_commandes = parser.add_subparsers(dest="commande", required=True)
+
+    commande = sous_commandes.add_parser("recolte", aliases=["harvest"], help="récupérer les catalogues depuis l'API Katabase")
+    commande.add_argument("--url", help="l'URL de l'API (par exemple celle de `katapi_local.py`)")
+    commande.add_argument("--concurrence", type=int, default=4, help="le nombre maximal de requêtes simultanées")
+    commande.add_argument("--debit", type=float, default=5.0, help="le nombre maximal de requêtes par seconde")
+    commande.add_argument("--fenetres", type=int, default=3, help="le nombre de fenêtres dans lesquelles découper la période de vente (1: une requête par auteur.ice)")
+    commande.add_argument("--sans-cache", action="store_true", help="retélécharger toutes les réponses, sans utiliser `cache/http/`")
+    commande.add_argument("--hors-ligne", action="store_true", help="n'utiliser que les réponses de `cache/http/`, sans contacter l'API")
+    commande.add_argument("--duree-vie", type=float, default=168, help="l'âge, en heures, au-delà duquel une réponse du cache est revalidée auprès de l'API")
+    commande.set_defaults(fonction=recolte)
+
+    commande = sous_commandes.add_parser("structure", aliases=["parse"], help="structurer des catalogues")
+    commande.add_argument("genres", nargs="*", help="les genres à structurer (par défaut, tous les catalogues du dossier)")
+    commande.add_argument("--jsonl", action="store_true", help="écrire chaque entrée en JSON sur la sortie standard")
+    commande.add_argument("--abreviations", action="store_true", help="avec `--jsonl`, ajouter le type de document, le format, la fraction de page et l'état")
+    commande.add_argument("--dossier", help="le dossier des catalogues (par défaut, `in/`)")
+    commande.set_defaults(fonction=structure)
+
+    commande = sous_commandes.add_parser("agregation", aliases=["aggregate"], help="statistiques sur les prix, par groupe")
+    commande.add_argument("genres", nargs="*", help="les genres à réunir (par défaut, tous les catalogues)")
+    commande.add_argument("--cles", nargs="+", default=["date_vente"], help="les clés de regroupement")
+    commande.add_argument("--centiles", nargs="*", type=float, default=[], help="les centiles à calculer")
+    commande.set_defaults(fonction=agregation)
+
+    commande = sous_commandes.add_parser("termes", aliases=["terms"], help="termes les plus fréquents des descriptions")
+    commande.add_argument("genres", nargs="*", help="les genres à réunir (par défaut, tous les catalogues)")
+    commande.add_argument("--par", choices=["genre", "decennie"], help="regrouper les entrées par genre ou par décennie de vente")
+    commande.add_argument("--nombre", type=int, default=20, help="le nombre de termes par groupe")
+    commande.add_argument("--n-min", type=int, default=1, help="le nombre minimal de mots d'un terme")
+    commande.add_argument("--n-max", type=int, default=2, help="le nombre maximal de mots d'un terme")
+    commande.add_argument("--n", type=int, help="n'afficher que les termes de N mots")
+    commande.add_argument("--bits", type=int, help="utiliser le hachage, avec 2 ** BITS colonnes")
+    commande.set_defaults(fonction=termes)
+
+    commande = sous_commandes.add_parser("doublons", aliases=["duplicates"], help="reventes probables d'un même manuscrit")
+    commande.add_argument("genres", nargs="*", help="les genres à réunir (par défaut, tous les catalogues)")
+    commande.add_argument("--seuil", type=float, default=0.7, help="la ressemblance minimale entre deux reventes, entre 0 et 1")
+    commande.add_argument("--dossier", help="le dossier des catalogues (par défaut, `in/`)")
+    commande.set_defaults(fonction=doublons)
+
+    commande = sous_commandes.add_parser("requete", aliases=["query"], help="entrées qui vérifient des conditions")
+    commande.add_argument("genres", nargs="*", help="les genres à réunir (par défaut, tous les catalogues)")
+    commande.add_argument("--vente-min", type=int, help="l'année de vente minimale")
+    commande.add_argument("--vente-max", type=int, help="l'année de vente maximale")
+    commande.add_argument("--creation-min", type=int, help="l'année de création minimale")
+    commande.add_argument("--creation-max", type=int, help="l'année de création maximale")
+    commande.add_argument("--prix-min", type=float, help="le prix minimal, en francs constants 1900")
+    commande.add_argument("--prix-max", type=float, help="le prix maximal, en francs constants 1900")
+    commande.add_argument("--auteur", help="l'auteur.ice (sans tenir compte des majuscules et des accents)")
+    commande.add_argument("--expliquer", action="store_true", help="afficher le plan de la requête au lieu des entrées")
+    commande.set_defaults(fonction=requete)
+
+    commande = sous_commandes.add_parser("base", aliases=["store"], help="importer les catalogues dans une base SQLite")
+    commande.add_argument("genres", nargs="*", help="les genres à importer (par défaut, tous les catalogues du dossier)")
+    commande.add_argument("--dossier", help="le dossier des catalogues (par défaut, `in/`)")
+    commande.set_defaults(fonction=base)
+
+    commande = sous_commandes.add_parser("rendu", aliases=["render"], help="créer les graphiques")
+    commande.add_argument("--sans-affichage", action="store_true", help="enregistrer les graphiques sans les afficher")
+    commande.add_argument("--formats", nargs="+", default=["png"], help="formats des fichiers: png, svg, pdf, html, json...")
+    commande.add_argument("--incremental", action="store_true", help="ne lire que les entrées ajoutées à la fin des catalogues depuis la dernière exécution")
+    commande.set_defaults(fonction=rendu)
+
+    # options communes aux commandes qui lancent une fonction `pipeline()`
+    for nom in ("recolte", "rendu"):
+        commande = sous_commandes.choices[nom]
+        commande.add_argument("--profilage", action="store_true", help="activer `cProfile`")
+        commande.add_argument("--sans-rapport", action="store_true", help="ne pas enregistrer de rapport d'instrumentation")
+
+    # la base SQLite: `base` l'utilise toujours, `recolte` et `rendu` seulement
+    # avec `--base`. `--base` sans chemin utilise la base par défaut.
+    sous_commandes.choices["base"].add_argument("--chemin", help="le chemin de la base (par défaut, `in/catalogues.sqlite`)")
+    sous_commandes.choices["recolte"].add_argument("--base", nargs="?", const="", help="ajouter aussi les entrées récoltées à une base SQLite")
+    sous_commandes.choices["rendu"].add_argument("--base", nargs="?", const="", help="créer les graphiques à partir d'une base SQLite")
+
+    return parser
+
+
+if __name__ == "__main__":
+    arguments = analyseur().parse_args()
+    try:
+        arguments.fonction(arguments)
+    except BrokenPipeError:
+        # la sortie a été fermée avant la fin (par exemple avec `| head`): on
+        # redirige la sortie vers `os.devnull` pour que python ne signale pas
+        # une deuxième erreur en la vidant à la fermeture.
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        sys.exit(1)
@@ -0,0 +1,253 @@
+from array import array  # tableaux de nombres typés, beaucoup plus compacts que des listes
+import math  # pour détecter les valeurs manquantes (`math.isnan()`)
+
+
+# *************************************************************
+# dans ce script, on définit `Corpus`, une manière compacte de
+# stocker en mémoire un corpus structuré par `structure()`.
+#
+# `structure()` renvoie une liste de dictionnaires: chaque entrée
+# est un objet python complet, avec ses clés, ses chaînes de
+# caractères et ses nombres. c'est pratique, mais très coûteux
+# en mémoire pour de gros corpus.
+#
+# ici, on stocke le corpus *en colonnes*: au lieu d'une liste
+# d'entrées, on a une colonne par information (une colonne pour
+# les dates de vente, une pour les prix...). chaque colonne est
+# un `array`, un tableau de nombres d'un seul type:
+# - les années sont des entiers sur 16 bits (`"h"`)
+# - les prix sont des nombres à virgule sur 64 bits (`"d"`).
+#   un prix manquant vaut `NaN` ("not a number").
+# - les auteur.ice.s, monnaies et genres sont *encodés*: on garde
+#   une seule fois chaque valeur différente dans une liste, et la
+#   colonne contient seulement la position de la valeur dans cette
+#   liste.
+# - les descriptions sont mises bout à bout dans un seul bloc
+#   d'octets; une colonne indique où commence chaque description.
+#
+# crédits:
+# - code: Paul Kervegan, 2023. code sous licence `GNU GPLv3.0`
+# *************************************************************
+
+
+# valeur utilisée dans les colonnes d'années pour une date manquante
+ANNEE_MANQUANTE = -1
+
+# les champs d'une entrée, dans l'ordre des dictionnaires de `structure()`
+CHAMPS = ("auteur", "date_creation", "date_vente", "prix", "prix_constant", "monnaie", "description")
+
+
+class Entree:
+    """
+    une entrée de corpus légère, renvoyée quand on parcourt un `Corpus`.
+
+    `__slots__` indique à python la liste exacte des attributs de l'objet,
+    ce qui évite de créer un dictionnaire pour chaque entrée. pour rester
+    compatible avec le code qui manipule les dictionnaires de `structure()`,
+    on peut lire un champ avec `entree["date_vente"]`: les valeurs manquantes
+    valent alors `""`, comme dans `structure()`.
+    """
+    __slots__ = CHAMPS + ("genre",)
+
+    def __init__(self, auteur, date_creation, date_vente, prix, prix_constant, monnaie, description, genre=""):
+        self.auteur = auteur
+        self.date_creation = date_creation
+        self.date_vente = date_vente
+        self.prix = prix
+        self.prix_constant = prix_constant
+        self.monnaie = monnaie
+        self.description = description
+        self.genre = genre
+
+    def __getitem__(self, cle):
+        return getattr(self, cle)
+
+    def __eq__(self, autre):
+        if isinstance(autre, Entree):
+            autre = autre.vers_dict()
+        return self.vers_dict() == autre
+
+    def __repr__(self):
+        return f"Entree({self.vers_dict()})"
+
+    def vers_dict(self):
+        """
+        :returns: l'entrée sous la forme d'un dictionnaire identique à ceux de `structure()`
+        """
+        return { champ: getattr(self, champ) for champ in CHAMPS }
+
+
+class Corpus:
+    """
+    un corpus structuré, stocké en colonnes typées.
+
+    on crée un `Corpus` à partir des dictionnaires produits par `structure()`
+    ou `iter_structure()`:
+
+    >>> corpus = Corpus.depuis_entrees(structure(read_text("roman")), genre="roman")
+    >>> corpus.date_vente       # une colonne: array('h', [1879, 1879, ...])
+    >>> corpus[0]["auteur"]     # une entrée: 'Restif de la Bretonne'
+    >>> for entree in corpus:   # on peut aussi parcourir les entrées une par une
+    ...     print(entree.prix_constant)
+    """
+
+    def __init__(self):
+        # colonnes numériques
+        self.date_creation = array("h")
+        self.date_vente = array("h")
+        self.prix = array("d")
+        self.prix_constant = array("d")
+
+        # colonnes encodées: la colonne contient un code, qui est la position
+        # de la valeur dans la liste `valeurs_...`. le dictionnaire `_codes_...`
+        # associe chaque valeur à son code, pour encoder rapidement.
+        self.auteur = array("I")
+        self.valeurs_auteur = []
+        self._codes_auteur = {}
+        self.monnaie = array("H")
+        self.valeurs_monnaie = []
+        self._codes_monnaie = {}
+        self.genre = array("H")
+        self.valeurs_genre = []
+        self._codes_genre = {}
+
+        # descriptions: un seul bloc d'octets (encodé en UTF-8) et, pour chaque
+        # entrée `i`, la description est `_descriptions[_debuts[i]:_debuts[i+1]]`.
+        self._descriptions = bytearray()
+        self._debuts = array("Q", [0])
+
+    @classmethod
+    def depuis_entrees(cls, entrees, genre=""):
+        """
+        créer un corpus à partir d'entrées structurées.
+
+        :param entrees: une liste ou un générateur de dictionnaires, comme ceux
+                        renvoyés par `structure()` ou `iter_structure()`
+        :param genre: le genre littéraire de toutes ces entrées
+        :returns: un nouveau `Corpus`
+        """
+        corpus = cls()
+        for entree in entrees:
+            corpus.ajouter(entree, genre)
+        return corpus
+
+    def ajouter(self, entree, genre=""):
+        """
+        ajouter une entrée à la fin du corpus.
+
+        :param entree: un dictionnaire au format de `structure()`
+        :param genre: le genre littéraire de l'entrée
+        """
+        self.date_creation.append(_annee(entree["date_creation"]))
+        self.date_vente.append(_annee(entree["date_vente"]))
+        self.prix.append(_prix(entree["prix"]))
+        self.prix_constant.append(_prix(entree["prix_constant"]))
+        self.auteur.append(_encoder(entree["auteur"], self.valeurs_auteur, self._codes_auteur))
+        self.monnaie.append(_encoder(entree["monnaie"], self.valeurs_monnaie, self._codes_monnaie))
+        self.genre.append(_encoder(genre, self.valeurs_genre, self._codes_genre))
+        self._descriptions += entree["description"].encode("utf-8")
+        self._debuts.append(len(self._descriptions))
+
+    def etendre(self, autre):
+        """
+        ajouter toutes les entrées d'un autre corpus à la fin de celui-ci.
+        ça permet par exemple de réunir les corpus de plusieurs genres.
+
+        :param autre: un autre `Corpus`
+        """
+        self.date_creation.extend(autre.date_creation)
+        self.date_vente.extend(autre.date_vente)
+        self.prix.extend(autre.prix)
+        self.prix_constant.extend(autre.prix_constant)
+        # les codes d'un corpus n'ont pas de sens dans l'autre: on les traduit
+        for colonne, valeurs, codes, colonne_autre, valeurs_autre in (
+            (self.auteur, self.valeurs_auteur, self._codes_auteur, autre.auteur, autre.valeurs_auteur),
+            (self.monnaie, self.valeurs_monnaie, self._codes_monnaie, autre.monnaie, autre.valeurs_monnaie),
+            (self.genre, self.valeurs_genre, self._codes_genre, autre.genre, autre.valeurs_genre),
+        ):
+            traduction = [ _encoder(valeur, valeurs, codes) for valeur in valeurs_autre ]
+            colonne.extend(traduction[code] for code in colonne_autre)
+        decalage = len(self._descriptions)
+        self._descriptions += autre._descriptions
+        self._debuts.extend(debut + decalage for debut in autre._debuts[1:])
+
+    def __len__(self):
+        return len(self.date_vente)
+
+    def description(self, i):
+        """
+        :param i: la position de l'entrée dans le corpus
+        :returns: la description de l'entrée, décodée en chaîne de caractères
+        """
+        return self._descriptions[self._debuts[i]:self._debuts[i+1]].decode("utf-8")
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("index de corpus hors limites")
+        date_creation = self.date_creation[i]
+        date_vente = self.date_vente[i]
+        prix = self.prix[i]
+        prix_constant = self.prix_constant[i]
+        return Entree(
+            self.valeurs_auteur[self.auteur[i]],
+            "" if date_creation == ANNEE_MANQUANTE else date_creation,
+            "" if date_vente == ANNEE_MANQUANTE else date_vente,
+            "" if math.isnan(prix) else prix,
+            "" if math.isnan(prix_constant) else prix_constant,
+            self.valeurs_monnaie[self.monnaie[i]],
+            self.description(i),
+            self.valeurs_genre[self.genre[i]]
+        )
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def vers_dicts(self):
+        """
+        :returns: le corpus sous la forme d'une liste de dictionnaires,
+                  identique à la sortie de `structure()`
+        """
+        return [ entree.vers_dict() for entree in self ]
+
+    def taille_memoire(self):
+        """
+        :returns: la mémoire occupée par les colonnes du corpus, en octets
+        """
+        colonnes = (
+            self.date_creation, self.date_vente, self.prix, self.prix_constant,
+            self.auteur, self.monnaie, self.genre, self._debuts
+        )
+        taille = sum(colonne.itemsize * len(colonne) for colonne in colonnes)
+        taille += len(self._descriptions)
+        taille += sum(len(valeur.encode("utf-8")) for valeur in self.valeurs_auteur + self.valeurs_monnaie + self.valeurs_genre)
+        return taille
+
+
+def _annee(valeur):
+    """
+    traduire une année de `structure()` (un entier ou `""`) pour une colonne `"h"`
+    """
+    return ANNEE_MANQUANTE if valeur == "" else valeur
+
+
+def _prix(valeur):
+    """
+    traduire un prix de `structure()` (un nombre ou `""`) pour une colonne `"d"`
+    """
+    return math.nan if valeur == "" else valeur
+
+
+def _encoder(valeur, valeurs, codes):
+    """
+    renvoyer le code d'une valeur dans une colonne encodée, en ajoutant
+    la valeur à `valeurs` et à `codes` si on la rencontre pour la première fois.
+    """
+    code = codes.get(valeur)
+    if code is None:
+        code = len(valeurs)
+        valeurs.append(valeur)
+        codes[valeur] = code
+    return code
@@ -1,8 +1,13 @@
-import requests  # le paquet pour faire des requêtes HTTP et récupérer des données de sources distantes
+import threading
+import time
 import sys  # librarie pour des opérations sur le système d'exploitation
 import os  # le paquet pour construire des chemins de fichiers
 import re  # librairie pour les expressions régulières
 
+from instrumentation import Rapport, etape  # mesures de chaque étape du traitement
+from recolte import Recolteur, URL_KATAPI, CONCURRENCE, DEBIT, FENETRES  # récolte en parallèle
+from cache_http import CacheHTTP, DUREE_VIE  # cache des réponses de l'API
+
 
 # *************************************************************
 # script pour produire le texte utilisé lors de ce cours.
@@ -28,6 +33,10 @@ import re  # librairie pour les expressions régulières
 # *************************************************************
 
 
+# le nombre d'entrées ajoutées à la base SQLite en une fois, pendant la récolte
+TAILLE_LOT = 5000
+
+
 def katapi_request(dataset, author_name):
     """
     fonction permettant de lancer une requête, traiter
@@ -39,6 +48,11 @@ def katapi_request(dataset, author_name):
     :returns: le jeu de données avec les résultats renvoyés par
               l'API pour le nom `author_name`
     """
+    # le paquet pour faire des requêtes HTTP et récupérer des données de sources distantes.
+    # il est importé ici, et pas en haut du fichier, pour que les scripts qui utilisent
+    # seulement `value_to_text()` n'aient pas à le charger.
+    import requests
+    
     # étape 1: définir les paramètres
     root_url = " https://katabase.huma-num.fr/katapi?"  # l'URL pointant vers l'API
     params = {
@@ -101,7 +115,7 @@ def katapi_request(dataset, author_name):
     return dataset
 
 
-def get_katabase_dataset():
+def get_katabase_dataset(url=URL_KATAPI, concurrence=CONCURRENCE, debit=DEBIT, cache=None, fenetres=FENETRES, traiter=None, ecrire=None):
     """
     fonction permettant de créer le jeu de données avec lequel
     on travaillera. ce jeu de données est créé à partir de l'API 
@@ -112,6 +126,19 @@ def get_katabase_dataset():
     en ligne. içi, on construit une URL en suivant la syntaxe 
     définie par l'API Katabase; l'API traite cette URL, récupère
     les données pertinentes et renvoie ces données réponse.
+    
+    :param url: l'URL de l'API (par exemple celle de `katapi_local.py`, pour tester)
+    :param concurrence: le nombre maximal de requêtes simultanées
+    :param debit: le nombre maximal de requêtes par seconde
+    :param cache: un `cache_http.CacheHTTP` qui garde les réponses sur le disque, ou `None`
+    :param fenetres: le nombre de fenêtres dans lesquelles découper la période 1850-1910
+    :param traiter: une fonction appliquée à chaque entrée dès qu'elle est reçue
+                    (par exemple `clean_entry()`), ou `None`
+    :param ecrire: une fonction `ecrire(genre, identifiant, entrée)` appelée avec chaque
+                   entrée traitée (par exemple un `EcritureCatalogues`), ou `None`. les
+                   entrées ne sont alors pas gardées en mémoire.
+    :returns: les 4 jeux de données, triés par identifiant de manuscrit, ou `None`
+              si les entrées ont été transmises à `ecrire`
     """
     # variables contenant nos 4 corpus
     data_idees = {}
@@ -151,21 +178,37 @@ def get_katabase_dataset():
         , "parny"               # évariste de parny
     ]
     
-    # on itère sur tous les auteurs pour faire une requête.
-    # - à chaque itération, on donne à la variable `author` le nom
-    #   d'un auteur dans les listes `author_*` définies ci-dessus.
-    # -  pour chaque `auteur`, on fait une requête sur ce nom pour récupérer 
-    #   tous les manuscrits dont il ou elle est l'auteur.ice. 
-    # - on construit ensuite nos jsons de sortie (`data_idees`...) avec
-    #   les résultats obtenus via l'API.
-    for auteur in auteurs_idees:
-        data_idees = katapi_request(data_idees, auteur)
-    for auteur in auteurs_theatre:
-        data_theatre = katapi_request(data_theatre, auteur)
-    for auteur in auteurs_roman:
-        data_roman = katapi_request(data_roman, auteur)
-    for auteur in auteurs_poeme:
-        data_poeme = katapi_request(data_poeme, auteur)
+    # on fait une requête par auteur pour récupérer tous les manuscrits dont
+    # il ou elle est l'auteur.ice, et on construit nos jsons de sortie
+    # (`data_idees`...) avec les résultats obtenus via l'API.
+    #
+    # `katapi_request()`, plus haut, fait une requête à la fois: il faudrait
+    # écrire `for auteur in auteurs_idees: data_idees = katapi_request(data_idees, auteur)`.
+    # ici, `Recolteur` (voir `recolte.py`) lance plusieurs requêtes en même temps,
+    # réessaie les requêtes refusées par un serveur surchargé, et trie les
+    # résultats par identifiant pour que deux récoltes donnent le même résultat.
+    # avec un `cache`, les réponses déjà téléchargées sont relues sur le disque.
+    # la période est découpée en `fenetres`, et chaque entrée reçue passe
+    # aussitôt par `traiter`: le texte d'une réponse n'est jamais gardé en entier.
+    # les entrées traitées, elles, sont réunies dans les 4 jeux de données... sauf
+    # avec `ecrire`: chaque entrée lui est transmise, dans l'ordre des auteur.ice.s,
+    # et on ne garde que les identifiants déjà vus.
+    auteurs = {
+        "idees": auteurs_idees,
+        "theatre": auteurs_theatre,
+        "roman": auteurs_roman,
+        "poeme": auteurs_poeme
+    }
+    with Recolteur(url=url, concurrence=concurrence, debit=debit, cache=cache, fenetres=fenetres, traiter=traiter) as recolteur:
+        if ecrire is not None:
+            for genre, identifiant, entree in recolteur.iter_recolter(auteurs):
+                ecrire(genre, identifiant, entree)
+            return None
+        datasets = recolteur.recolter(auteurs)
+    data_idees.update(datasets["idees"])
+    data_theatre.update(datasets["theatre"])
+    data_roman.update(datasets["roman"])
+    data_poeme.update(datasets["poeme"])
     
     return data_idees, data_theatre, data_roman, data_poeme
     
@@ -184,29 +227,40 @@ def clean_dataset(dataset):
     """
     dataset_out = {}  # jeu de données de sortie
     for key, value in dataset.items():
-        
-        # on supprime les éléments inutiles
-        value.pop("author_wikidata_id", None)  # l'identifiant wikidata
-        value.pop("format", None)  # le format de l'autographe
-        value.pop("term", None)  # un terme normalisé décrivant le type de manuscrit (lettre autographe...)
-        
-        # on supprime à l'aide d'expressions régulières 
-        # les espaces en trop dans la description.
-        # (les expressions régulières sont expressions permettant de 
-        # détecter des motifs dans un texte à l'aide d'une grammaire normalisée)
-        # la fonction `re.sub()` permet d'effectuer les remplacements à l'aide
-        # d'expressions régulières.
-        # la syntaxe est: `re.sub("motif à remplacer", "remplacement", texte_a_traiter)`
-        #
-        # `\n*\s+` représente zéro à plusieurs sauts de ligne suivis par un
-        # ou plusieurs espaces. on replace par un unique espace, supprimant ainsi
-        # les espaces et sauts de lignes dans la description..
-        value["desc"] = re.sub("\n*\s+", " ", value["desc"])
-        
-        # pour finir, on ajoute à `dataset_out` avec les descriptions d'items nettoyées
-        dataset_out[key] = value
+        # on ajoute à `dataset_out` l'entrée nettoyée par `clean_entry()`, juste en dessous
+        dataset_out[key] = clean_entry(value)
 
     return dataset_out
+
+
+def clean_entry(value):
+    """
+    nettoyer une seule entrée (voir `clean_dataset()`). la récolte
+    (`get_katabase_dataset()`) peut ainsi nettoyer chaque entrée
+    dès qu'elle la reçoit.
+    
+    :param value: une entrée renvoyée par l'API Katabase
+    :returns: l'entrée nettoyée
+    """
+    # on supprime les éléments inutiles
+    value.pop("author_wikidata_id", None)  # l'identifiant wikidata
+    value.pop("format", None)  # le format de l'autographe
+    value.pop("term", None)  # un terme normalisé décrivant le type de manuscrit (lettre autographe...)
+    
+    # on supprime à l'aide d'expressions régulières 
+    # les espaces en trop dans la description.
+    # (les expressions régulières sont expressions permettant de 
+    # détecter des motifs dans un texte à l'aide d'une grammaire normalisée)
+    # la fonction `re.sub()` permet d'effectuer les remplacements à l'aide
+    # d'expressions régulières.
+    # la syntaxe est: `re.sub("motif à remplacer", "remplacement", texte_a_traiter)`
+    #
+    # `\n*\s+` représente zéro à plusieurs sauts de ligne suivis par un
+    # ou plusieurs espaces. on replace par un unique espace, supprimant ainsi
+    # les espaces et sauts de lignes dans la description..
+    value["desc"] = re.sub("\n*\s+", " ", value["desc"])
+    
+    return value
     
 
 def make_text(dataset, genre):
@@ -218,43 +272,7 @@ def make_text(dataset, genre):
     :param genre: le genre dans lequel les auteurs sont actifs, pour savoir quel 
                   jeu de données on traite et quel sera le nom du fichier produit.
     """
-    text_out = ""  # le texte brut qui sera produit
-    
-    # on utilise `.values()` pour itérer seulement sur les valeurs: 
-    # - `.values()` produit une liste des valeurs d'un dictionnaire,
-    #   c'est-à-dire des éléments à droite dans des entrées de
-    #   dictionnaire
-    # - l'identifiant des entrées de catalogues ne sera pas retenu 
-    #   dans le texte qu'on est en train de construire, donc pas la
-    #   peine d'itérer sur celui-ci.
-    for value in dataset.values():
-        value_to_string = ""  # la version texte de l'entrée de catalogue
-        
-        # on ajoute le nom de l'auteur
-        value_to_string = f"{value['author']}\n"
-        
-        # si il existe une date d'écriture du manuscrit, on l'ajoute
-        if value["date"] is not None:
-            value_to_string += f"Écrit en {value['date']}. "
-        
-        # on ajoute ensuite la date de vente, le nombre de pages et une description
-        value_to_string += f"Vendu en {value['sell_date']}.\n"\
-                           + f"Dimensions: {value['number_of_pages']} pages.\n"\
-                           + f"{value['desc']}\n"
-        
-        # si il y a un prix, on ajoute le prix, la monnaie et le prix en francs constants.
-        if value["price"] is not None:
-            value_to_string += f"Prix: {value['price']} {value['currency']} "\
-                               + f"(en francs constants 1900: {value['price_c']}).\n"
-        
-        # enfin, pour signifier la fin d'une entrée, on ajoute 2 sauts de lignes
-        # (soit une ligne vide)
-        value_to_string += "\n\n"
-        
-        # on ajoute cette entrée à `text_out`, pour créer notre document de sortie.
-        text_out += value_to_string
-    
-    # enfin, on enregistre le fichier.
+    # on prépare le fichier de sortie.
     # pour construire les chemins de fichiers, on utilise `os`, une librairie qui
     # est très utile: les chemins de fichiers s'écrivent différemment selon le système
     # d'exploitation (Linux, Mac, Windows). `os` gère les différences de syntaxes selon
@@ -286,29 +304,207 @@ def make_text(dataset, genre):
         # c'est à dire qu'on va y écrire du contenu
         mode="w+" 
     ) as fh:
-        fh.write(text_out)  # on y écrit le contenu de `text_out`
+        # on utilise `.values()` pour itérer seulement sur les valeurs: 
+        # - `.values()` produit une liste des valeurs d'un dictionnaire,
+        #   c'est-à-dire des éléments à droite dans des entrées de
+        #   dictionnaire
+        # - l'identifiant des entrées de catalogues ne sera pas retenu 
+        #   dans le texte qu'on est en train de construire, donc pas la
+        #   peine d'itérer sur celui-ci.
+        for value in dataset.values():
+            # on transforme l'entrée en texte avec `value_to_text()`, définie plus bas
+            value_to_string = value_to_text(value)
+            
+            # on écrit aussitôt cette entrée dans le fichier: le texte complet
+            # n'est jamais construit en mémoire.
+            fh.write(value_to_string)
+    
+
+def value_to_text(value):
+    """
+    transformer une entrée du jeu de données en texte brut. c'est ce format
+    que `structure()` (dans `fouille_texte.py`) sait lire.
+    
+    :param value: une entrée de catalogue, sous la forme d'un dictionnaire
+                  renvoyé par l'API Katabase et nettoyé par `clean_dataset()`.
+    :returns: l'entrée en texte brut, suivie du séparateur entre deux entrées.
+    """
+    # on ajoute le nom de l'auteur
+    value_to_string = f"{value['author']}\n"
+    
+    # si il existe une date d'écriture du manuscrit, on l'ajoute
+    if value["date"] is not None:
+        value_to_string += f"Écrit en {value['date']}. "
+    
+    # on ajoute ensuite la date de vente, le nombre de pages et une description
+    value_to_string += f"Vendu en {value['sell_date']}.\n"\
+                       + f"Dimensions: {value['number_of_pages']} pages.\n"\
+                       + f"{value['desc']}\n"
+    
+    # si il y a un prix, on ajoute le prix, la monnaie et le prix en francs constants.
+    if value["price"] is not None:
+        value_to_string += f"Prix: {value['price']} {value['currency']} "\
+                           + f"(en francs constants 1900: {value['price_c']}).\n"
+    
+    # enfin, pour signifier la fin d'une entrée, on ajoute 2 sauts de lignes
+    # (soit une ligne vide)
+    value_to_string += "\n\n"
     
+    return value_to_string
 
-def pipeline():
+
+class EcritureCatalogues:
+    """
+    écrire chaque entrée récoltée dans son catalogue `in/catalogue_{genre}.txt`
+    dès qu'elle arrive, au lieu de réunir toutes les entrées puis d'appeler
+    `make_text()`. avec une `base` (voir `base_donnees.py`), les entrées y sont
+    aussi ajoutées, par lots de `taille_lot`.
+
+    les catalogues sont d'abord écrits dans des fichiers temporaires, qui ne
+    remplacent les anciens catalogues qu'à la fin d'une récolte réussie: une
+    récolte interrompue laisse les anciens catalogues intacts.
+
+    >>> with EcritureCatalogues(("idees", "roman")) as ecriture:
+    ...     ecriture("roman", "CAT_000002_e9_d1", entree)
+    """
+
+    def __init__(self, genres, base=None, taille_lot=TAILLE_LOT):
+        """
+        :param genres: les genres des catalogues à écrire
+        :param base: une `base_donnees.BaseCatalogues` ouverte, ou `None`
+        :param taille_lot: le nombre d'entrées ajoutées à la base en une fois
+        """
+        current_directory = os.path.abspath(os.path.dirname(__file__))
+        self.outdir = os.path.join(current_directory, os.pardir, "in")
+        self.genres = genres
+        self.base = base
+        self.taille_lot = taille_lot
+        self.fichiers = {}
+        self.lots = { genre: {} for genre in genres }
+        self.entrees = 0  # nombre d'entrées écrites
+        self.entrees_base = 0  # nombre d'entrées ajoutées à la base (les entrées déjà présentes sont ignorées)
+        # temps passé à écrire les catalogues. les entrées sont écrites pendant que les
+        # threads de la récolte décodent les réponses suivantes: ce temps comprend donc
+        # aussi l'attente du "GIL", le verrou qui ne laisse qu'un thread exécuter python à la fois.
+        self.secondes = 0.0
+        self.secondes_base = 0.0  # temps passé à remplir la base
+
+    def chemin(self, genre):
+        return os.path.join(self.outdir, f"catalogue_{genre}.txt")
+
+    def __enter__(self):
+        if not os.path.isdir(self.outdir):
+            os.makedirs(self.outdir)
+        for genre in self.genres:
+            self.fichiers[genre] = open(f"{self.chemin(genre)}.{os.getpid()}.tmp", mode="w+")
+        return self
+
+    def __call__(self, genre, identifiant, entree):
+        debut = time.perf_counter()
+        self.fichiers[genre].write(value_to_text(entree))
+        self.entrees += 1
+        self.secondes += time.perf_counter() - debut
+        if self.base is not None:
+            self.lots[genre][identifiant] = entree
+            if len(self.lots[genre]) >= self.taille_lot:
+                self._vider_lot(genre)
+
+    def _vider_lot(self, genre):
+        debut = time.perf_counter()
+        self.entrees_base += self.base.charger_jeu_de_donnees(genre, self.lots[genre])
+        self.lots[genre] = {}
+        self.secondes_base += time.perf_counter() - debut
+
+    def __exit__(self, type_erreur, erreur, trace):
+        for fh in self.fichiers.values():
+            fh.close()
+        for genre, fh in self.fichiers.items():
+            if type_erreur is None:
+                os.replace(fh.name, self.chemin(genre))
+            else:
+                os.remove(fh.name)
+        if type_erreur is None and self.base is not None:
+            for genre in self.genres:
+                if self.lots[genre]:
+                    self._vider_lot(genre)
+
+
+class _NettoyageMesure:
+    """
+    `clean_entry()`, en additionnant le temps passé à nettoyer les entrées.
+    les entrées sont nettoyées dans les threads de la récolte: le total peut
+    donc dépasser la durée de l'étape.
+    """
+
+    def __init__(self):
+        self.secondes = 0.0
+        self.verrou = threading.Lock()
+
+    def __call__(self, value):
+        debut = time.perf_counter()
+        entree = clean_entry(value)
+        duree = time.perf_counter() - debut
+        with self.verrou:
+            self.secondes += duree
+        return entree
+
+
+def pipeline(instrumenter=True, profilage=False, base=None, url=URL_KATAPI, concurrence=CONCURRENCE, debit=DEBIT,
+             cache=True, hors_ligne=False, duree_vie=DUREE_VIE, fenetres=FENETRES):
     """
     fonction décrivant le processus global
+    
+    :param instrumenter: si `True`, mesurer chaque étape et enregistrer un
+                         rapport JSON dans `out/instrumentation/` (voir
+                         `instrumentation.py`)
+    :param profilage: si `True`, activer aussi `cProfile` pendant les étapes
+    :param base: le chemin d'une base SQLite (voir `base_donnees.py`), ou `""` pour
+                 la base par défaut. si elle est donnée, les entrées récoltées y sont aussi ajoutées.
+    :param url: l'URL de l'API (voir `get_katabase_dataset()`)
+    :param concurrence: le nombre maximal de requêtes simultanées
+    :param debit: le nombre maximal de requêtes par seconde
+    :param cache: si `True`, garder les réponses de l'API dans `cache/http/` (voir `cache_http.py`)
+    :param hors_ligne: si `True`, n'utiliser que les réponses du cache, sans contacter l'API
+    :param duree_vie: la durée pendant laquelle une réponse du cache est utilisée sans
+                      demander à l'API si elle a changé, en secondes
+    :param fenetres: le nombre de fenêtres dans lesquelles découper la période de vente
     """
-    # faire les requêtes sur l'api
-    data_idees, data_theatre, data_roman, data_poeme = get_katabase_dataset()
+    rapport = Rapport("creation_corpus", profilage=profilage) if instrumenter else None
     
-    # nettoyer les jeux de données
-    data_idees = clean_dataset(data_idees)
-    data_theatre = clean_dataset(data_theatre)
-    data_roman = clean_dataset(data_roman)
-    data_poeme = clean_dataset(data_poeme)
+    # faire les requêtes sur l'api, nettoyer les entrées et les écrire: chaque
+    # entrée est nettoyée par `clean_entry()` dès qu'elle est reçue, puis écrite
+    # aussitôt dans son catalogue (et ajoutée à la base) par `EcritureCatalogues`,
+    # au lieu de réunir les 4 jeux de données en mémoire, de les nettoyer avec
+    # `clean_dataset()` puis de les écrire avec `make_text()`. le nettoyage et
+    # l'écriture ne sont donc plus des étapes à part: leurs temps sont mesurés
+    # à l'intérieur de l'étape "requetes" (`nettoyage_secondes`, `ecriture_secondes`...).
+    with etape(rapport, "requetes") as mesure:
+        cache_http = CacheHTTP(duree_vie=duree_vie, hors_ligne=hors_ligne) if cache or hors_ligne else None
+        nettoyage = _NettoyageMesure()
+        catalogues = None
+        if base is not None:
+            from base_donnees import BaseCatalogues
+            catalogues = BaseCatalogues(base)
+        try:
+            with EcritureCatalogues(("idees", "theatre", "roman", "poeme"), base=catalogues) as ecriture:
+                get_katabase_dataset(url, concurrence, debit, cache_http, fenetres, traiter=nettoyage, ecrire=ecriture)
+        finally:
+            if catalogues is not None:
+                catalogues.fermer()
+        mesure["entrees"] = ecriture.entrees
+        mesure["nettoyage_secondes"] = nettoyage.secondes
+        mesure["ecriture_secondes"] = ecriture.secondes
+        mesure["octets"] = sum(os.path.getsize(ecriture.chemin(genre)) for genre in ecriture.genres)
+        if catalogues is not None:
+            mesure["base_entrees"] = ecriture.entrees_base
+            mesure["base_secondes"] = ecriture.secondes_base
+        if cache_http is not None:
+            mesure.update(cache_http.statistiques)
     
-    # transformer les jeux de données `json` en 
-    # fichiers texte et les enregistrer
-    make_text(data_idees, "idees")
-    make_text(data_theatre, "theatre")
-    make_text(data_roman, "roman")
-    make_text(data_poeme, "poeme")
+    if rapport is not None:
+        print(rapport.enregistrer())
 
 
 if __name__ == "__main__":
-    pipeline()
+    # `python creation_corpus.py --profilage` active `cProfile`
+    pipeline(profilage="--profilage" in sys.argv)
@@ -0,0 +1,280 @@
+from itertools import repeat
+from operator import and_, mul, rshift, xor
+from array import array
+import random
+import zlib  # pour `crc32()`, une fonction de hachage rapide et stable
+import math
+
+from corpus import ANNEE_MANQUANTE
+from index_texte import mots
+
+
+# *************************************************************
+# dans ce script, on cherche les *quasi-doublons*: un même
+# manuscrit, revendu plusieurs fois, parfois à des décennies
+# d'écart, avec une description un peu différente. en réunissant
+# ces reventes, on peut suivre l'évolution du prix d'un manuscrit.
+#
+# comparer chaque entrée à toutes les autres demande n² / 2
+# comparaisons: c'est impossible sur un grand corpus. on utilise
+# plutôt deux techniques:
+#
+# 1. le *MinHash*. chaque entrée est découpée en *bardeaux*
+#    ("shingles"): tous les morceaux de 5 caractères du texte
+#    "auteur.ice date_de_création description". la ressemblance
+#    entre deux entrées est l'indice de Jaccard de leurs bardeaux
+#    (bardeaux communs / bardeaux distincts). on résume chaque
+#    entrée par une *signature* de N valeurs: les plus petites
+#    empreintes de ses bardeaux (voir `MinHash`). la part des N
+#    valeurs identiques entre deux signatures est une estimation
+#    de l'indice de Jaccard.
+# 2. le *LSH* ("locality-sensitive hashing"). on coupe chaque
+#    signature en *bandes* de quelques valeurs. deux entrées qui
+#    ont une bande identique sont des *candidates*; deux entrées
+#    très différentes n'ont presque jamais de bande identique.
+#    pour chaque bande, on ne garde que la première entrée vue
+#    (son *représentant*): chaque nouvelle entrée n'est comparée
+#    qu'aux représentants de ses bandes, soit au plus un nombre
+#    fixe de comparaisons par entrée. le temps de calcul grandit
+#    donc comme le nombre d'entrées, et non comme son carré.
+#
+# les candidates dont la ressemblance estimée dépasse un seuil
+# sont réunies dans un même *groupe*, avec une structure
+# "union-find": si A ressemble à B et B à C, A, B et C forment
+# un seul groupe.
+#
+# crédits:
+# - code: Paul Kervegan, 2023. code sous licence `GNU GPLv3.0`
+# *************************************************************
+
+
+# la taille des bardeaux, en caractères
+TAILLE_BARDEAU = 5
+
+# le nombre de fonctions de hachage du MinHash
+NOMBRE_PERMUTATIONS = 64
+
+# la ressemblance minimale (indice de Jaccard estimé) entre deux reventes d'un même manuscrit
+SEUIL = 0.7
+
+# `2 ** 64 / nombre d'or`, impair: multiplier par ce nombre modulo 2 ** 64 mélange bien les bits
+MULTIPLICATEUR = 0x9E3779B97F4A7C15
+MASQUE_64 = (1 << 64) - 1
+
+
+def bardeaux(entree, taille=TAILLE_BARDEAU):
+    """
+    :param entree: un dictionnaire produit par `structure()`
+    :param taille: la taille des bardeaux, en caractères
+    :returns: l'ensemble des empreintes (des entiers) des bardeaux de l'entrée
+    """
+    # `mots()` normalise le texte et supprime la ponctuation (voir `index_texte.py`)
+    texte = " ".join(mots(f"{entree['auteur']} {entree['date_creation']} {entree['description']}")).encode("utf-8")
+    if len(texte) <= taille:
+        return {zlib.crc32(texte)}
+    return { zlib.crc32(texte[i:i + taille]) for i in range(len(texte) - taille + 1) }
+
+
+def bandes_lignes(nombre_permutations=NOMBRE_PERMUTATIONS, seuil=SEUIL):
+    """
+    choisir le découpage des signatures en bandes. avec `b` bandes de `r`
+    valeurs, deux entrées de ressemblance `s` ont une probabilité
+    `1 - (1 - s ** r) ** b` d'être candidates, qui passe brusquement de
+    presque 0 à presque 1 autour de `(1 / b) ** (1 / r)`. on choisit le
+    découpage dont ce point de bascule est le plus haut possible, tout en
+    restant sous `seuil`: on manque peu de paires, et les candidates en
+    trop sont écartées par la vérification.
+
+    :param nombre_permutations: la taille des signatures
+    :param seuil: la ressemblance minimale recherchée
+    :returns: le nombre de bandes et le nombre de valeurs par bande
+    """
+    decoupages = [
+        (nombre_permutations // lignes, lignes)
+        for lignes in range(1, nombre_permutations + 1)
+        if nombre_permutations % lignes == 0
+    ]
+    sous_seuil = [ (bandes, lignes) for bandes, lignes in decoupages if (1 / bandes) ** (1 / lignes) <= seuil ]
+    return max(sous_seuil, key=lambda decoupage: (1 / decoupage[0]) ** (1 / decoupage[1]))
+
+
+class MinHash:
+    """
+    calculer les signatures MinHash.
+
+    >>> minhash = MinHash(64)
+    >>> minhash.signature(bardeaux(entree))
+    array('I', [1093, 50211, ...])  # 64 valeurs
+
+    calculer N fonctions de hachage pour chaque bardeau coûte cher. on utilise
+    donc le *hachage à une permutation* ("one permutation hashing", Li, Owen et
+    Zhang, 2012): chaque bardeau est haché une seule fois, et son empreinte le
+    range dans l'une des N *cases* de la signature. chaque case garde la plus
+    petite empreinte qu'elle a reçue. une case vide reçoit la valeur de la
+    première case non vide à sa droite (la *densification*), modifiée selon la
+    distance, pour rester distincte de cette case.
+    """
+
+    def __init__(self, nombre_permutations=NOMBRE_PERMUTATIONS, graine=0):
+        """
+        :param nombre_permutations: le nombre de cases (la taille des signatures)
+        :param graine: la graine qui choisit la fonction de hachage: deux signatures
+                       ne sont comparables que si elles ont été calculées avec la même graine
+        """
+        self.nombre_permutations = nombre_permutations
+        self.sel = random.Random(graine).getrandbits(64)
+
+    def signature(self, empreintes):
+        """
+        :param empreintes: les empreintes des bardeaux d'une entrée
+        :returns: la signature, dans un `array`. on ne garde que les 32 bits de
+                  poids faible de chaque valeur: la signature prend 2 fois moins
+                  de place, et deux bardeaux différents d'une même case gardent
+                  des valeurs différentes.
+        """
+        n = self.nombre_permutations
+        # le hachage de Fibonacci, `(x * MULTIPLICATEUR) % 2 ** 64`, mélange tous les bits
+        # de `x` dans les bits de poids fort, qui choisissent la case. `map()` calcule
+        # toutes les empreintes en C.
+        valeurs = sorted(map(and_, map(mul, map(xor, empreintes, repeat(self.sel)), repeat(MULTIPLICATEUR)), repeat(MASQUE_64)))
+        cases = map(rshift, map(mul, valeurs, repeat(n)), repeat(64))  # `valeur * n // 2 ** 64`: la case
+        # `valeurs` est trié: en le parcourant à l'envers, la plus petite valeur de chaque case est écrite en dernier
+        minimums = dict(zip(reversed(list(cases)), reversed(valeurs)))
+
+        signature = array("I", [0]) * n
+        if not minimums:
+            return signature
+        for case in range(n):
+            distance = 0
+            while (case + distance) % n not in minimums:
+                distance += 1
+            signature[case] = (minimums[(case + distance) % n] + distance * MULTIPLICATEUR) & 0xFFFFFFFF
+        return signature
+
+
+class Doublons:
+    """
+    regrouper les reventes probables d'un même manuscrit, au fur et à mesure
+    que les entrées sont ajoutées.
+
+    >>> doublons = Doublons(seuil=0.7)
+    >>> for entree in iter_structure("roman"): doublons.ajouter(entree)
+    >>> doublons.groupes()
+    [[0, 1, 2], [14, 203], ...]  # les numéros des entrées, dans l'ordre d'ajout
+    >>> doublons.trajectoires()
+    [[(1879, 12.0), (1881, 15.5), ...], ...]  # (année de vente, prix constant)
+
+    pour chaque entrée, on garde sa signature, son année de vente et son prix
+    dans des `array` (moins de 300 octets), et ses bandes qui n'avaient encore
+    jamais été vues dans les dictionnaires des représentants. en tout, il faut
+    compter environ 600 octets par entrée.
+    """
+
+    def __init__(self, seuil=SEUIL, nombre_permutations=NOMBRE_PERMUTATIONS,
+                 taille_bardeau=TAILLE_BARDEAU, graine=0):
+        """
+        :param seuil: la ressemblance minimale entre deux reventes d'un même manuscrit
+        :param nombre_permutations: la taille des signatures
+        :param taille_bardeau: la taille des bardeaux, en caractères
+        :param graine: la graine des fonctions de hachage
+        """
+        self.seuil = seuil
+        self.taille_bardeau = taille_bardeau
+        self.nombre_permutations = nombre_permutations
+        self.minhash = MinHash(nombre_permutations, graine)
+        self.bandes, self.lignes = bandes_lignes(nombre_permutations, seuil)
+        self.representants = [ {} for _ in range(self.bandes) ]  # pour chaque bande: valeurs => numéro d'entrée
+        self.signatures = array("I")  # toutes les signatures, à la suite
+        self.parents = array("Q")  # la structure "union-find"
+        self.annees = array("h")
+        self.prix = array("d")
+
+    def __len__(self):
+        return len(self.parents)
+
+    def ajouter(self, entree):
+        """
+        :param entree: un dictionnaire produit par `structure()` ou `iter_structure()`
+        :returns: le numéro de l'entrée
+        """
+        numero = len(self.parents)
+        signature = self.minhash.signature(bardeaux(entree, self.taille_bardeau))
+        self.signatures.extend(signature)
+        self.parents.append(numero)
+        self.annees.append(ANNEE_MANQUANTE if entree["date_vente"] == "" else entree["date_vente"])
+        self.prix.append(math.nan if entree["prix_constant"] == "" else entree["prix_constant"])
+
+        deja_compares = set()
+        for bande, representants in enumerate(self.representants):
+            # les valeurs de la bande, en octets, servent de clé de dictionnaire
+            cle = signature[bande * self.lignes:(bande + 1) * self.lignes].tobytes()
+            representant = representants.setdefault(cle, numero)
+            if representant == numero or representant in deja_compares:
+                continue
+            deja_compares.add(representant)
+            if self.ressemblance(numero, representant) >= self.seuil:
+                self._unir(numero, representant)
+        return numero
+
+    def ressemblance(self, numero, autre):
+        """
+        :returns: la ressemblance estimée entre les entrées `numero` et `autre`:
+                  la part des valeurs identiques de leurs signatures
+        """
+        n = self.nombre_permutations
+        identiques = sum(map(
+            int.__eq__,
+            self.signatures[numero * n:(numero + 1) * n],
+            self.signatures[autre * n:(autre + 1) * n]
+        ))
+        return identiques / n
+
+    def _racine(self, numero):
+        """
+        :returns: le numéro qui représente le groupe de l'entrée `numero`
+        """
+        while self.parents[numero] != numero:
+            # on raccourcit le chemin au passage: la prochaine recherche sera plus rapide
+            self.parents[numero] = self.parents[self.parents[numero]]
+            numero = self.parents[numero]
+        return numero
+
+    def _unir(self, numero, autre):
+        """
+        réunir les groupes des entrées `numero` et `autre`
+        """
+        racine, racine_autre = self._racine(numero), self._racine(autre)
+        if racine != racine_autre:
+            self.parents[max(racine, racine_autre)] = min(racine, racine_autre)
+
+    def groupes(self, taille_min=2):
+        """
+        :param taille_min: la taille minimale d'un groupe
+        :returns: la liste des groupes d'au moins `taille_min` entrées. chaque groupe
+                  est la liste triée des numéros de ses entrées; les groupes sont triés
+                  selon leur premier numéro.
+        """
+        groupes = {}
+        for numero in range(len(self.parents)):
+            groupes.setdefault(self._racine(numero), []).append(numero)
+        return [ groupe for groupe in groupes.values() if len(groupe) >= taille_min ]
+
+    def trajectoires(self, taille_min=2):
+        """
+        :param taille_min: la taille minimale d'un groupe
+        :returns: pour chaque groupe de `groupes()`, la liste de ses ventes
+                  `(annee de vente, prix constant)`, triée par année. une année
+                  ou un prix manquant vaut `""`, comme dans `structure()`.
+        """
+        trajectoires = []
+        for groupe in self.groupes(taille_min):
+            # les ventes sans année sont placées à la fin
+            groupe = sorted(groupe, key=lambda numero: (self.annees[numero] == ANNEE_MANQUANTE, self.annees[numero]))
+            trajectoires.append([
+                (
+                    "" if self.annees[numero] == ANNEE_MANQUANTE else self.annees[numero],
+                    "" if math.isnan(self.prix[numero]) else self.prix[numero]
+                )
+                for numero in groupe
+            ])
+        return trajectoires
@@ -1,9 +1,19 @@
-import plotly.graph_objects as go  # librairie pour générer des graphiques
-from statistics import median  # fonction pour calculer une valeur médiane
+# les librairies lourdes (plotly, `concurrent.futures`) sont importées dans les
+# fonctions qui s'en servent, pas ici: un script qui n'utilise que `structure()`
+# démarre ainsi beaucoup plus vite.
 import random  # librairie pour sélectionner des valeurs au hasard
+import time  # pour mesurer la durée de la lecture et de la structuration
+import sys  # pour lire les arguments passés en ligne de commande
 import os  # la librairie pour gérer les chemins de fichiers
 import re  # librairie pour les expressions régulières (détection de motifs dans le texte)
 
+from corpus import Corpus  # stockage compact, en colonnes, d'un corpus structuré
+from agregation import agreger, axes_depuis_agregat, mediane  # statistiques par groupe sur un `Corpus`
+from quantiles import axes_en_flux  # médianes calculées au fur et à mesure
+import cache  # cache sur le disque des corpus structurés
+from instrumentation import Rapport, etape, compter_champs  # mesures de chaque étape du traitement
+from rendu import cle_rendu, empreinte_rendu, exporter_cache  # enregistrement des figures, avec un cache
+
 
 # *************************************************************
 # dans ce script, on analyse les corpus de texte produits 
@@ -23,18 +33,78 @@ import re  # librairie pour les expressions régulières (détection de motifs d
 # *************************************************************
 
 
-def read_text(genre):
+# taille (en caractères) des blocs lus par `iter_entrees()`
+TAILLE_BLOC = 1024 * 1024
+
+# version de l'analyseur (`structure_entree()`). elle est utilisée par le
+# cache (voir `cache.py`): il faut l'augmenter à chaque fois qu'on modifie
+# la manière de structurer les entrées, pour que les résultats déjà
+# enregistrés dans le cache ne soient plus utilisés.
+VERSION_ANALYSEUR = 1
+
+# les expressions régulières utilisées pour structurer le corpus sont
+# compilées une seule fois, au chargement du fichier, avec `re.compile()`,
+# au lieu d'être relues à chaque entrée.
+#
+# une entrée vide ne contient que des espaces (`\s`, qui comprend aussi
+# les retours à la ligne) entre un début (`^`) et une fin (`$`) de ligne.
+MOTIF_ENTREE_VIDE = re.compile(r"^\s*$", flags=re.MULTILINE)
+
+# toutes les informations d'une entrée sont extraites avec un seul motif.
+# - `(?P<nom>...)` est un sous-groupe *nommé*: on récupère son contenu avec
+#   `motif["nom"]` au lieu de `motif[1]`.
+# - `|` sépare plusieurs alternatives: le motif trouve soit une date de 
+#   création, soit une date de vente, soit des dimensions, soit un prix, 
+#   soit un prix constant.
+# - `\d{4}` cible 4 chiffres (une année); `\d+\.?\d*` cible un nombre entier
+#   ou à virgule; `[A-Z]+` cible une ou plusieurs lettres capitales (la monnaie).
+MOTIF_CHAMPS = re.compile(
+    r"Écrit en (?P<date_creation>\d{4})"
+    r"|Vendu en (?P<date_vente>\d{4})"
+    r"|Dimensions: (?P<dimensions>\d+\.?\d*) pages"
+    r"|Prix: (?P<prix>\d+\.?\d*) (?P<monnaie>[A-Z]+)"
+    r"|en francs constants 1900: (?P<prix_constant>\d+\.?\d*)"
+)
+
+
+def chemin_catalogue(genre, dossier=None):
+    """
+    :param genre: le genre du corpus
+    :param dossier: le dossier où se trouve le catalogue. par défaut, le dossier `in/`
+    :returns: le chemin du fichier `catalogue_{genre}.txt`
+    """
+    if dossier is None:
+        current_directory = os.path.abspath(os.path.dirname(__file__))  # le chemin du dossier où se trouve le fichier actuel
+        dossier = os.path.join(current_directory, os.pardir, "in")
+    return os.path.join(dossier, f"catalogue_{genre}.txt")
+
+
+def genres_disponibles(dossier=None):
+    """
+    trouver tous les catalogues `catalogue_{genre}.txt` d'un dossier.
+    
+    :param dossier: le dossier des catalogues. par défaut, le dossier `in/`
+    :returns: la liste triée des genres
+    """
+    dossier = os.path.dirname(chemin_catalogue("", dossier))
+    return sorted(
+        nom[len("catalogue_"):-len(".txt")] for nom in os.listdir(dossier)
+        if nom.startswith("catalogue_") and nom.endswith(".txt")
+    )
+
+
+def read_text(genre, dossier=None):
     """
     ici, on ouvre les fichiers en lecture et on en sauvegarde
     le contenu dans une variable, afin de pouvoir traiter et
     manipuler les corpus
     
     :param genre: le genre du corpus, pour ouvrir le bon fichier
+    :param dossier: le dossier où se trouve le catalogue. par défaut, le dossier `in/`
     :returns: le corpus associé à ce genre, sous la forme d'une
               chaîne de caractères 
     """
-    current_directory = os.path.abspath(os.path.dirname(__file__))  # le chemin du dossier où se trouve le fichier actuel
-    in_file = os.path.join(current_directory, os.pardir, "in", f"catalogue_{genre}.txt")  # le chemin du fichier d'entrée
+    in_file = chemin_catalogue(genre, dossier)  # le chemin du fichier d'entrée (par défaut, dans `in/`)
 
     # `with open() as fh` permet d'ouvrir un fichier. 
     # `mode="r+"` indique ce que l'on veut faire avec ce fichier: 
@@ -114,8 +184,6 @@ def structure(corpus):
     :corpus: le contenu du fichier traité, en chaîne de caractères.
     :returns: le corpus structuré sous forme de liste de dictionnaires
     """
-    corpus_structure = []  # le résultat de sortie
-    
     # toutes les entrées du corpus sont séparées par 2 lignes vides, 
     # soit 3 retours à la ligne. 
     # on sépare donc toutes les entrées pour traduire le corpus en une liste
@@ -135,96 +203,262 @@ def structure(corpus):
     # - soit des espaces verticaux (`\n`) une ou plusieurs fois (`*`)
     # - entre le début (`^`) et la fin de l'entrée (`$`). 
     # - `(a|b)` est une expression qui correspond à "soit a, soit b".
-    corpus = [ entree for entree in corpus if not re.search("^(\n|\s)*$", entree, flags=re.MULTILINE) ]
+    # 
+    # ce motif est compilé une fois pour toutes en haut du fichier (`MOTIF_ENTREE_VIDE`).
+    corpus = [ entree for entree in corpus if not MOTIF_ENTREE_VIDE.search(entree) ]
     
     # à quoi ressemble une entrée, maintenant?
     # print(corpus[1])
     
     
-    # on traite toutes les entrées du corpus
-    for entree in corpus:
-        # on initie les variables pour lesquelles on recherchera des informations
-        # on ne retient pas les dimensions, qui ne seront pas utilisées plus tard
-        auteur = ""
-        date_creation = ""
-        date_vente = ""
-        prix = ""
-        monnaie = ""
-        prix_constant = ""
-        description = ""
-        
-        
-        # on extrait la première ligne: l'auteur.
-        auteur = entree.split("\n")[0]
-        
-        # ensuite, la date de vente
-        if re.search("Écrit en (\d{4})", entree):
-            # - `\d{4}` permet de cibler une date au format `AAAA`: `\d{4}` permet de cibler 
-            #   4 chiffres à la suite, soit l'année
-            # - on récupère l'élément à l'index 1 renvoyé par `re.search()`: `re.search()[1]`:
-            #   - le premier élément que renvoie cette fonction (récupéré avec `re.search()[0]`) 
-            #     est l'intégralité du motif détecté ( "Écrit en AAAA")
-            #   - le second élément correspond au premier sous-groupe du motif. les expressions
-            #     régulières permettent de définir des sous-groupes, c'est-à-dire des sous-motifs
-            #     à l'intérieur de l'expression régulière. un sous motif est indiqué par la 
-            #     présence de "()". il permet de détecter et d'extraire une partie seulement 
-            #     d'un motif dans une chaînes de caractères. ici, on repère "Écrit en AAAA",
-            #     mais on extrait seulement "\d{4}", soit le premier sous-groupe de l'expression.
-            # `int()` permet de convertir une chaîne de caractères en nombre entier
-            date_creation = int(re.search("Écrit en (\d{4})", entree)[1])
-        
-        # de même pour la date de vente: on recupère le première série de 4 chiffres.
-        if re.search("Vendu en (\d{4})", entree):
-            date_vente = int(re.search("Vendu en (\d{4})", entree)[1])
-        
-        # on récupère ensuite la description, soit la 3e ligne de chaque entrée
-        description = entree.split("\n")[3]
-        
-        # ensuite, on s'occupe du prix et de la monnaie
-        if re.search("Prix: (\d+\.?\d*) ([A-Z]+)", entree):
-            # décomposons cette expression régulière:
-            # - elle permet de cibler: "Prix: 30 FRF", "Prix: 30.05 FRF"...
-            # - ici, il y a deux sous-groupes qui correspondent au prix 
-            #   et à la monnaie dans laquelle ce prix est exprimé:
-            #   - `\d+\.?\d*`: permet de cibler un nombre entier ou à virgule.
-            #     - `\d+`: un ou plusieurs chiffres
-            #     - `\.?`: "\." permet de cibler un point ("."); "?" indique qu'il 
-            #       faut cibler ce point 0 ou 1 fois.
-            #     - `\d*`: entre 0 et plusieurs chiffres
-            #   - `[A-Z]+`: permet de cibler une ou plusieurs fois une lettre capitale.
-            #     - `[A-Z]`: les crochets "[]" permettent d'indiquer qu'il faut cibler un 
-            #       caractère parmi une liste de caractères fournie entre crochets. séparer 
-            #       2 caractères par un "-" indique que ces deux caractères sont des bornes 
-            #       et qu'il faut cibler tous les caractères entre ces bornes: 
-            #       [A-Z] cible donc tous les caractères en majuscules
-            #     - `+` indique qu'il faut cibler le caractère précédent une ou plusieurs fois.
-            prix = float(re.search("Prix: (\d+\.?\d*) ([A-Z]+)", entree)[1])  # le prix correspond au le 1er sous-groupe. on le convertit en nombre à virgule avec `float()`
-            monnaie = re.search("Prix: (\d+\.?\d*) ([A-Z]+)", entree)[2]      # la monnaie correspond au 2nd sous-groupe
-            
-        # enfin, on cible le prix constant, exprimé en francs 1900.
-        if re.search("en francs constants 1900: (\d+\.?\d*)", entree):
-            # ici, la logique est la même qu'au dessus: on cible un nombre entier
-            # ou un nombre à virgule (`\d+\.?\d*`) dans un sous-groupe et on l'extrait. 
-            # on convertit le prix en nombre à virgule.
-            prix_constant = float(re.search("en francs constants 1900: (\d+\.?\d*)", entree)[1])
-            
-        # pour finir, on exprime l'entrée sous la forme d'un dicitonnaire et on ajoute
-        # cette entrée à notre variable `out`, qui stocke le corpus structuré.
-        entree = {
-            "auteur": auteur,
-            "date_creation": date_creation,
-            "date_vente": date_vente,
-            "prix": prix,
-            "prix_constant": prix_constant,
-            "monnaie": monnaie,
-            "description": description
-        }
-        corpus_structure.append(entree)
+    # on traite toutes les entrées du corpus avec `structure_lot()`, définie
+    # plus bas, qui transforme chaque entrée en dictionnaire.
+    corpus_structure = structure_lot(corpus)
         
     return corpus_structure
 
 
-def axes(corpus):
+def structure_entree(entree, dimensions=False):
+    """
+    structurer une seule entrée du catalogue (le texte situé entre
+    deux séparateurs `\n\n\n`) sous la forme d'un dictionnaire.
+    cette fonction est utilisée par `structure()` et par
+    `iter_structure()`.
+    
+    toutes les informations sont extraites en un seul passage sur le texte
+    de l'entrée avec `MOTIF_CHAMPS` (voir en haut du fichier), au lieu de
+    lancer une recherche par information.
+    
+    :param entree: une entrée de catalogue, en chaîne de caractères
+    :param dimensions: si `True`, ajouter le nombre de pages (clé
+                       `dimensions`) au dictionnaire de sortie
+    :returns: l'entrée structurée sous forme de dictionnaire
+    """
+    # on initie les variables pour lesquelles on recherchera des informations
+    date_creation = ""
+    date_vente = ""
+    prix = ""
+    monnaie = ""
+    prix_constant = ""
+    nombre_pages = ""
+    
+    # on découpe l'entrée en lignes une seule fois. `maxsplit=4` permet d'arrêter
+    # le découpage après la 4e ligne: on n'a pas besoin des lignes suivantes.
+    # - la première ligne est l'auteur.
+    # - la 4e ligne (à l'index 3) est la description.
+    lignes = entree.split("\n", 4)
+    auteur = lignes[0]
+    description = lignes[3]
+    
+    # `finditer()` parcourt l'entrée une seule fois et renvoie chaque motif
+    # trouvé. `motif.lastgroup` donne le nom du dernier sous-groupe trouvé,
+    # ce qui permet de savoir quelle alternative de `MOTIF_CHAMPS` a été trouvée.
+    # comme avec `re.search()`, on ne garde que la première occurrence de chaque motif.
+    for motif in MOTIF_CHAMPS.finditer(entree):
+        nom = motif.lastgroup
+        if nom == "date_creation":
+            if date_creation == "":
+                date_creation = int(motif["date_creation"])
+        elif nom == "date_vente":
+            if date_vente == "":
+                date_vente = int(motif["date_vente"])
+        elif nom == "monnaie":
+            if monnaie == "":
+                prix = float(motif["prix"])
+                monnaie = motif["monnaie"]
+        elif nom == "prix_constant":
+            if prix_constant == "":
+                prix_constant = float(motif["prix_constant"])
+        elif nom == "dimensions":
+            if nombre_pages == "":
+                nombre_pages = float(motif["dimensions"])
+    
+    # pour finir, on exprime l'entrée sous la forme d'un dicitonnaire
+    entree = {
+        "auteur": auteur,
+        "date_creation": date_creation,
+        "date_vente": date_vente,
+        "prix": prix,
+        "prix_constant": prix_constant,
+        "monnaie": monnaie,
+        "description": description
+    }
+    if dimensions:
+        entree["dimensions"] = nombre_pages
+    return entree
+
+
+def structure_lot(entrees, dimensions=False):
+    """
+    structurer d'un coup une liste d'entrées brutes (déjà séparées
+    et filtrées, comme dans `structure()`).
+    
+    :param entrees: une liste d'entrées de catalogue, en chaînes de caractères
+    :param dimensions: si `True`, ajouter le nombre de pages aux dictionnaires
+    :returns: une liste de dictionnaires, un par entrée
+    """
+    return [ structure_entree(entree, dimensions) for entree in entrees ]
+
+def iter_entrees(fh, taille_bloc=TAILLE_BLOC):
+    """
+    lire un fichier de catalogue bloc par bloc et renvoyer ses entrées
+    une par une, au lieu de charger tout le fichier en mémoire avec
+    `read_text()` puis de le découper avec `.split()`.
+    
+    cette fonction est un *générateur*: au lieu de `return`, elle utilise
+    `yield`, qui renvoie une valeur et met la fonction en pause jusqu'à
+    ce qu'on demande la valeur suivante (par exemple dans une boucle `for`).
+    on n'a donc jamais en mémoire plus d'un bloc et d'une entrée à la fois.
+    
+    le découpage est le même que `corpus.split("\n\n\n")`: on cherche les
+    séparateurs de gauche à droite, et un séparateur peut être coupé en deux
+    entre deux blocs: on garde donc la fin non traitée d'un bloc dans `reste`
+    pour la recoller au début du bloc suivant.
+    
+    :param fh: un fichier ouvert en lecture (en mode texte)
+    :param taille_bloc: le nombre de caractères lus à chaque fois
+    :returns: un générateur d'entrées non vides, en chaînes de caractères
+    """
+    reste = ""
+    while True:
+        bloc = fh.read(taille_bloc)
+        if not bloc:
+            break
+        texte = reste + bloc
+        debut = 0  # la position du début de l'entrée en cours dans `texte`
+        fin = texte.find("\n\n\n", debut)
+        while fin != -1:
+            entree = texte[debut:fin]
+            # on filtre les entrées vides de la même manière que dans `structure()`
+            if not MOTIF_ENTREE_VIDE.search(entree):
+                yield entree
+            debut = fin + 3
+            fin = texte.find("\n\n\n", debut)
+        reste = texte[debut:]
+    
+    # la dernière entrée n'est pas forcément suivie d'un séparateur
+    if not MOTIF_ENTREE_VIDE.search(reste):
+        yield reste
+
+
+def iter_structure(genre, taille_bloc=TAILLE_BLOC, dossier=None):
+    """
+    version "en flux" de `read_text()` et `structure()`: on ouvre le
+    fichier du genre `genre` et on renvoie les entrées structurées une
+    par une, sans jamais charger tout le catalogue en mémoire. le
+    résultat peut être donné directement à `axes()`:
+    
+    >>> x, y_prix, y_count = axes(iter_structure("roman"))
+    
+    :param genre: le genre du corpus, pour ouvrir le bon fichier
+    :param taille_bloc: le nombre de caractères lus à chaque fois
+    :param dossier: le dossier où se trouve le catalogue. par défaut, le dossier `in/`
+    :returns: un générateur de dictionnaires, identiques à ceux de `structure()`
+    """
+    with open(chemin_catalogue(genre, dossier), mode="r") as fh:
+        for entree in iter_entrees(fh, taille_bloc):
+            yield structure_entree(entree)
+
+
+
+def structure_corpus(genre, taille_bloc=TAILLE_BLOC, dossier=None):
+    """
+    lire et structurer le corpus du genre `genre` sous la forme d'un
+    `Corpus` (voir `corpus.py`): les entrées sont lues une par une avec
+    `iter_structure()` et rangées dans des colonnes typées, ce qui prend
+    beaucoup moins de mémoire qu'une liste de dictionnaires.
+    
+    :param genre: le genre du corpus, pour ouvrir le bon fichier
+    :param taille_bloc: le nombre de caractères lus à chaque fois
+    :param dossier: le dossier où se trouve le catalogue. par défaut, le dossier `in/`
+    :returns: le corpus structuré, sous la forme d'un `Corpus`
+    """
+    return Corpus.depuis_entrees(iter_structure(genre, taille_bloc, dossier), genre=genre)
+
+
+def structure_cache(genre):
+    """
+    comme `structure_corpus()`, mais en passant par le cache (voir `cache.py`):
+    si le catalogue n'a pas changé depuis la dernière exécution, on recharge
+    directement le `Corpus` enregistré au lieu de restructurer le fichier.
+    
+    :param genre: le genre du corpus, pour ouvrir le bon fichier
+    :returns: le corpus structuré, sous la forme d'un `Corpus`
+    """
+    return cache.charger(
+        chemin_catalogue(genre),
+        lambda chemin: structure_corpus(genre),
+        VERSION_ANALYSEUR
+    )
+
+def structure_cache_mesuree(genre):
+    """
+    comme `structure_cache()`, en mesurant séparément le temps passé à lire le
+    catalogue et le temps passé à le structurer. cette fonction est appelée dans
+    un autre processus par `pipeline()`: elle renvoie ses mesures avec le corpus,
+    pour que `pipeline()` les ajoute au rapport (voir `instrumentation.py`).
+    
+    la lecture et la structuration se font en même temps, bloc par bloc (voir
+    `iter_entrees()`): on compte comme lecture le temps passé dans `fh.read()`,
+    et comme structuration tout le reste.
+    
+    :param genre: le genre du corpus, pour ouvrir le bon fichier
+    :returns: le corpus structuré, et un dictionnaire: `lecture_secondes`,
+              `structure_secondes` et `cache` (`True` si le corpus a été
+              rechargé depuis le cache: on ne compte alors que la lecture)
+    """
+    mesures = {"lecture_secondes": 0.0, "structure_secondes": 0.0, "cache": True}
+    
+    def structurer(chemin):
+        mesures["cache"] = False
+        debut = time.perf_counter()
+        with open(chemin, mode="r") as fh:
+            lecteur = _LecteurMesure(fh)
+            corpus = Corpus.depuis_entrees(
+                ( structure_entree(entree) for entree in iter_entrees(lecteur) ),
+                genre=genre
+            )
+        mesures["lecture_secondes"] = lecteur.secondes
+        mesures["structure_secondes"] = time.perf_counter() - debut - lecteur.secondes
+        return corpus
+    
+    debut = time.perf_counter()
+    corpus = cache.charger(chemin_catalogue(genre), structurer, VERSION_ANALYSEUR)
+    if mesures["cache"]:
+        mesures["lecture_secondes"] = time.perf_counter() - debut
+    return corpus, mesures
+
+
+class _LecteurMesure:
+    """
+    un fichier ouvert, dont on mesure le temps passé dans `read()`
+    """
+    def __init__(self, fh):
+        self.fh = fh
+        self.secondes = 0.0
+    
+    def read(self, taille=-1):
+        debut = time.perf_counter()
+        bloc = self.fh.read(taille)
+        self.secondes += time.perf_counter() - debut
+        return bloc
+
+
+def structure_base(genre, chemin=None):
+    """
+    comme `structure_corpus()`, mais en lisant les entrées dans la base SQLite
+    (voir `base_donnees.py`) au lieu du catalogue texte.
+    
+    :param genre: le genre du corpus
+    :param chemin: le chemin de la base (par défaut, `in/catalogues.sqlite`)
+    :returns: le corpus structuré, sous la forme d'un `Corpus`
+    """
+    from base_donnees import BaseCatalogues
+    with BaseCatalogues(chemin) as base:
+        return base.corpus(genre)
+
+
+def axes(corpus, erreur=None):
     """
     à partir d'un corpus, générer des données pour les absisses et ordonnées
     de nos graphiques.
@@ -243,7 +477,12 @@ def axes(corpus):
     associent à chaque année les données pertinentes, pour pouvoir
     garder le lien entre données en abscisse et données en ordonnée
 
-    :param corpus: le corpus traité
+    :param corpus: le corpus traité: une liste de dictionnaires produite par
+                   `structure()`, un générateur produit par `iter_structure()`
+                   ou un `Corpus` produit par `structure_corpus()`
+    :param erreur: si elle est donnée, les prix médians sont approchés avec une
+                   erreur d'au plus `erreur` sur leur position (par exemple 0.01
+                   pour 1%), sans garder tous les prix en mémoire (voir `quantiles.py`)
     :returns: 
               - `x`: l'axe des abscisses, sous la forme d'une liste de dates
               - `y_prix`: un dictionnaire associant à chaque année un prix médian 
@@ -254,21 +493,23 @@ def axes(corpus):
     y_prix = {}   # prix  par an
     y_count = {}  # nombre d'items vendus par an
     
-    annees = [ entree["date_vente"] for entree in corpus ]  # liste d'années.
-    # on crée x: une liste avec toutes les années entre la vente la plus ancienne 
-    # et la plus récente.
-    for i in range(min(annees), max(annees) + 1):
-        x.append(i)
-    
-    # ensuite, on crée les bases pour `y_prix` et `y_count`: on crée dans
-    # chaque dictionnaire une entrée pour chaque année
-    y_prix = { annee: [] for annee in x }  # on associe à chaque année une liste vide: on y ajoutera tous les prix de vente
-    y_count = { annee: 0 for annee in x }  # on associe à chaque année un 0. on comptera toutes les ventes pour cette année
-    
+    # si `corpus` est un `Corpus` (voir `corpus.py`), on utilise `agreger()`
+    # (voir `agregation.py`), qui travaille directement sur ses colonnes.
+    if erreur is not None:
+        return axes_en_flux(corpus, erreur)
+    if isinstance(corpus, Corpus):
+        return axes_depuis_agregat(agreger(corpus, cles=("date_vente",)))
     
-    # on itère sur chaque entrée
+    # on itère une seule fois sur chaque entrée: `corpus` peut donc être une 
+    # liste, mais aussi un générateur comme `iter_structure()`, qui ne peut
+    # être parcouru qu'une fois.
+    # on ne connaît pas encore toutes les années: on ajoute donc une année
+    # à `y_prix` et à `y_count` la première fois qu'on la rencontre.
     for entree in corpus:
         date = entree["date_vente"]
+        if date not in y_count:
+            y_prix[date] = []
+            y_count[date] = 0
         
         # on ajoute le prix constant à `y_prix`
         if entree["prix_constant"] != "":
@@ -277,12 +518,17 @@ def axes(corpus):
         # on augmente le compteur de ventes par an de 1 dans `y_count`
         y_count[date] += 1
     
-    # enfin, on calcule le prix de vente médian pour une année dans `y_prix`:
-    for key, value in y_prix.items():
-        if len(value) > 0:
-            y_prix[key] = median(value)  # si il y a des prix pour cette année, remplacer la liste de prix par le prix médian
-        else:
-            y_prix[key] = 0  # si il n'y a pas eu de vente pour cette année, le prix médian est de 0.
+    # on crée x: une liste avec toutes les années entre la vente la plus ancienne 
+    # et la plus récente.
+    for i in range(min(y_count), max(y_count) + 1):
+        x.append(i)
+    
+    # enfin, on calcule le prix de vente médian pour chaque année de `x`. on 
+    # reconstruit `y_prix` et `y_count` pour qu'ils contiennent une entrée par
+    # année, dans l'ordre de `x`, y compris pour les années sans vente.
+    # `mediane()` (voir `agregation.py`) calcule la médiane d'une liste triée, comme `statistics.median()`
+    y_prix = { annee: mediane(sorted(y_prix[annee])) if len(y_prix.get(annee, [])) > 0 else 0 for annee in x }  # si il n'y a pas eu de vente pour cette année, le prix médian est de 0.
+    y_count = { annee: y_count.get(annee, 0) for annee in x }
     
     return x, y_prix, y_count
 
@@ -316,10 +562,46 @@ def align_y_to_x(x, y_dict):
     return y_out
 
 
-def visualize(corpus_idees, corpus_poeme, corpus_roman, corpus_theatre):
+# les couleurs et la mise en page de nos graphiques, utilisées par `figures_depuis_series()`.
+# elles font partie de la clé du cache des graphiques (voir `rendu.py`): si on les
+# modifie, les graphiques sont recréés.
+COULEURS = {
+    "white": "#ffffff", "cream": "#fcf8f7", "blue": "#0000ef", 
+    "burgundy": "#890c0c", "pink": "#ff94c9", "gold": "#da9902", 
+    "lightgreen": "#8fc7b1", "darkgreen": "#00553e", "peach": "#ffad98"
+}
+MISE_EN_PAGE = {
+    "paper_bgcolor": COULEURS["white"],
+    "plot_bgcolor": COULEURS["cream"],
+    "margin": {"l": 50, "r": 50, "t": 50, "b": 50},
+    "showlegend": True,
+    "xaxis": {"anchor": "x", "title": {"text": r"Année"}},
+    "barmode": "stack"
+}
+
+# le nom et la couleur de chaque genre dans les graphiques. les genres qui ne
+# sont pas dans ce dictionnaire sont nommés `Corpus {genre}` et prennent les
+# couleurs de `PALETTE`, dans l'ordre.
+GENRES_GRAPHIQUES = {
+    "idees": ("Corpus idées", "peach"),
+    "theatre": ("Corpus théâtre", "lightgreen"),
+    "poeme": ("Corpus poèmes", "pink"),
+    "roman": ("Corpus roman", "gold"),
+}
+PALETTE = ("blue", "burgundy", "darkgreen", "peach", "lightgreen", "pink", "gold")
+
+# version des graphiques. le code de `figures_depuis_series()` et les versions de
+# plotly et kaleido font déjà partie de la clé du cache des graphiques (voir
+# `empreinte_rendu()`): il ne faut l'augmenter que si leur apparence change
+# pour une autre raison, pour que les graphiques du cache ne soient plus utilisés.
+VERSION_FIGURES = 1
+
+
+def figures(corpus_idees, corpus_poeme, corpus_roman, corpus_theatre, rapport=None):
     """
-    ici, on visualise notre corpus afin de voir comment sont représentés
-    les 4 genres littéraires dans notre corpus.
+    ici, on crée les graphiques qui permettent de visualiser notre corpus, 
+    afin de voir comment sont représentés les 4 genres littéraires dans 
+    notre corpus. les graphiques sont affichés et enregistrés par `visualize()`.
     
     plotly et les graphiques en python
     ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
@@ -337,50 +619,125 @@ def visualize(corpus_idees, corpus_poeme, corpus_roman, corpus_theatre):
     - ensuite, il y a énormément de possibilités de personnalisation
     
     :param: en paramètre, tous les corpus exprimés en formats structurés.
-    :returns: rien.
+    :param rapport: un `Rapport` (voir `instrumentation.py`) où mesurer le calcul
+                    des axes, leur alignement et la création des figures, ou `None`
+    :returns: les deux figures plotly: `fig_prix` (prix médian par an) et
+              `fig_count` (nombre d'items mis en vente par an).
     """
-    # on prépare les données: 
-    # en `x`, on utilisera les années de vente
-    # en `y`, 
-    # - le nombre d'items mis en vente par corpus
-    # - le prix médian de chaque item mis en vente par corpus
-    x_idees, y_prix_idees, y_count_idees = axes(corpus_idees)
-    x_poeme, y_prix_poeme, y_count_poeme = axes(corpus_poeme)
-    x_roman, y_prix_roman, y_count_roman = axes(corpus_roman)
-    x_theatre, y_prix_theatre, y_count_theatre = axes(corpus_theatre)
-    
-    # on crée un `x` pour tous les corpus à partir des `x` calculés ci-dessus:
-    # différents corpus peuvent avoir des dates de ventes différentes. pour représenter
-    # tous les corpus sur un même graphique, il faut avoir une seule abscisse.
-    # ce `x` global correspond à une liste de toutes les années entre la date de vente
-    # la plus ancienne et la plus récente, pour tous les corpus.
-    x = []  # axe des abscisses fini.
-    annees_total = x_idees
-    for annee in x_poeme:
-        annees_total.append(annee)
-    for annee in x_roman:
-        annees_total.append(annee)
-    for annee in x_theatre:
-        annees_total.append(annee)
-    for i in range(min(annees_total), max(annees_total) + 1):
-        x.append(i)
+    # les données des graphiques sont préparées par `series()`, puis les
+    # graphiques eux-mêmes sont créés par `figures_depuis_series()`.
+    x, y_prix, y_count = series(corpus_idees, corpus_poeme, corpus_roman, corpus_theatre, rapport)
+    return figures_depuis_series(x, y_prix, y_count)
+
+
+def series(corpus_idees, corpus_poeme, corpus_roman, corpus_theatre, rapport=None):
+    """
+    préparer les données des graphiques des 4 corpus avec `matrice()`.
     
-    # ensuite, on finalise la création des axes des y, c'est-à-dire
-    # qu'on transforme toutes nos variables d'ordonnées (`y_prix_...` et
-    # `y_count_...`). ce sont actuellement des dictionnaires, on les transforme
-    # en listes alignées sur l'axe des abscisses `x`
-    y_prix_idees = align_y_to_x(x, y_prix_idees)
-    y_count_idees = align_y_to_x(x, y_count_idees)
+    :param: en paramètre, tous les corpus exprimés en formats structurés.
+    :param rapport: un `Rapport` (voir `instrumentation.py`) où mesurer le calcul
+                    des axes et leur alignement, ou `None`
+    :returns: `x`, `y_prix` et `y_count`, comme `matrice()`
+    """
+    # l'ordre des genres est celui des graphiques
+    return matrice({
+        "idees": corpus_idees,
+        "theatre": corpus_theatre,
+        "poeme": corpus_poeme,
+        "roman": corpus_roman
+    }, rapport)
+
+
+def matrice(corpus_par_genre, rapport=None):
+    """
+    préparer les données des graphiques pour un nombre quelconque de corpus:
+    un axe des abscisses commun à tous les corpus, et pour chaque mesure (prix
+    médian et nombre d'items) une *matrice* années × genres, où chaque genre a
+    une colonne alignée sur l'axe des abscisses.
     
-    y_prix_poeme = align_y_to_x(x, y_prix_poeme)
-    y_count_poeme = align_y_to_x(x, y_count_poeme)
+    comment aligner les colonnes?
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    `axes()` renvoie, pour chaque corpus, des années *consécutives*, de la
+    première à la dernière vente. dans l'axe commun `x`, ces années occupent
+    donc une tranche continue, qui commence à la position `premiere_annee - x[0]`.
+    on crée chaque colonne remplie de `0`, puis on copie d'un coup toutes les
+    valeurs du corpus dans cette tranche: `colonne[debut:fin] = valeurs`. on
+    évite ainsi de chercher chaque année dans un dictionnaire, comme le fait
+    `align_y_to_x()`.
     
-    y_prix_theatre = align_y_to_x(x, y_prix_theatre)
-    y_count_theatre = align_y_to_x(x, y_count_theatre)
+    :param corpus_par_genre: un dictionnaire associant à chaque genre son corpus
+                             (une liste produite par `structure()` ou un `Corpus`).
+                             les colonnes sont dans l'ordre de ce dictionnaire.
+    :param rapport: un `Rapport` (voir `instrumentation.py`) où mesurer le calcul
+                    des axes et leur alignement, ou `None`
+    :returns: 
+              - `x`: l'axe des abscisses, une liste d'années
+              - `y_prix`: un dictionnaire associant à chaque genre la liste des prix
+                médians, alignée sur `x`
+              - `y_count`: un dictionnaire associant à chaque genre la liste des
+                nombres d'items mis en vente, alignée sur `x`
+    """
+    # on calcule les axes de chaque corpus. un corpus vide n'a pas d'années.
+    with etape(rapport, "axes") as mesure:
+        axes_par_genre = {
+            genre: axes(corpus) if len(corpus) > 0 else ([], {}, {})
+            for genre, corpus in corpus_par_genre.items()
+        }
+        mesure["genres"] = len(axes_par_genre)
     
-    y_prix_roman = align_y_to_x(x, y_prix_roman)
-    y_count_roman = align_y_to_x(x, y_count_roman)
+    return aligner(axes_par_genre, rapport)
+
+
+def aligner(axes_par_genre, rapport=None):
+    """
+    aligner les axes de plusieurs corpus sur un axe des abscisses commun
+    (voir `matrice()`).
+    
+    :param axes_par_genre: un dictionnaire associant à chaque genre ses axes
+                           `x`, `y_prix`, `y_count`, tels que les renvoie `axes()`
+    :param rapport: un `Rapport` (voir `instrumentation.py`) où mesurer
+                    l'alignement, ou `None`
+    :returns: `x`, `y_prix` et `y_count`, comme `matrice()`
+    """
+    with etape(rapport, "alignement") as mesure:
+        # l'axe commun `x` va de la vente la plus ancienne à la plus récente, tous
+        # corpus confondus. on ne regarde que la première et la dernière année de
+        # chaque corpus, puisque ses années sont consécutives.
+        bornes = [ x_genre for x_genre, _, _ in axes_par_genre.values() if x_genre ]
+        if bornes:
+            x = list(range(min(x_genre[0] for x_genre in bornes), max(x_genre[-1] for x_genre in bornes) + 1))
+        else:
+            x = []
+        
+        y_prix = {}
+        y_count = {}
+        for genre, (x_genre, y_prix_genre, y_count_genre) in axes_par_genre.items():
+            colonne_prix = [0] * len(x)
+            colonne_count = [0] * len(x)
+            if x_genre:
+                # les dictionnaires de `axes()` sont dans l'ordre des années de `x_genre`
+                debut = x_genre[0] - x[0]
+                fin = debut + len(x_genre)
+                colonne_prix[debut:fin] = y_prix_genre.values()
+                colonne_count[debut:fin] = y_count_genre.values()
+            y_prix[genre] = colonne_prix
+            y_count[genre] = colonne_count
+        mesure["annees"] = len(x)
+    
+    return x, y_prix, y_count
+
+
+def figures_depuis_series(x, y_prix, y_count):
+    """
+    créer les deux graphiques plotly à partir des données préparées par `series()`
+    ou par `matrice()`. il y a une courbe par genre, dans l'ordre de `y_prix`.
     
+    :param x: l'axe des abscisses
+    :param y_prix: les prix médians de chaque genre, alignés sur `x`
+    :param y_count: les nombres d'items mis en vente de chaque genre, alignés sur `x`
+    :returns: `fig_prix` et `fig_count`
+    """
+    import plotly.graph_objects as go  # librairie pour générer des graphiques
     
     # on a maintenant un axe unique pour les abscisses (`x`) et plusieurs 
     # axes pour les ordonnées/y.
@@ -389,21 +746,22 @@ def visualize(corpus_idees, corpus_poeme, corpus_roman, corpus_theatre):
     # - l'autre qui analyse le nombre d'items vendus par genre littéraire
     #   et par an.
     
-    # d'abord, définit des couleurs et une mise en page pour nos graphiques. 
-    # celle-ci sera utilisée plus bas.
-    colors = {
-        "white": "#ffffff", "cream": "#fcf8f7", "blue": "#0000ef", 
-        "burgundy": "#890c0c", "pink": "#ff94c9", "gold": "#da9902", 
-        "lightgreen": "#8fc7b1", "darkgreen": "#00553e", "peach": "#ffad98"
-    }
-    layout = {
-        "paper_bgcolor": colors["white"],
-        "plot_bgcolor": colors["cream"],
-        "margin": {"l": 50, "r": 50, "t": 50, "b": 50},
-        "showlegend": True,
-        "xaxis": {"anchor": "x", "title": {"text": r"Année"}},
-        "barmode": "stack"
-    }
+    # d'abord, on reprend les couleurs et la mise en page définies plus haut
+    # (`COULEURS` et `MISE_EN_PAGE`). on copie la mise en page avec `dict()`,
+    # car on va la modifier.
+    colors = COULEURS
+    layout = dict(MISE_EN_PAGE)
+    
+    # le titre et la couleur de chaque genre
+    legendes = {}
+    autres = 0
+    for genre in y_prix:
+        if genre in GENRES_GRAPHIQUES:
+            titre, couleur = GENRES_GRAPHIQUES[genre]
+        else:
+            titre, couleur = f"Corpus {genre}", PALETTE[autres % len(PALETTE)]
+            autres += 1
+        legendes[genre] = (titre, colors[couleur])
     
     # d'abord, on crée le graphique sur le prix médian par genre.
     # d'abord, on crée des représentations graphiques pour les ordonnées. chaque
@@ -415,12 +773,7 @@ def visualize(corpus_idees, corpus_poeme, corpus_roman, corpus_theatre):
     #     [ "données 2", "titre 2", "couleur 2" ],
     #     ...
     # ]
-    corpus = [
-        [ y_prix_idees, "Corpus idées", colors["peach"] ]
-        , [ y_prix_theatre, "Corpus théâtre", colors["lightgreen"] ]
-        , [ y_prix_poeme, "Corpus poèmes", colors["pink"] ]
-        , [ y_prix_roman, "Corpus roman", colors["gold"] ]
-    ]
+    corpus = [ [ y_prix[genre], titre, couleur ] for genre, (titre, couleur) in legendes.items() ]
     ordonnees = []
     for axe in corpus:
         # on ajoute chacun de nos `y_prix_...` à notre liste d'axes `ordonnees`.
@@ -455,18 +808,12 @@ def visualize(corpus_idees, corpus_poeme, corpus_roman, corpus_theatre):
         data=ordonnees,
         layout=layout
     )
-    fig_prix.show()
     
     # ensuite, on crée le graphique pour le nombre d'items mis en vente par an et par genre.
     # là encore, il s'agit, à partir d'une liste `corpus` contenant les données
     # nécessaires (données, titre, couleurs) de créer une liste `ordonnees` avec nos axes
     # ensuite, on crée un objet `go.Figure()` contenant la figure elle-même.
-    corpus = [
-        [ y_count_idees, "Corpus idées", colors["peach"] ]
-        , [ y_count_theatre, "Corpus théâtre", colors["lightgreen"] ]
-        , [ y_count_poeme, "Corpus poèmes", colors["pink"] ]
-        , [ y_count_roman, "Corpus roman", colors["gold"] ]
-    ]
+    corpus = [ [ y_count[genre], titre, couleur ] for genre, (titre, couleur) in legendes.items() ]
     ordonnees = []
     for axe in corpus:
         # le processus est exactement le même qu'au dessus: pour chaque `axe`
@@ -499,47 +846,199 @@ def visualize(corpus_idees, corpus_poeme, corpus_roman, corpus_theatre):
         data=ordonnees,
         layout=layout
     )
-    fig_count.show()
     
-    # sauvegarder les fichiers
-    current_directory = os.path.abspath(os.path.dirname(__file__))  # le chemin du dossier où se trouve le fichier actuel
-    out_dir = os.path.join(current_directory, os.pardir, "out")  # le chemin du dossier de sortie
-    
-    if not os.path.isdir(out_dir):
-        os.makedirs(out_dir)
+    return fig_prix, fig_count
+
+
+def visualize(corpus_idees, corpus_poeme, corpus_roman, corpus_theatre, rapport=None,
+              interactif=True, formats=("png",), processus=1):
+    """
+    créer les graphiques des 4 corpus, les afficher et les enregistrer
+    dans le dossier `out/`. voir `visualiser_genres()`.
     
-    print(os.path.join(out_dir, "prix_median_par_an.png"))
+    :param: en paramètre, tous les corpus exprimés en formats structurés.
+    :returns: rien.
+    """
+    visualiser_genres({
+        "idees": corpus_idees,
+        "theatre": corpus_theatre,
+        "poeme": corpus_poeme,
+        "roman": corpus_roman
+    }, rapport, interactif, formats, processus)
+
+
+def visualiser_genres(corpus_par_genre, rapport=None, interactif=True, formats=("png",), processus=1):
+    """
+    créer les graphiques d'un nombre quelconque de corpus, les afficher et les
+    enregistrer dans le dossier `out/`.
     
-    fig_prix.write_image(os.path.join(out_dir, "prix_median_par_an.png"))
-    fig_count.write_image(os.path.join(out_dir, "nombre_items_par_an.png"))
+    :param corpus_par_genre: un dictionnaire associant à chaque genre son corpus
+                             structuré, dans l'ordre des courbes des graphiques
+    :param rapport: un `Rapport` (voir `instrumentation.py`) où mesurer
+                    chaque étape, ou `None`
+    :param interactif: si `False`, les graphiques ne sont pas affichés mais
+                       seulement enregistrés (mode "sans affichage", pour un
+                       serveur ou un traitement par lots)
+    :param formats: les formats des fichiers à enregistrer (voir `rendu.py`):
+                    `png`, `svg`, `pdf`..., `html` ou `json`
+    :param processus: le nombre de processus entre lesquels répartir les images
+    :returns: rien.
+    """
+    x, y_prix, y_count = matrice(corpus_par_genre, rapport)
+    visualiser_series(x, y_prix, y_count, rapport, interactif, formats, processus)
+
+
+def visualiser_series(x, y_prix, y_count, rapport=None, interactif=True, formats=("png",), processus=1):
+    """
+    créer les graphiques à partir des données préparées par `matrice()` ou
+    `aligner()`, les afficher et les enregistrer dans le dossier `out/`.
+    les paramètres sont ceux de `visualiser_genres()`.
+    """
+    with etape(rapport, "rendu") as mesure:
+        # les figures ne sont créées que si on en a besoin: pour les afficher,
+        # ou si elles ne sont pas dans le cache des graphiques.
+        figures_creees = {}
+        def construire():
+            if not figures_creees:
+                fig_prix, fig_count = figures_depuis_series(x, y_prix, y_count)
+                figures_creees["prix_median_par_an"] = fig_prix
+                figures_creees["nombre_items_par_an"] = fig_count
+            return figures_creees
+        
+        if interactif:
+            for figure in construire().values():
+                figure.show()
+        
+        # sauvegarder les fichiers dans `out/`. `exporter_cache()` (voir `rendu.py`)
+        # crée toutes les images avec un seul exportateur, au lieu d'appeler
+        # `write_image()` pour chaque figure. si les données, la mise en page et
+        # les couleurs n'ont pas changé depuis la dernière exécution, les images
+        # déjà créées sont réutilisées.
+        # `cle_rendu()` trie les clés des dictionnaires: on ajoute la liste des genres
+        # pour que l'ordre des courbes fasse partie de la clé. `empreinte_rendu()`
+        # ajoute le code de `figures_depuis_series()` et les versions de plotly et kaleido.
+        cle = cle_rendu(
+            VERSION_FIGURES, empreinte_rendu(figures_depuis_series),
+            x, list(y_prix), y_prix, y_count, COULEURS, MISE_EN_PAGE, GENRES_GRAPHIQUES, PALETTE
+        )
+        chemins, mesure["cache"] = exporter_cache(
+            cle,
+            construire,
+            ("prix_median_par_an", "nombre_items_par_an"),
+            formats=formats,
+            processus=processus
+        )
+        for chemin in chemins:
+            print(chemin)
+        mesure["fichiers"] = len(chemins)
     
     return
 
 
-def pipeline():
+def ordre_graphiques(genres):
+    """
+    :param genres: des genres, par exemple ceux de `genres_disponibles()`
+    :returns: les genres de `GENRES_GRAPHIQUES` d'abord, dans l'ordre des graphiques,
+              puis les autres, dans l'ordre de `genres`
+    """
+    return [ genre for genre in GENRES_GRAPHIQUES if genre in genres ] \
+           + [ genre for genre in genres if genre not in GENRES_GRAPHIQUES ]
+
+
+def pipeline(instrumenter=True, profilage=False, interactif=True, formats=("png",), base=None, incremental=False):
     """
     fonction décrivant le processus global de traitement
     et analyse du texte.
+    
+    :param instrumenter: si `True`, mesurer chaque étape et enregistrer un
+                         rapport JSON dans `out/instrumentation/` (voir
+                         `instrumentation.py`)
+    :param profilage: si `True`, activer aussi `cProfile` pendant les étapes
+    :param interactif: si `False`, enregistrer les graphiques sans les afficher
+    :param formats: les formats des graphiques enregistrés (voir `rendu.py`)
+    :param base: le chemin d'une base SQLite (voir `base_donnees.py`), ou `""` pour
+                 la base par défaut. si elle est donnée, les graphiques sont créés à partir de son résumé par genre
+                 et par année, sans lire les catalogues texte.
+    :param incremental: si `True`, ne lire que les entrées ajoutées à la fin des catalogues
+                        depuis la dernière exécution (voir `incremental.py`)
     """
-    # lire les fichiers et stocker leur contenu dans une variable
-    corpus_idees = read_text("idees")
-    corpus_poeme = read_text("poeme")
-    corpus_roman = read_text("roman")
-    corpus_theatre = read_text("theatre")
+    from concurrent.futures import ProcessPoolExecutor  # pour faire plusieurs calculs en même temps, sur plusieurs processeurs
+    
+    rapport = Rapport("fouille_texte", profilage=profilage) if instrumenter else None
+    
+    # avec une base, le résumé précalculé suffit: on ne lit aucune entrée.
+    if base is not None:
+        from base_donnees import BaseCatalogues
+        with etape(rapport, "lecture_base") as mesure:
+            with BaseCatalogues(base) as catalogues:
+                axes_par_genre = { genre: catalogues.axes(genre) for genre in ordre_graphiques(catalogues.genres()) }
+            mesure["genres"] = len(axes_par_genre)
+        x, y_prix, y_count = aligner(axes_par_genre, rapport)
+        visualiser_series(x, y_prix, y_count, rapport, interactif, formats)
+        if rapport is not None:
+            print(rapport.enregistrer())
+        return
+    
+    # on traite tous les catalogues de `in/`
+    genres = ordre_graphiques(genres_disponibles())
     
-    # transformer les fichiers en documents structurés
-    corpus_idees = structure(corpus_idees)
-    corpus_poeme = structure(corpus_poeme)
-    corpus_roman = structure(corpus_roman)
-    corpus_theatre = structure(corpus_theatre)
+    # en mode incrémental, on ne lit que la fin de chaque catalogue: les axes
+    # sont mis à jour à partir de l'état enregistré à l'exécution précédente.
+    if incremental:
+        from incremental import axes_incremental
+        with etape(rapport, "lecture_incrementale") as mesure:
+            axes_par_genre = { genre: axes_incremental(genre) for genre in genres }
+            mesure["genres"] = len(axes_par_genre)
+        x, y_prix, y_count = aligner(axes_par_genre, rapport)
+        visualiser_series(x, y_prix, y_count, rapport, interactif, formats)
+        if rapport is not None:
+            print(rapport.enregistrer())
+        return
+    
+    # lire les fichiers et les transformer en documents structurés.
+    # `structure_cache()` fait la même chose que `read_text()` puis `structure()`,
+    # mais garde le résultat dans un cache: si un fichier n'a pas changé depuis
+    # la dernière exécution, il n'est pas restructuré.
+    
+    # les genres sont traités en même temps, chacun dans un processus différent:
+    # `executeur.map()` appelle `structure_cache_mesuree()` pour chaque genre et
+    # renvoie les résultats dans l'ordre des genres.
+    # la lecture et la structuration ont lieu dans les autres processus: chacun
+    # mesure ses deux étapes et renvoie ses mesures avec le corpus. on les
+    # ajoute au rapport comme des étapes contenues dans `lecture_structure`,
+    # en additionnant les temps des différents processus.
+    with etape(rapport, "lecture_structure") as mesure:
+        with ProcessPoolExecutor() as executeur:
+            resultats = list(executeur.map(structure_cache_mesuree, genres))
+        corpus_par_genre = { genre: corpus for genre, (corpus, _) in zip(genres, resultats) }
+        mesure["entrees"] = sum(len(corpus) for corpus in corpus_par_genre.values())
+        mesure["champs"] = compter_champs(*corpus_par_genre.values())
+    if rapport is not None:
+        mesures = [ mesures_genre for _, mesures_genre in resultats ]
+        genres_structures = sum(1 for mesures_genre in mesures if not mesures_genre["cache"])
+        rapport.ajouter(
+            "lecture", parent="lecture_structure",
+            secondes=sum(mesures_genre["lecture_secondes"] for mesures_genre in mesures),
+            genres=len(genres), genres_depuis_cache=len(genres) - genres_structures
+        )
+        rapport.ajouter(
+            "structure", parent="lecture_structure",
+            secondes=sum(mesures_genre["structure_secondes"] for mesures_genre in mesures),
+            genres=genres_structures,
+            entrees=sum(len(corpus) for corpus, mesures_genre in resultats if not mesures_genre["cache"])
+        )
     
     # créer + sauvegarder les visualisations
-    visualize(corpus_idees, corpus_poeme, corpus_roman, corpus_theatre)
+    visualiser_genres(corpus_par_genre, rapport, interactif, formats)
+    
+    if rapport is not None:
+        print(rapport.enregistrer())
     
     return
 
 
 if __name__ == "__main__":
-    pipeline()
+    # `python fouille_texte.py --profilage` active `cProfile`
+    pipeline(profilage="--profilage" in sys.argv)
     
     
@@ -0,0 +1,110 @@
+import random
+import os
+
+from creation_corpus import value_to_text
+from fouille_texte import genres_disponibles, read_text, structure
+
+
+# *************************************************************
+# dans ce script, on crée des catalogues *synthétiques*: des
+# faux catalogues, aussi grands qu'on le souhaite, écrits
+# exactement dans le format produit par `make_text()` (dans
+# `creation_corpus.py`).
+#
+# les catalogues fournis dans `in/` sont petits (quelques
+# centaines d'entrées). pour mesurer la vitesse du code sur de
+# gros corpus (voir `benchmark.py`), on fabrique des entrées
+# réalistes à partir des vraies: mêmes auteur.ice.s, mêmes
+# descriptions, mêmes proportions de dates et de prix manquants.
+#
+# crédits:
+# - code: Paul Kervegan, 2023. code sous licence `GNU GPLv3.0`
+# *************************************************************
+
+
+# proportion d'entrées sans date d'écriture et sans prix
+PROPORTION_SANS_DATE = 0.45
+PROPORTION_SANS_PRIX = 0.4
+
+# nombre d'entrées écrites à la fois dans le fichier
+TAILLE_LOT = 10000
+
+# version du générateur: à augmenter à chaque changement des entrées produites, pour
+# que les catalogues synthétiques déjà créés (voir `benchmark.py`) ne soient plus utilisés
+VERSION_GENERATEUR = 1
+
+
+def modeles(genres=None):
+    """
+    récupérer dans les catalogues de `in/` les auteur.ice.s et les
+    descriptions qui serviront à créer les entrées synthétiques.
+
+    :param genres: les genres des catalogues à utiliser. par défaut, tous les catalogues de `in/`
+    :returns: la liste des auteur.ice.s et la liste des descriptions
+    """
+    if genres is None:
+        genres = genres_disponibles()
+    auteurs = []
+    descriptions = []
+    for genre in genres:
+        for entree in structure(read_text(genre)):
+            auteurs.append(entree["auteur"])
+            descriptions.append(entree["description"])
+    return auteurs, descriptions
+
+
+def entree_synthetique(generateur, auteurs, descriptions):
+    """
+    créer une entrée au format des données de l'API Katabase, comme celles
+    que reçoit `value_to_text()`.
+
+    :param generateur: un générateur de nombres aléatoires (`random.Random`)
+    :param auteurs: les auteur.ice.s possibles
+    :param descriptions: les descriptions possibles
+    :returns: l'entrée, sous la forme d'un dictionnaire
+    """
+    date = None
+    if generateur.random() >= PROPORTION_SANS_DATE:
+        date = f"{generateur.randint(1700, 1810)}-{generateur.randint(1, 12):02d}-{generateur.randint(1, 28):02d}"
+    prix = None
+    prix_constant = None
+    if generateur.random() >= PROPORTION_SANS_PRIX:
+        prix = float(generateur.choice((5, 10, 12, 15, 20, 25, 30, 40, 50, 60, 80, 100, 150, 200, 400)))
+        prix_constant = round(prix * generateur.uniform(0.9, 1.3), 2)
+    return {
+        "author": generateur.choice(auteurs),
+        "date": date,
+        "sell_date": generateur.randint(1850, 1910),
+        "number_of_pages": generateur.choice((0.25, 0.5, 0.75, 1.0, 1.25, 1.5, 2.0, 3.0, 4.0, 8.0)),
+        "desc": generateur.choice(descriptions),
+        "price": prix,
+        "currency": "FRF",
+        "price_c": prix_constant
+    }
+
+
+def generer_catalogue(chemin, nombre, graine=0):
+    """
+    écrire un catalogue synthétique de `nombre` entrées dans `chemin`. le
+    fichier est écrit par lots: on ne garde jamais tout le catalogue en mémoire.
+
+    :param chemin: le chemin du fichier à créer
+    :param nombre: le nombre d'entrées
+    :param graine: la graine du générateur aléatoire: une même graine donne
+                   toujours le même catalogue
+    """
+    generateur = random.Random(graine)
+    auteurs, descriptions = modeles()
+
+    dossier = os.path.dirname(os.path.abspath(chemin))
+    if not os.path.isdir(dossier):
+        os.makedirs(dossier)
+
+    # même mode d'ouverture que `make_text()`
+    with open(chemin, mode="w+") as fh:
+        for debut in range(0, nombre, TAILLE_LOT):
+            lot = min(TAILLE_LOT, nombre - debut)
+            fh.write("".join(
+                value_to_text(entree_synthetique(generateur, auteurs, descriptions))
+                for _ in range(lot)
+            ))
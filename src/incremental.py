@@ -0,0 +1,240 @@
+from array import array  # des listes de nombres compactes, enregistrables en binaire
+import hashlib
+import mmap  # pour "projeter" un fichier en mémoire sans le lire entièrement
+import json
+import os
+
+from agregation import mediane
+from cache import DOSSIER_CACHE
+from fouille_texte import VERSION_ANALYSEUR, chemin_catalogue
+from lecture_mmap import iter_structure_plage
+
+
+# *************************************************************
+# dans ce script, on met à jour les données de `axes()` sans
+# relire tout un catalogue quand de nouvelles ventes y ont été
+# ajoutées.
+#
+# les catalogues ne font que grandir: de nouvelles entrées sont
+# ajoutées à la fin du fichier. on enregistre donc, pour chaque
+# genre, un *état*:
+# - la position (en octets) de la fin de la dernière entrée lue
+# - la position du début de cette entrée et son empreinte (hash),
+#   pour vérifier au prochain passage que le début du fichier n'a
+#   pas changé
+# - pour chaque année de vente: le nombre de ventes, le nombre de
+#   prix et le prix médian.
+# les prix constants de chaque année sont enregistrés à part, dans
+# un fichier binaire par année (`cache/incremental/<genre>/<année>.prix`),
+# sous la forme d'un `array("d")`: 8 octets par prix.
+#
+# au passage suivant, on ne lit que la fin du fichier, à partir
+# de la position enregistrée, en projetant le fichier en mémoire
+# avec `mmap` (voir `lecture_mmap.py`). les prix des nouvelles
+# entrées sont *ajoutés* à la fin des fichiers de leur année, et
+# on ne recalcule la médiane que des années qui ont changé: un
+# passage qui ajoute 10 entrées ne relit et ne réécrit presque rien.
+# si le fichier a été modifié ailleurs qu'à la fin, on recommence
+# depuis le début.
+#
+# seules les entrées suivies d'un séparateur `\n\n\n` sont lues:
+# une entrée en cours d'écriture à la fin du fichier sera lue au
+# prochain passage. `make_text()` termine toujours ses entrées
+# par un séparateur.
+#
+# crédits:
+# - code: Paul Kervegan, 2023. code sous licence `GNU GPLv3.0`
+# *************************************************************
+
+
+# le dossier où sont enregistrés les états
+DOSSIER_ETAT = os.path.join(DOSSIER_CACHE, "incremental")
+
+# la version du format des états: un état d'un autre format est ignoré
+FORMAT_ETAT = 2
+
+
+def axes_incremental(genre, dossier=DOSSIER_ETAT):
+    """
+    calculer les axes de `axes()` pour le corpus du genre `genre`, en ne
+    lisant que les entrées ajoutées depuis le dernier appel.
+
+    :param genre: le genre du corpus
+    :param dossier: le dossier où sont enregistrés les états
+    :returns: `x`, `y_prix`, `y_count`, comme `axes()`
+    """
+    etat = ingerer(chemin_catalogue(genre), os.path.join(dossier, f"{genre}.json"))
+    return axes_depuis_etat(etat)
+
+
+def ingerer(chemin, fichier_etat):
+    """
+    mettre à jour l'état enregistré dans `fichier_etat` avec les entrées
+    ajoutées à la fin du catalogue `chemin`, puis enregistrer le nouvel état.
+
+    :param chemin: le chemin du catalogue
+    :param fichier_etat: le chemin du fichier où est enregistré l'état. les prix
+                         sont enregistrés dans le dossier du même nom, sans `.json`
+    :returns: l'état mis à jour
+    """
+    etat = charger_etat(fichier_etat)
+    dossier_prix = os.path.splitext(fichier_etat)[0]
+
+    with open(chemin, mode="rb") as fh:
+        taille = os.fstat(fh.fileno()).st_size
+        if not _prefixe_inchange(fh, etat, taille):
+            etat = etat_vide()
+        # on ne peut pas projeter un fichier vide en mémoire
+        if taille == 0:
+            return etat
+
+        with mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as tampon:
+            # on ne lit que la fin du fichier, à partir de la dernière position connue.
+            # on s'arrête au dernier séparateur. comme dans `parallele.decouper_plages()`,
+            # on recule jusqu'au début de la suite de retours à la ligne qui le contient,
+            # pour couper exactement comme `.split("\n\n\n")`.
+            position = etat["position"]
+            separateur = tampon.rfind(b"\n\n\n", position, taille)
+            if separateur == -1:
+                return etat
+            while separateur > position and tampon[separateur - 1] == ord("\n"):
+                separateur -= 1
+            fin = separateur + 3
+
+            # on range les nouvelles entrées par année
+            nouveaux = {}
+            for entree in iter_structure_plage(tampon, position, separateur):
+                annee = str(entree["date_vente"])
+                donnees = etat["annees"].setdefault(annee, {"nombre": 0, "nombre_prix": 0, "mediane": 0})
+                donnees["nombre"] += 1
+                if entree["prix_constant"] != "":
+                    nouveaux.setdefault(annee, array("d")).append(entree["prix_constant"])
+
+            # on retient la position et l'empreinte de la dernière entrée lue
+            debut_derniere = tampon.rfind(b"\n\n\n", position, separateur)
+            debut_derniere = position if debut_derniere == -1 else debut_derniere + 3
+            etat["debut_derniere"] = debut_derniere
+            etat["empreinte_derniere"] = hashlib.sha256(tampon[debut_derniere:fin]).hexdigest()
+            etat["position"] = fin
+
+    # on ajoute les nouveaux prix aux fichiers de leur année, et on recalcule
+    # la médiane de ces années seulement
+    for annee, prix in nouveaux.items():
+        donnees = etat["annees"][annee]
+        tous_les_prix = ajouter_prix(os.path.join(dossier_prix, f"{annee}.prix"), donnees["nombre_prix"], prix)
+        donnees["nombre_prix"] = len(tous_les_prix)
+        donnees["mediane"] = mediane(sorted(tous_les_prix))
+
+    enregistrer_etat(etat, fichier_etat)
+    return etat
+
+
+def ajouter_prix(fichier_prix, nombre, prix):
+    """
+    ajouter des prix à la fin du fichier binaire d'une année.
+
+    seuls les `nombre` premiers prix du fichier sont valides: ce sont ceux
+    que compte l'état enregistré. si un passage précédent a été interrompu
+    après avoir écrit des prix mais avant d'enregistrer l'état, ces prix
+    en trop sont effacés avant d'ajouter les nouveaux.
+
+    :param fichier_prix: le chemin du fichier de l'année
+    :param nombre: le nombre de prix valides dans le fichier
+    :param prix: les prix à ajouter, un `array("d")`
+    :returns: tous les prix de l'année, un `array("d")`
+    """
+    dossier = os.path.dirname(fichier_prix)
+    if not os.path.isdir(dossier):
+        os.makedirs(dossier)
+    tous_les_prix = array("d")
+    with open(fichier_prix, mode="r+b" if os.path.isfile(fichier_prix) else "w+b") as fh:
+        tous_les_prix.fromfile(fh, nombre)
+        fh.truncate(nombre * tous_les_prix.itemsize)
+        prix.tofile(fh)
+    tous_les_prix.extend(prix)
+    return tous_les_prix
+
+
+def axes_depuis_etat(etat):
+    """
+    traduire un état en axes identiques à ceux de `axes()`.
+
+    :param etat: un état produit par `ingerer()`
+    :returns: `x`, `y_prix`, `y_count`. un catalogue vide n'a pas d'années: `[], {}, {}`
+    """
+    annees = { int(annee): donnees for annee, donnees in etat["annees"].items() }
+    if not annees:
+        return [], {}, {}
+    x = list(range(min(annees), max(annees) + 1))
+    y_prix = {}
+    y_count = {}
+    for annee in x:
+        donnees = annees.get(annee, {"nombre": 0, "mediane": 0})
+        y_prix[annee] = donnees["mediane"]
+        y_count[annee] = donnees["nombre"]
+    return x, y_prix, y_count
+
+
+def etat_vide():
+    """
+    :returns: l'état d'un catalogue dont on n'a encore rien lu
+    """
+    return {
+        "format": FORMAT_ETAT,
+        "version": VERSION_ANALYSEUR,
+        "position": 0,
+        "debut_derniere": 0,
+        "empreinte_derniere": hashlib.sha256(b"").hexdigest(),
+        "annees": {}
+    }
+
+
+def charger_etat(fichier_etat):
+    """
+    :param fichier_etat: le chemin du fichier où est enregistré l'état
+    :returns: l'état enregistré, ou un état vide
+    """
+    if not os.path.isfile(fichier_etat):
+        return etat_vide()
+    with open(fichier_etat, mode="r", encoding="utf-8") as fh:
+        etat = json.load(fh)
+    if etat.get("version") != VERSION_ANALYSEUR or etat.get("format") != FORMAT_ETAT:
+        return etat_vide()
+    # si un fichier de prix a disparu ou a été raccourci, on recommence depuis le début
+    dossier_prix = os.path.splitext(fichier_etat)[0]
+    for annee, donnees in etat["annees"].items():
+        fichier_prix = os.path.join(dossier_prix, f"{annee}.prix")
+        if donnees["nombre_prix"] and (
+            not os.path.isfile(fichier_prix) or os.path.getsize(fichier_prix) < donnees["nombre_prix"] * array("d").itemsize
+        ):
+            return etat_vide()
+    return etat
+
+
+def enregistrer_etat(etat, fichier_etat):
+    """
+    :param etat: l'état à enregistrer. il ne contient que quelques nombres par
+                 année: l'enregistrer ne dépend pas de la taille du corpus.
+    :param fichier_etat: le chemin du fichier où enregistrer l'état
+    """
+    dossier = os.path.dirname(fichier_etat)
+    if not os.path.isdir(dossier):
+        os.makedirs(dossier)
+    fichier_temporaire = f"{fichier_etat}.{os.getpid()}.tmp"
+    with open(fichier_temporaire, mode="w", encoding="utf-8") as fh:
+        json.dump(etat, fh)
+    os.replace(fichier_temporaire, fichier_etat)
+
+
+def _prefixe_inchange(fh, etat, taille):
+    """
+    vérifier que la partie du fichier déjà lue n'a pas changé: le fichier
+    ne doit pas avoir rétréci, et la dernière entrée lue doit avoir la même
+    empreinte qu'au passage précédent.
+    """
+    if taille < etat["position"]:
+        return False
+    fh.seek(etat["debut_derniere"])
+    derniere = fh.read(etat["position"] - etat["debut_derniere"])
+    return hashlib.sha256(derniere).hexdigest() == etat["empreinte_derniere"]
+
@@ -0,0 +1,288 @@
+from array import array
+from bisect import bisect_left
+from itertools import accumulate, chain, repeat
+from operator import rshift, sub
+import unicodedata  # pour supprimer les accents
+import pickle
+import os
+import re
+
+from corpus import Corpus, ANNEE_MANQUANTE
+from fouille_texte import chemin_catalogue, genres_disponibles, structure_cache
+
+
+# *************************************************************
+# dans ce script, on construit un *index inversé* des descriptions
+# des entrées, pour y chercher des mots rapidement.
+#
+# un index inversé fonctionne comme l'index à la fin d'un livre:
+# pour chaque mot, on note la liste des entrées (et la position
+# du mot dans chaque entrée) où il apparaît. pour trouver les
+# entrées qui contiennent un mot, il suffit de lire sa liste, au
+# lieu de parcourir toutes les descriptions.
+#
+# - les mots sont *normalisés*: en minuscules et sans accents.
+#   "Très" et "tres" sont donc le même mot.
+# - les listes sont compactes: on stocke les numéros d'entrées
+#   dans un `array` d'entiers, et pour chaque numéro on ne garde
+#   que l'écart avec le numéro précédent (ces écarts sont petits).
+# - on peut chercher un mot (`lettre`), un début de mot (`autogr*`)
+#   ou une expression entre guillemets (`"p. in-4"`), et filtrer
+#   par genre, par auteur.ice et par année de vente.
+#
+# crédits:
+# - code: Paul Kervegan, 2023. code sous licence `GNU GPLv3.0`
+# *************************************************************
+
+
+# table pour `.translate()` qui supprime les accents (les "diacritiques combinants",
+# entre les caractères U+0300 et U+036F)
+SANS_ACCENTS = dict.fromkeys(range(0x300, 0x370))
+
+# un mot: une suite de lettres ou de chiffres
+MOTIF_MOT = re.compile(r"\w+")
+
+# une requête: une expression entre guillemets, ou un mot suivi ou non de `*`
+MOTIF_REQUETE = re.compile(r'"([^"]*)"|(\w+)(\*?)')
+
+# une occurrence est codée `numero << DECALAGE | position`: la position d'un mot
+# dans une description tient donc sur 16 bits
+DECALAGE = 16
+POSITION_MAX = (1 << DECALAGE) - 1
+
+# version du format de l'index: un index enregistré dans une autre version est reconstruit
+VERSION_INDEX = 1
+
+# le dossier où sont enregistrés les index, à côté des catalogues
+DOSSIER_INDEX = os.path.join(os.path.abspath(os.path.dirname(__file__)), os.pardir, "in")
+
+
+def normaliser(texte):
+    """
+    mettre un texte en minuscules et supprimer ses accents.
+
+    `unicodedata.normalize("NFD", ...)` décompose chaque lettre accentuée
+    en une lettre suivie d'un accent ("é" devient "e" + "´"). il suffit
+    ensuite de supprimer les accents avec `.translate()`.
+
+    :param texte: le texte à normaliser
+    :returns: le texte normalisé
+    """
+    return unicodedata.normalize("NFD", texte).translate(SANS_ACCENTS).casefold()
+
+
+def mots(texte):
+    """
+    :param texte: un texte
+    :returns: la liste des mots normalisés du texte
+    """
+    return MOTIF_MOT.findall(normaliser(texte))
+
+
+class IndexTexte:
+    """
+    un index inversé des descriptions d'un `Corpus`.
+
+    >>> index = IndexTexte(corpus)
+    >>> index.chercher('"lettre autographe" rousseau*', genre="idees", annee_min=1870)
+    [12, 57, ...]  # les positions des entrées dans `corpus`
+
+    pour chaque mot, l'index garde un `array` avec un nombre par occurrence
+    du mot. ce nombre réunit le numéro de l'entrée et la position du mot dans
+    la description: `numero * 65536 + position` (soit `numero << 16 | position`).
+    les nombres sont triés et on ne stocke que l'écart entre deux nombres
+    successifs, qui est petit.
+    """
+
+    def __init__(self, corpus):
+        """
+        :param corpus: le `Corpus` à indexer
+        """
+        occurrences = {}  # mot => array des occurrences, `numero << 16 | position`
+        for numero in range(len(corpus)):
+            base = numero << DECALAGE
+            # on ne garde que les 65536 premiers mots d'une description
+            for position, mot in enumerate(mots(corpus.description(numero))[:POSITION_MAX + 1]):
+                liste = occurrences.get(mot)
+                if liste is None:
+                    liste = occurrences[mot] = array("Q")
+                liste.append(base | position)
+
+        # on remplace chaque occurrence par l'écart avec l'occurrence précédente.
+        # `map(sub, a, b)` calcule `a[i] - b[i]` pour chaque `i`. si tous les écarts
+        # tiennent sur 32 bits, on les range dans un `array` de type `"I"` (4 octets
+        # par nombre) au lieu de `"Q"` (8 octets).
+        self.postings = {}
+        for mot, liste in occurrences.items():
+            ecarts = list(map(sub, liste, chain((0,), liste)))
+            self.postings[mot] = array("I" if max(ecarts) < 1 << 32 else "Q", ecarts)
+        self.vocabulaire = sorted(self.postings)  # trié, pour chercher les débuts de mots
+
+        # les colonnes utilisées pour filtrer les résultats
+        self.version = VERSION_INDEX
+        self.nombre_entrees = len(corpus)
+        self.genre = corpus.genre
+        self.valeurs_genre = corpus.valeurs_genre
+        self.auteur = corpus.auteur
+        self.valeurs_auteur = [ normaliser(auteur) for auteur in corpus.valeurs_auteur ]
+        self.date_vente = corpus.date_vente
+
+    def occurrences(self, mot):
+        """
+        :param mot: un mot normalisé
+        :returns: un itérateur sur les occurrences du mot (`numero << 16 | position`)
+        """
+        # `accumulate()` additionne les écarts pour retrouver les occurrences
+        return accumulate(self.postings.get(mot, ()))
+
+    def mot(self, mot):
+        """
+        :param mot: un mot, normalisé ou non
+        :returns: l'ensemble des entrées qui contiennent ce mot
+        """
+        return _numeros(self.occurrences(normaliser(mot)))
+
+    def prefixe(self, prefixe):
+        """
+        :param prefixe: un début de mot, normalisé ou non
+        :returns: l'ensemble des entrées qui contiennent un mot commençant par `prefixe`
+        """
+        prefixe = normaliser(prefixe)
+        resultat = set()
+        # le vocabulaire est trié: les mots qui commencent par `prefixe` se suivent
+        i = bisect_left(self.vocabulaire, prefixe)
+        while i < len(self.vocabulaire) and self.vocabulaire[i].startswith(prefixe):
+            resultat |= _numeros(self.occurrences(self.vocabulaire[i]))
+            i += 1
+        return resultat
+
+    def phrase(self, phrase):
+        """
+        :param phrase: une suite de mots, normalisés ou non
+        :returns: l'ensemble des entrées qui contiennent ces mots, dans cet ordre
+                  et les uns à la suite des autres
+        """
+        liste_mots = mots(phrase)
+        if not liste_mots:
+            return set()
+        # pour chaque mot, à la position `i` de l'expression, on recule chaque
+        # occurrence de `i` positions: les occurrences qui coïncident pour tous
+        # les mots sont des débuts d'expression. on commence par le mot le plus
+        # rare, pour que l'ensemble `suites` soit le plus petit possible.
+        ordre = sorted(enumerate(liste_mots), key=lambda paire: len(self.postings.get(paire[1], ())))
+        decalage, mot = ordre[0]
+        suites = set(map(sub, self.occurrences(mot), repeat(decalage)))
+        for decalage, mot in ordre[1:]:
+            if not suites:
+                break
+            suites.intersection_update(map(sub, self.occurrences(mot), repeat(decalage)))
+        return _numeros(suites)
+
+    def chercher(self, requete, genre=None, auteur=None, annee_min=None, annee_max=None):
+        """
+        chercher les entrées qui correspondent à tous les éléments de `requete`:
+        - `mot`: les entrées qui contiennent ce mot
+        - `debut*`: les entrées qui contiennent un mot commençant par `debut`
+        - `"une expression"`: les entrées qui contiennent cette expression
+
+        :param requete: la requête, par exemple `'"lettre autographe" rousseau*'`
+        :param genre: ne garder que les entrées de ce genre
+        :param auteur: ne garder que les entrées de cet.te auteur.ice (sans tenir
+                       compte des majuscules et des accents)
+        :param annee_min: ne garder que les entrées vendues cette année ou après
+        :param annee_max: ne garder que les entrées vendues cette année ou avant
+        :returns: la liste triée des positions des entrées dans le corpus
+        """
+        ensembles = []
+        for expression, mot, etoile in MOTIF_REQUETE.findall(requete):
+            if expression:
+                ensembles.append(self.phrase(expression))
+            elif etoile:
+                ensembles.append(self.prefixe(mot))
+            else:
+                ensembles.append(self.mot(mot))
+
+        if ensembles:
+            # on commence par le plus petit ensemble: les intersections sont plus rapides
+            ensembles.sort(key=len)
+            resultat = ensembles[0].intersection(*ensembles[1:])
+        else:
+            resultat = range(self.nombre_entrees)
+
+        if genre is not None:
+            codes = { code for code, valeur in enumerate(self.valeurs_genre) if valeur == genre }
+            resultat = [ entree for entree in resultat if self.genre[entree] in codes ]
+        if auteur is not None:
+            auteur = normaliser(auteur)
+            codes = { code for code, valeur in enumerate(self.valeurs_auteur) if valeur == auteur }
+            resultat = [ entree for entree in resultat if self.auteur[entree] in codes ]
+        if annee_min is not None or annee_max is not None:
+            annee_min = -32768 if annee_min is None else annee_min
+            annee_max = 32767 if annee_max is None else annee_max
+            resultat = [
+                entree for entree in resultat
+                if self.date_vente[entree] != ANNEE_MANQUANTE and annee_min <= self.date_vente[entree] <= annee_max
+            ]
+        return sorted(resultat)
+
+    def enregistrer(self, chemin):
+        """
+        :param chemin: le chemin du fichier où enregistrer l'index
+        """
+        fichier_temporaire = f"{chemin}.{os.getpid()}.tmp"
+        with open(fichier_temporaire, mode="wb") as fh:
+            pickle.dump(self, fh, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(fichier_temporaire, chemin)
+
+    @staticmethod
+    def charger(chemin):
+        """
+        :param chemin: le chemin d'un index enregistré avec `enregistrer()`
+        :returns: l'index
+        """
+        with open(chemin, mode="rb") as fh:
+            return pickle.load(fh)
+
+
+def index_catalogues(genres=None, dossier=DOSSIER_INDEX):
+    """
+    construire l'index des catalogues de tous les genres et l'enregistrer
+    dans `in/index_texte.pickle`. si l'index existe déjà et qu'aucun catalogue
+    n'a été modifié depuis, on le recharge simplement.
+
+    les numéros renvoyés par `IndexTexte.chercher()` sont les positions des
+    entrées dans le `Corpus` renvoyé, qui réunit les genres dans l'ordre de `genres`.
+
+    :param genres: les genres à indexer. par défaut, tous les catalogues de `in/`
+    :param dossier: le dossier où enregistrer l'index
+    :returns: l'index et le `Corpus` indexé
+    """
+    if genres is None:
+        genres = genres_disponibles()
+    corpus = Corpus()
+    for genre in genres:
+        corpus.etendre(structure_cache(genre))
+
+    chemin = os.path.join(dossier, "index_texte.pickle")
+    if os.path.isfile(chemin):
+        date_index = os.path.getmtime(chemin)
+        if all(os.path.getmtime(chemin_catalogue(genre)) < date_index for genre in genres):
+            index = IndexTexte.charger(chemin)
+            if (
+                getattr(index, "version", None) == VERSION_INDEX
+                and index.nombre_entrees == len(corpus)
+                and index.valeurs_genre == corpus.valeurs_genre
+            ):
+                return index, corpus
+
+    index = IndexTexte(corpus)
+    index.enregistrer(chemin)
+    return index, corpus
+
+
+def _numeros(occurrences):
+    """
+    :param occurrences: des occurrences codées `numero << 16 | position`
+    :returns: l'ensemble des numéros d'entrée de ces occurrences
+    """
+    return set(map(rshift, occurrences, repeat(DECALAGE)))
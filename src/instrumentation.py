@@ -0,0 +1,294 @@
+from contextlib import contextmanager  # pour créer des blocs `with ...:`
+import tracemalloc  # pour mesurer la mémoire allouée par python
+import datetime
+import platform
+import json
+import math
+import time
+import sys
+import os
+
+try:
+    import resource  # mémoire utilisée par le processus. n'existe pas sous Windows
+except ImportError:
+    resource = None
+
+from corpus import Corpus, ANNEE_MANQUANTE
+
+
+# *************************************************************
+# dans ce script, on mesure ce que fait chaque étape des
+# fonctions `pipeline()` de `fouille_texte.py` et de
+# `creation_corpus.py`: requêtes HTTP, nettoyage et écriture,
+# lecture et structuration, axes, alignement, rendu.
+#
+# pour chaque étape, on note:
+# - le temps écoulé ("temps mur") et le temps de calcul du
+#   processeur (temps CPU), y compris celui des processus
+#   lancés pendant l'étape
+# - le pic de mémoire allouée par python (avec `tracemalloc`)
+#   et la mémoire maximale utilisée par le processus (RSS)
+# - des compteurs: nombre d'entrées traitées, nombre d'entrées
+#   où chaque motif de `MOTIF_CHAMPS` a été trouvé ou non...
+#
+# à la fin, on enregistre un rapport JSON dans
+# `out/instrumentation/`, pour suivre le nombre d'entrées
+# traitées par seconde d'une exécution à l'autre. on peut aussi
+# activer `cProfile`, qui note le temps passé dans chaque fonction.
+#
+# crédits:
+# - code: Paul Kervegan, 2023. code sous licence `GNU GPLv3.0`
+# *************************************************************
+
+
+# le dossier où sont enregistrés les rapports
+DOSSIER_RAPPORTS = os.path.join(os.path.abspath(os.path.dirname(__file__)), os.pardir, "out", "instrumentation")
+
+# le nombre de fonctions les plus coûteuses gardées dans le rapport quand `cProfile` est activé
+NOMBRE_FONCTIONS_PROFIL = 25
+
+
+class Rapport:
+    """
+    le rapport d'une exécution: une liste de mesures, une par étape.
+
+    >>> rapport = Rapport("fouille_texte")
+    >>> with rapport.etape("structure") as mesure:
+    ...     corpus = structure(texte)
+    ...     mesure["entrees"] = len(corpus)
+    >>> rapport.enregistrer()
+    '.../out/instrumentation/fouille_texte_20230301_120000.json'
+
+    `mesure` est un dictionnaire: on peut y ajouter ses propres compteurs.
+
+    une étape peut être mesurée à l'intérieur d'une autre: elle est alors
+    notée avec le nom de l'étape qui la contient (`parent`), et son temps
+    n'est pas ajouté une deuxième fois au temps total du rapport.
+    """
+
+    def __init__(self, nom, memoire=True, profilage=False):
+        """
+        :param nom: le nom de l'exécution, utilisé pour nommer le rapport
+        :param memoire: si `True`, mesurer les allocations avec `tracemalloc`.
+                        `tracemalloc` ralentit python pendant les étapes mesurées.
+        :param profilage: si `True`, activer `cProfile` pendant les étapes
+        """
+        self.nom = nom
+        self.date = datetime.datetime.now()
+        self.memoire = memoire
+        self.profil = None
+        if profilage:
+            import cProfile  # le profileur de python: importé seulement quand on s'en sert
+            self.profil = cProfile.Profile()
+        self.etapes = []
+        # les étapes en cours, de la plus extérieure à la plus intérieure. pour
+        # chacune, on garde son nom et le pic de mémoire observé jusqu'ici.
+        self.pile = []
+
+    @contextmanager
+    def etape(self, nom):
+        """
+        mesurer le bloc `with rapport.etape(nom) as mesure:`.
+
+        :param nom: le nom de l'étape
+        :returns: le dictionnaire de mesures de l'étape, complété à la fin du bloc
+        """
+        mesure = {"etape": nom}
+        parent = self.pile[-1] if self.pile else None
+        if parent is not None:
+            mesure["parent"] = parent["etape"]
+
+        # si une étape est mesurée à l'intérieur d'une autre, `tracemalloc` est déjà lancé
+        lancer_tracemalloc = self.memoire and not tracemalloc.is_tracing()
+        if lancer_tracemalloc:
+            tracemalloc.start()
+        memoire_debut = 0
+        if self.memoire:
+            memoire_debut, pic = tracemalloc.get_traced_memory()
+            # `reset_peak()` efface le pic observé jusqu'ici: on le retient
+            # d'abord pour l'étape qui contient celle-ci.
+            if parent is not None:
+                parent["pic"] = max(parent["pic"], pic)
+            tracemalloc.reset_peak()
+        cadre = {"etape": nom, "pic": memoire_debut}
+        self.pile.append(cadre)
+        # le profileur n'est lancé et arrêté que par l'étape la plus extérieure
+        if self.profil is not None and parent is None:
+            self.profil.enable()
+
+        temps_debut = os.times()
+        horloge_debut = time.perf_counter()
+        try:
+            yield mesure
+        finally:
+            horloge_fin = time.perf_counter()
+            temps_fin = os.times()
+            self.pile.pop()
+            if self.profil is not None and parent is None:
+                self.profil.disable()
+
+            mesure["secondes"] = horloge_fin - horloge_debut
+            mesure["secondes_cpu"] = (temps_fin.user + temps_fin.system) - (temps_debut.user + temps_debut.system)
+            # le temps CPU des processus lancés pendant l'étape (par exemple par
+            # `ProcessPoolExecutor`) n'est compté qu'une fois ces processus terminés
+            mesure["secondes_cpu_enfants"] = (
+                (temps_fin.children_user + temps_fin.children_system)
+                - (temps_debut.children_user + temps_debut.children_system)
+            )
+            if self.memoire:
+                memoire_fin, pic = tracemalloc.get_traced_memory()
+                # le pic de l'étape comprend ceux des étapes qu'elle contient
+                pic = max(pic, cadre["pic"])
+                if parent is not None:
+                    parent["pic"] = max(parent["pic"], pic)
+                mesure["allocation_pic_octets"] = pic - memoire_debut
+                mesure["allocation_nette_octets"] = memoire_fin - memoire_debut
+            if lancer_tracemalloc:
+                tracemalloc.stop()
+            mesure["rss_max_octets"] = rss_max()
+            if mesure.get("entrees") and mesure["secondes"] > 0:
+                mesure["entrees_par_seconde"] = mesure["entrees"] / mesure["secondes"]
+            self.etapes.append(mesure)
+
+    def ajouter(self, nom, parent=None, **mesures):
+        """
+        ajouter au rapport une étape mesurée ailleurs, par exemple dans un autre
+        processus, qui ne peut pas utiliser `etape()`.
+
+        :param nom: le nom de l'étape
+        :param parent: le nom de l'étape qui contient celle-ci, ou `None`
+        :param mesures: les mesures de l'étape: `secondes`, `entrees`...
+        """
+        mesure = {"etape": nom}
+        if parent is not None:
+            mesure["parent"] = parent
+        mesure.update(mesures)
+        if mesure.get("entrees") and mesure.get("secondes"):
+            mesure["entrees_par_seconde"] = mesure["entrees"] / mesure["secondes"]
+        self.etapes.append(mesure)
+
+    def vers_dict(self):
+        """
+        :returns: le rapport sous la forme d'un dictionnaire, prêt à être écrit en JSON
+        """
+        rapport = {
+            "nom": self.nom,
+            "date": self.date.isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "plateforme": platform.platform(),
+            # les étapes contenues dans une autre sont déjà comptées dans celle-ci
+            "secondes": sum(mesure["secondes"] for mesure in self.etapes if "parent" not in mesure),
+            "etapes": self.etapes
+        }
+        if self.profil is not None:
+            rapport["profil"] = fonctions_couteuses(self.profil)
+        return rapport
+
+    def enregistrer(self, dossier=DOSSIER_RAPPORTS):
+        """
+        enregistrer le rapport en JSON. si `cProfile` est activé, le profil complet
+        est aussi enregistré dans un fichier `.prof`, lisible avec `pstats` ou `snakeviz`.
+
+        :param dossier: le dossier où enregistrer le rapport
+        :returns: le chemin du rapport
+        """
+        if not os.path.isdir(dossier):
+            os.makedirs(dossier)
+        chemin = os.path.join(dossier, f"{self.nom}_{self.date:%Y%m%d_%H%M%S}")
+        rapport = self.vers_dict()
+        if self.profil is not None:
+            self.profil.dump_stats(f"{chemin}.prof")
+            rapport["fichier_profil"] = f"{chemin}.prof"
+        with open(f"{chemin}.json", mode="w", encoding="utf-8") as fh:
+            json.dump(rapport, fh, indent=2, ensure_ascii=False)
+        return f"{chemin}.json"
+
+
+@contextmanager
+def etape(rapport, nom):
+    """
+    comme `rapport.etape(nom)`, mais ne mesure rien si `rapport` vaut `None`.
+    cela permet aux fonctions de recevoir un rapport facultatif:
+
+    >>> def axes_mesures(corpus, rapport=None):
+    ...     with etape(rapport, "axes") as mesure:
+    ...         ...
+
+    :param rapport: un `Rapport` ou `None`
+    :param nom: le nom de l'étape
+    :returns: le dictionnaire de mesures de l'étape
+    """
+    if rapport is None:
+        yield {}
+    else:
+        with rapport.etape(nom) as mesure:
+            yield mesure
+
+
+def compter_champs(*corpus):
+    """
+    compter, pour chaque champ extrait avec `MOTIF_CHAMPS` (dans `fouille_texte.py`),
+    le nombre d'entrées où le motif a été trouvé et le nombre où il manque.
+
+    :param corpus: un ou plusieurs corpus: des `Corpus` ou des listes de
+                   dictionnaires produites par `structure()`
+    :returns: `{"date_vente": {"trouve": ..., "manquant": ...}, ...}`
+    """
+    champs = ("date_creation", "date_vente", "prix", "monnaie", "prix_constant")
+    manquants = dict.fromkeys(champs, 0)
+    total = 0
+    for un_corpus in corpus:
+        total += len(un_corpus)
+        if isinstance(un_corpus, Corpus):
+            # on compte directement dans les colonnes
+            manquants["date_creation"] += un_corpus.date_creation.count(ANNEE_MANQUANTE)
+            manquants["date_vente"] += un_corpus.date_vente.count(ANNEE_MANQUANTE)
+            manquants["prix"] += sum(map(math.isnan, un_corpus.prix))
+            manquants["prix_constant"] += sum(map(math.isnan, un_corpus.prix_constant))
+            if "" in un_corpus.valeurs_monnaie:
+                manquants["monnaie"] += un_corpus.monnaie.count(un_corpus.valeurs_monnaie.index(""))
+        else:
+            for entree in un_corpus:
+                for champ in champs:
+                    if entree[champ] == "":
+                        manquants[champ] += 1
+    return { champ: {"trouve": total - manquants[champ], "manquant": manquants[champ]} for champ in champs }
+
+
+def rss_max():
+    """
+    :returns: la mémoire maximale (en octets) utilisée jusqu'ici par le processus
+              ou par l'un des processus qu'il a lancés, ou `None` si le module
+              `resource` n'existe pas (sous Windows)
+    """
+    if resource is None:
+        return None
+    maximum = max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    )
+    # `ru_maxrss` est en octets sous macOS, en kilo-octets ailleurs
+    return maximum if sys.platform == "darwin" else maximum * 1024
+
+
+def fonctions_couteuses(profil, nombre=NOMBRE_FONCTIONS_PROFIL):
+    """
+    :param profil: un `cProfile.Profile`
+    :param nombre: le nombre de fonctions à garder
+    :returns: les `nombre` fonctions où le plus de temps a été passé (en comptant
+              les fonctions qu'elles appellent), de la plus coûteuse à la moins coûteuse
+    """
+    import pstats  # pour lire les résultats de `cProfile`
+    
+    statistiques = pstats.Stats(profil).stats
+    # chaque fonction est associée à (appels primitifs, appels, temps propre, temps cumulé, appelants)
+    fonctions = sorted(statistiques.items(), key=lambda paire: paire[1][3], reverse=True)[:nombre]
+    return [
+        {
+            "fonction": f"{fichier}:{ligne}({nom})",
+            "appels": appels,
+            "secondes_propres": temps_propre,
+            "secondes_cumulees": temps_cumule
+        }
+        for (fichier, ligne, nom), (_, appels, temps_propre, temps_cumule, _) in fonctions
+    ]
@@ -0,0 +1,219 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer  # un petit serveur web, inclus dans python
+from urllib.parse import urlparse, parse_qs
+import argparse  # pour lire les arguments passés en ligne de commande
+import threading
+import random
+import json
+import time
+import zlib
+
+from generateur_catalogue import modeles, entree_synthetique
+
+
+# *************************************************************
+# dans ce script, on lance un *faux* serveur de l'API Katabase,
+# sur sa propre machine, pour tester la récolte (`recolte.py`)
+# sans internet et sans solliciter le vrai serveur.
+#
+# le faux serveur répond aux mêmes requêtes que l'API:
+#   http://127.0.0.1:8765/katapi?level=item&format=json&sell_date=1850-1910&name=voltaire
+# avec des entrées synthétiques (voir `generateur_catalogue.py`).
+# les entrées d'un nom sont toujours les mêmes: elles sont tirées
+# au hasard avec une graine calculée à partir du nom. seules les
+# entrées vendues pendant la période `sell_date` sont renvoyées.
+#
+# pour ressembler à un vrai serveur, il peut:
+# - attendre avant de répondre (`latence`)
+# - refuser une partie des requêtes, avec le code HTTP 429
+#   ("too many requests") et un en-tête `Retry-After`, ou avec
+#   le code 503 ("service unavailable").
+# comme beaucoup de serveurs, il envoie avec chaque réponse un
+# identifiant de version (`ETag`) et une date de modification
+# (`Last-Modified`), et répond "304 Not Modified", sans données,
+# si le client possède déjà cette version (voir `cache_http.py`).
+#
+# il compte les requêtes et les connexions reçues: on peut ainsi
+# vérifier que la récolte réutilise ses connexions.
+#
+#   python src/katapi_local.py --port 8765 --latence 0.2 --taux-429 0.1 --taux-5xx 0.1
+#
+# crédits:
+# - code: Paul Kervegan, 2023. code sous licence `GNU GPLv3.0`
+# *************************************************************
+
+
+# le nombre d'entrées renvoyées pour un nom: entre ces deux valeurs
+ENTREES_PAR_AUTEUR = (20, 80)
+
+# la date de modification des données, envoyée dans l'en-tête `Last-Modified`
+DERNIERE_MODIFICATION = "Mon, 02 Jan 2023 00:00:00 GMT"
+
+
+class ServeurKatapi:
+    """
+    un faux serveur de l'API Katabase, lancé dans un thread.
+
+    >>> with ServeurKatapi(latence=0.1, taux_429=0.2) as serveur:
+    ...     datasets = Recolteur(url=serveur.url).recolter({"idees": ["voltaire"]})
+    ...     print(serveur.requetes, serveur.connexions)
+    """
+
+    def __init__(self, port=0, latence=0.0, taux_429=0.0, taux_5xx=0.0, retry_after=0.1, graine=0, entrees=ENTREES_PAR_AUTEUR):
+        """
+        :param port: le port du serveur. `0`: un port libre, choisi par le système
+        :param latence: le temps d'attente avant chaque réponse, en secondes
+        :param taux_429: la proportion de requêtes refusées avec le code 429
+        :param taux_5xx: la proportion de requêtes refusées avec le code 503
+        :param retry_after: la valeur de l'en-tête `Retry-After` des réponses 429, en secondes
+        :param graine: la graine du tirage des erreurs
+        :param entrees: le nombre minimal et maximal d'entrées d'un nom
+        """
+        self.latence = latence
+        self.taux_429 = taux_429
+        self.taux_5xx = taux_5xx
+        self.retry_after = retry_after
+        self.entrees = entrees
+        self.hasard = random.Random(graine)
+        self.auteurs, self.descriptions = modeles()
+        self.requetes = 0
+        self.connexions = 0
+        self.erreurs = 0
+        self.non_modifiees = 0  # nombre de réponses 304
+        self.verrou = threading.Lock()
+        self.serveur = ThreadingHTTPServer(("127.0.0.1", port), _gestionnaire(self))
+        self.serveur.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.serveur.server_address[1]}/katapi"
+
+    def __enter__(self):
+        self.demarrer()
+        return self
+
+    def __exit__(self, *erreur):
+        self.arreter()
+
+    def demarrer(self):
+        self.thread = threading.Thread(target=self.serveur.serve_forever, daemon=True)
+        self.thread.start()
+
+    def arreter(self):
+        self.serveur.shutdown()
+        self.serveur.server_close()
+
+    def resultats(self, nom, sell_date=None):
+        """
+        :param nom: le nom cherché
+        :param sell_date: la période de vente, `"début-fin"` ou `"année"`, ou `None`
+        :returns: les entrées synthétiques du nom, au format de l'API: `{identifiant: entrée}`
+        """
+        debut, fin = _periode(sell_date)
+        graine = zlib.crc32(nom.encode("utf-8"))
+        generateur = random.Random(graine)
+        resultats = {}
+        for numero in range(generateur.randint(*self.entrees)):
+            entree = entree_synthetique(generateur, self.auteurs, self.descriptions)
+            if not debut <= entree["sell_date"] <= fin:
+                continue
+            entree["author"] = nom.upper()
+            # les champs que `clean_dataset()` supprime
+            entree["author_wikidata_id"] = None
+            entree["format"] = None
+            entree["term"] = None
+            resultats[f"CAT_{graine % 1000000:06d}_e{numero + 1}_d1"] = entree
+        return resultats
+
+    def repondre(self, chemin, entetes_requete=None):
+        """
+        :param chemin: le chemin de la requête, avec ses paramètres
+        :param entetes_requete: les en-têtes de la requête (pour `If-None-Match`)
+        :returns: le code HTTP, les en-têtes et le corps de la réponse
+        """
+        with self.verrou:
+            self.requetes += 1
+            tirage = self.hasard.random()
+        time.sleep(self.latence)
+
+        if tirage < self.taux_429:
+            with self.verrou:
+                self.erreurs += 1
+            return 429, {"Retry-After": str(self.retry_after)}, b""
+        if tirage < self.taux_429 + self.taux_5xx:
+            with self.verrou:
+                self.erreurs += 1
+            return 503, {}, b""
+
+        adresse = urlparse(chemin)
+        params = { cle: valeurs[0] for cle, valeurs in parse_qs(adresse.query).items() }
+        if adresse.path != "/katapi":
+            return 404, {}, b""
+        # comme l'API, on répond avec le code HTTP 200 et on indique l'erreur dans le corps
+        if params.get("level") != "item" or params.get("format") != "json" or "name" not in params:
+            corps = {"head": {"status_code": 422, "query": params}, "results": "paramètres invalides"}
+        else:
+            corps = {"head": {"status_code": 200, "query": params}, "results": self.resultats(params["name"], params.get("sell_date"))}
+        corps = json.dumps(corps).encode("utf-8")
+        # la version de la réponse: une empreinte de son contenu
+        etag = f'"{zlib.crc32(corps):08x}"'
+        if (entetes_requete or {}).get("If-None-Match") == etag:
+            with self.verrou:
+                self.non_modifiees += 1
+            return 304, {"ETag": etag, "Last-Modified": DERNIERE_MODIFICATION}, b""
+        return 200, {"Content-Type": "application/json", "ETag": etag, "Last-Modified": DERNIERE_MODIFICATION}, corps
+
+
+def _periode(sell_date):
+    """
+    :returns: la première et la dernière année de la période `sell_date`
+    """
+    if not sell_date:
+        return float("-inf"), float("inf")
+    debut, _, fin = sell_date.partition("-")
+    return int(debut), int(fin or debut)
+
+
+def _gestionnaire(serveur):
+    """
+    :returns: la classe qui traite les requêtes HTTP de `serveur`
+    """
+    class Gestionnaire(BaseHTTPRequestHandler):
+        # HTTP/1.1: la connexion reste ouverte après la réponse ("keep-alive")
+        protocol_version = "HTTP/1.1"
+
+        def setup(self):
+            # appelée une fois par connexion, et non par requête
+            super().setup()
+            with serveur.verrou:
+                serveur.connexions += 1
+
+        def do_GET(self):
+            code, entetes, corps = serveur.repondre(self.path, self.headers)
+            self.send_response(code)
+            for nom, valeur in entetes.items():
+                self.send_header(nom, valeur)
+            self.send_header("Content-Length", str(len(corps)))
+            self.end_headers()
+            self.wfile.write(corps)
+
+        def log_message(self, *args):
+            pass  # pas de ligne affichée pour chaque requête
+
+    return Gestionnaire
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="faux serveur de l'API Katabase")
+    parser.add_argument("--port", type=int, default=8765, help="le port du serveur")
+    parser.add_argument("--latence", type=float, default=0.0, help="attente avant chaque réponse, en secondes")
+    parser.add_argument("--taux-429", type=float, default=0.0, help="proportion de réponses 429")
+    parser.add_argument("--taux-5xx", type=float, default=0.0, help="proportion de réponses 503")
+    arguments = parser.parse_args()
+
+    serveur = ServeurKatapi(arguments.port, arguments.latence, arguments.taux_429, arguments.taux_5xx)
+    print(serveur.url)
+    try:
+        serveur.serveur.serve_forever()
+    except KeyboardInterrupt:
+        serveur.arreter()
@@ -0,0 +1,161 @@
+import mmap  # pour "projeter" un fichier en mémoire sans le lire entièrement
+import os
+import re
+
+from corpus import Corpus
+from fouille_texte import MOTIF_CHAMPS, iter_entrees, structure_entree
+
+
+# *************************************************************
+# dans ce script, on lit les catalogues d'une autre manière que
+# `read_text()`: au lieu de lire tout le fichier et de le décoder
+# en chaîne de caractères, on le *projette en mémoire* avec `mmap`.
+#
+# avec `mmap`, le fichier se comporte comme une longue suite
+# d'octets (`bytes`), mais c'est le système d'exploitation qui
+# charge les morceaux du fichier au moment où on les lit. les
+# morceaux chargés sont partagés entre tous les programmes qui
+# lisent le même fichier.
+#
+# on cherche les séparateurs d'entrées et les informations
+# directement dans ces octets, avec des expressions régulières
+# sur des `bytes`. on ne décode en texte (UTF-8) que l'auteur.ice,
+# la description et la monnaie, c'est-à-dire les seules parties
+# du fichier que l'on garde.
+#
+# crédits:
+# - code: Paul Kervegan, 2023. code sous licence `GNU GPLv3.0`
+# *************************************************************
+
+
+# les motifs de `fouille_texte.py`, traduits en octets. dans un motif en
+# octets, `\d` cible seulement les chiffres ASCII, et les lettres accentuées
+# ("É") sont écrites sous la forme de leurs octets UTF-8.
+MOTIF_CHAMPS_OCTETS = re.compile(MOTIF_CHAMPS.pattern.encode("utf-8"))
+
+# en octets, `\s` cible seulement les espaces ASCII. pour filtrer les
+# entrées vides exactement comme `MOTIF_ENTREE_VIDE`, on ajoute les
+# autres espaces reconnus par python (espace insécable...), écrits en UTF-8.
+MOTIF_ENTREE_VIDE_OCTETS = re.compile(
+    rb"^(?:\s|[\x1c-\x1f]|\xc2[\x85\xa0]|\xe1\x9a\x80|\xe2\x80[\x80-\x8a\xa8\xa9\xaf]|\xe2\x81\x9f|\xe3\x80\x80)*$",
+    flags=re.MULTILINE
+)
+
+
+def iter_structure_mmap(chemin, dimensions=False):
+    """
+    équivalent de `iter_structure()`, mais en lisant le fichier avec `mmap`.
+
+    les fichiers dont les lignes se terminent par `\\r\\n` (fichiers créés sous
+    Windows) sont lus en mode texte, comme dans `read_text()`: le découpage
+    en octets suppose des fins de ligne `\\n`.
+
+    :param chemin: le chemin du catalogue
+    :param dimensions: si `True`, ajouter le nombre de pages aux dictionnaires
+    :returns: un générateur de dictionnaires, identiques à ceux de `structure()`
+    """
+    with open(chemin, mode="rb") as fh:
+        # on ne peut pas projeter un fichier vide en mémoire
+        if os.fstat(fh.fileno()).st_size == 0:
+            return
+        with mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as tampon:
+            if tampon.find(b"\r") == -1:
+                yield from iter_structure_plage(tampon, 0, len(tampon), dimensions)
+                return
+
+    with open(chemin, mode="r") as fh:
+        for entree in iter_entrees(fh):
+            yield structure_entree(entree, dimensions)
+
+
+def structure_corpus_mmap(chemin, genre=""):
+    """
+    lire un catalogue avec `iter_structure_mmap()` et le ranger dans un `Corpus`.
+
+    :param chemin: le chemin du catalogue
+    :param genre: le genre littéraire du catalogue
+    :returns: le corpus structuré, sous la forme d'un `Corpus`
+    """
+    return Corpus.depuis_entrees(iter_structure_mmap(chemin), genre=genre)
+
+
+def iter_structure_plage(tampon, debut, fin, dimensions=False):
+    """
+    structurer les entrées situées entre les octets `debut` et `fin` de
+    `tampon`. les entrées sont découpées sur `\\n\\n\\n` de gauche à droite,
+    comme avec `.split()`, sans jamais copier le tampon.
+
+    :param tampon: des octets: un `mmap`, des `bytes`...
+    :param debut: la position du premier octet à traiter
+    :param fin: la position qui suit le dernier octet à traiter
+    :param dimensions: si `True`, ajouter le nombre de pages aux dictionnaires
+    :returns: un générateur de dictionnaires, identiques à ceux de `structure()`
+    """
+    while True:
+        separateur = tampon.find(b"\n\n\n", debut, fin)
+        fin_entree = fin if separateur == -1 else separateur
+        # `search(tampon, debut, fin_entree)` cherche seulement entre `debut`
+        # et `fin_entree`, sans copier cette partie du tampon.
+        if not MOTIF_ENTREE_VIDE_OCTETS.search(tampon, debut, fin_entree):
+            yield structure_octets(tampon, debut, fin_entree, dimensions)
+        if separateur == -1:
+            return
+        debut = separateur + 3
+
+
+def structure_octets(tampon, debut, fin, dimensions=False):
+    """
+    équivalent de `structure_entree()` pour une entrée située entre les
+    octets `debut` et `fin` de `tampon`.
+
+    :param tampon: des octets: un `mmap`, des `bytes`...
+    :param debut: la position du premier octet de l'entrée
+    :param fin: la position qui suit le dernier octet de l'entrée
+    :param dimensions: si `True`, ajouter le nombre de pages au dictionnaire
+    :returns: l'entrée structurée sous forme de dictionnaire
+    """
+    date_creation = ""
+    date_vente = ""
+    prix = ""
+    monnaie = ""
+    prix_constant = ""
+    nombre_pages = ""
+
+    # on copie les octets de cette seule entrée (jamais le fichier entier) et on
+    # la découpe en lignes: la 1re est l'auteur.ice, la 4e est la description.
+    lignes = tampon[debut:fin].split(b"\n", 4)
+    auteur = lignes[0].decode("utf-8")
+    description = lignes[3].decode("utf-8")
+
+    # `int()` et `float()` acceptent directement des octets: pas besoin de les décoder
+    for motif in MOTIF_CHAMPS_OCTETS.finditer(tampon, debut, fin):
+        nom = motif.lastgroup
+        if nom == "date_creation":
+            if date_creation == "":
+                date_creation = int(motif["date_creation"])
+        elif nom == "date_vente":
+            if date_vente == "":
+                date_vente = int(motif["date_vente"])
+        elif nom == "monnaie":
+            if monnaie == "":
+                prix = float(motif["prix"])
+                monnaie = motif["monnaie"].decode("ascii")
+        elif nom == "prix_constant":
+            if prix_constant == "":
+                prix_constant = float(motif["prix_constant"])
+        elif nom == "dimensions":
+            if nombre_pages == "":
+                nombre_pages = float(motif["dimensions"])
+
+    entree = {
+        "auteur": auteur,
+        "date_creation": date_creation,
+        "date_vente": date_vente,
+        "prix": prix,
+        "prix_constant": prix_constant,
+        "monnaie": monnaie,
+        "description": description
+    }
+    if dimensions:
+        entree["dimensions"] = nombre_pages
+    return entree
@@ -0,0 +1,176 @@
+from concurrent.futures import ProcessPoolExecutor  # pour lancer des calculs sur plusieurs processeurs
+import mmap
+import os
+
+from corpus import Corpus
+from lecture_mmap import iter_structure_mmap, iter_structure_plage, structure_corpus_mmap
+from quantiles import AgregateurQuantiles
+
+
+# *************************************************************
+# dans ce script, on structure un seul gros catalogue en
+# utilisant tous les cœurs du processeur.
+#
+# le principe:
+# 1. on découpe le fichier en plusieurs *plages* d'octets de
+#    tailles à peu près égales. chaque plage commence juste après
+#    un séparateur `\n\n\n`: une entrée n'est jamais coupée en deux.
+# 2. chaque plage est structurée par un processus différent
+#    (voir `lecture_mmap.py`), qui renvoie un `Corpus`.
+# 3. on recolle les `Corpus` dans l'ordre des plages: le résultat
+#    est le même que si on avait structuré le fichier d'un coup.
+#
+# avec `agreger_parallele()`, chaque processus ne renvoie pas un
+# `Corpus` mais les statistiques de sa plage (voir `quantiles.py`),
+# que l'on fusionne ensuite: seules les statistiques circulent
+# entre les processus.
+#
+# crédits:
+# - code: Paul Kervegan, 2023. code sous licence `GNU GPLv3.0`
+# *************************************************************
+
+
+# en dessous de cette taille (en octets), une plage ne vaut pas le coût
+# de lancer un processus: on structure le fichier directement.
+TAILLE_MIN_PLAGE = 4 * 1024 * 1024
+
+
+def decouper_plages(tampon, nombre):
+    """
+    découper `tampon` en `nombre` plages au plus, alignées sur les
+    séparateurs d'entrées.
+
+    `.split("\\n\\n\\n")` cherche les séparateurs de gauche à droite: dans une
+    suite de plus de 3 retours à la ligne, c'est toujours les 3 *premiers*
+    qui forment le séparateur. pour couper au même endroit, quand on trouve
+    un séparateur, on recule donc jusqu'au début de la suite de retours à
+    la ligne qui le contient.
+
+    :param tampon: le contenu du fichier, en octets (un `mmap`, par exemple)
+    :param nombre: le nombre de plages souhaité
+    :returns: une liste de tuples `(debut, fin)`, qui couvre tout le tampon
+    """
+    taille = len(tampon)
+    bornes = [0]
+    for i in range(1, nombre):
+        separateur = tampon.find(b"\n\n\n", max(taille * i // nombre, bornes[-1]))
+        if separateur == -1:
+            break
+        while separateur > 0 and tampon[separateur - 1] == ord("\n"):
+            separateur -= 1
+        borne = separateur + 3
+        if borne > bornes[-1]:
+            bornes.append(borne)
+    bornes.append(taille)
+    return [ (debut, fin) for debut, fin in zip(bornes, bornes[1:]) if fin > debut ]
+
+
+def _plages(chemin, processus, taille_min_plage):
+    """
+    :returns: les plages à répartir entre les processus, ou `None` s'il vaut
+              mieux traiter le fichier d'un coup
+    """
+    taille = os.path.getsize(chemin)
+    nombre = min(processus, taille // max(taille_min_plage, 1))
+    if nombre < 2:
+        return None
+    with open(chemin, mode="rb") as fh:
+        with mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as tampon:
+            # les fichiers en `\r\n` sont lus en mode texte (voir `lecture_mmap.py`)
+            if tampon.find(b"\r") != -1:
+                return None
+            return decouper_plages(tampon, nombre)
+
+
+def structure_parallele(chemin, genre="", processus=None, taille_min_plage=TAILLE_MIN_PLAGE):
+    """
+    structurer le catalogue `chemin` sur plusieurs processus. le résultat
+    est identique à `structure_corpus_mmap()` (et donc à `structure()`).
+
+    :param chemin: le chemin du catalogue
+    :param genre: le genre littéraire du catalogue
+    :param processus: le nombre de processus. par défaut, le nombre de cœurs
+    :param taille_min_plage: la taille minimale d'une plage, en octets
+    :returns: le corpus structuré, sous la forme d'un `Corpus`
+    """
+    processus = processus or os.cpu_count() or 1
+    plages = _plages(chemin, processus, taille_min_plage)
+    if plages is None:
+        return structure_corpus_mmap(chemin, genre)
+
+    corpus = Corpus()
+    with ProcessPoolExecutor(max_workers=processus) as executeur:
+        # `map()` renvoie les résultats dans l'ordre des plages, même si
+        # certains processus finissent avant les autres.
+        morceaux = executeur.map(
+            _structurer_plage,
+            [chemin] * len(plages),
+            [ debut for debut, _ in plages ],
+            [ fin for _, fin in plages ],
+            [genre] * len(plages)
+        )
+        for morceau in morceaux:
+            corpus.etendre(morceau)
+    return corpus
+
+
+def _structurer_plage(chemin, debut, fin, genre):
+    """
+    fonction exécutée par chaque processus: structurer une plage du fichier.
+    on renvoie un `Corpus`, beaucoup plus rapide à transmettre au processus
+    principal qu'une liste de dictionnaires.
+    """
+    with open(chemin, mode="rb") as fh:
+        with mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as tampon:
+            return Corpus.depuis_entrees(iter_structure_plage(tampon, debut, fin), genre=genre)
+
+
+def agreger_parallele(chemin, cles=("date_vente",), erreur=None, processus=None,
+                      taille_min_plage=TAILLE_MIN_PLAGE):
+    """
+    calculer les statistiques sur les prix du catalogue `chemin`, par groupe,
+    sur plusieurs processus. chaque processus remplit un `AgregateurQuantiles`
+    pour sa plage; on les fusionne dans l'ordre des plages.
+
+    >>> agregateur = agreger_parallele("in/catalogue_idees.txt", erreur=0.01)
+    >>> axes_depuis_agregat(agregateur.vers_agregat())
+
+    :param chemin: le chemin du catalogue
+    :param cles: les noms des champs de regroupement
+    :param erreur: `None` pour des quantiles exacts, ou l'erreur des croquis KLL
+    :param processus: le nombre de processus. par défaut, le nombre de cœurs
+    :param taille_min_plage: la taille minimale d'une plage, en octets
+    :returns: un `AgregateurQuantiles`
+    """
+    processus = processus or os.cpu_count() or 1
+    plages = _plages(chemin, processus, taille_min_plage)
+    agregateur = AgregateurQuantiles(erreur)
+    if plages is None:
+        agregateur.ajouter_entrees(iter_structure_mmap(chemin), cles)
+        return agregateur
+
+    with ProcessPoolExecutor(max_workers=processus) as executeur:
+        morceaux = executeur.map(
+            _agreger_plage,
+            [chemin] * len(plages),
+            [ debut for debut, _ in plages ],
+            [ fin for _, fin in plages ],
+            [cles] * len(plages),
+            [erreur] * len(plages),
+            range(len(plages))  # une graine différente par plage
+        )
+        for morceau in morceaux:
+            agregateur.fusionner(morceau)
+    return agregateur
+
+
+def _agreger_plage(chemin, debut, fin, cles, erreur, graine):
+    """
+    fonction exécutée par chaque processus: calculer les statistiques d'une
+    plage du fichier.
+    """
+    agregateur = AgregateurQuantiles(erreur, graine)
+    with open(chemin, mode="rb") as fh:
+        with mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as tampon:
+            agregateur.ajouter_entrees(iter_structure_plage(tampon, debut, fin), cles)
+    return agregateur
@@ -0,0 +1,317 @@
+from array import array  # tableau de nombres à virgule, compact
+import random
+import math
+
+from agregation import axes_depuis_agregat, centile, mediane
+
+
+# *************************************************************
+# dans ce script, on calcule des quantiles (médiane, centiles)
+# *au fur et à mesure*, sans forcément garder tous les prix en
+# mémoire, et en pouvant *fusionner* des résultats partiels.
+#
+# `axes()` et `agreger()` gardent tous les prix de chaque groupe
+# pour les trier à la fin. c'est exact, mais la mémoire grandit
+# avec le corpus. ici, on propose deux modes:
+# - `QuantilesExacts`: on garde tous les prix dans un `array`
+#   trié à la demande. les résultats sont identiques à ceux de
+#   `agreger()`.
+# - `CroquisKLL`: un *croquis* ("sketch") KLL (Karnin, Lang et
+#   Liberty, 2016), qui garde un nombre limité de prix. les
+#   quantiles sont approchés: un quantile demandé à la position
+#   `q` renvoie une valeur dont la position réelle est comprise
+#   entre `q - erreur` et `q + erreur`, avec une forte probabilité.
+#
+# dans les deux cas, deux objets remplis séparément (par deux
+# processus, ou sur deux morceaux d'un catalogue) peuvent être
+# fusionnés avec `fusionner()`: le résultat est le même que si
+# toutes les valeurs avaient été ajoutées au même objet (au
+# hasard du croquis près).
+#
+# `AgregateurQuantiles` applique l'un de ces modes à chaque
+# groupe d'entrées (par exemple à chaque année de vente).
+#
+# crédits:
+# - code: Paul Kervegan, 2023. code sous licence `GNU GPLv3.0`
+# *************************************************************
+
+
+# l'erreur par défaut des croquis: 1% des positions
+ERREUR_CROQUIS = 0.01
+
+# chaque niveau d'un croquis KLL a une capacité égale à `C` fois celle du niveau supérieur
+C = 2 / 3
+
+
+class QuantilesExacts:
+    """
+    quantiles exacts: on garde toutes les valeurs, triées seulement quand
+    on les interroge.
+
+    >>> quantiles = QuantilesExacts()
+    >>> for prix in (10, 2, 7): quantiles.ajouter(prix)
+    >>> quantiles.mediane()
+    7.0
+    """
+
+    def __init__(self):
+        self.valeurs = array("d")
+        self.trie = True
+
+    def __len__(self):
+        return len(self.valeurs)
+
+    def ajouter(self, valeur):
+        """
+        :param valeur: une valeur à ajouter
+        """
+        self.valeurs.append(valeur)
+        self.trie = False
+
+    def fusionner(self, autre):
+        """
+        ajouter toutes les valeurs de `autre` à cet objet.
+
+        :param autre: un autre objet `QuantilesExacts`
+        """
+        self.valeurs.extend(autre.valeurs)
+        self.trie = False
+
+    def trier(self):
+        """
+        :returns: les valeurs, triées
+        """
+        if not self.trie:
+            self.valeurs = array("d", sorted(self.valeurs))
+            self.trie = True
+        return self.valeurs
+
+    def mediane(self):
+        """
+        :returns: la médiane des valeurs, calculée comme `statistics.median()`,
+                  ou `None` s'il n'y a aucune valeur
+        """
+        return mediane(self.trier())
+
+    def quantile(self, q):
+        """
+        :param q: la position du quantile, entre 0 et 1 (0.5 pour la médiane)
+        :returns: le quantile, par interpolation linéaire comme dans `agreger()`,
+                  ou `None` s'il n'y a aucune valeur
+        """
+        return centile(self.trier(), q * 100)
+
+
+class CroquisKLL:
+    """
+    un croquis KLL: des quantiles approchés, avec une mémoire bornée.
+
+    les valeurs sont rangées en *niveaux*. une valeur du niveau `h` en
+    représente `2 ** h`. quand un niveau est plein, on le trie et on n'en garde
+    qu'une valeur sur deux (les valeurs de rang pair ou impair, au hasard), qui
+    montent au niveau supérieur: c'est la *compaction*. les niveaux du bas, qui
+    sont compactés le plus souvent, ont la plus petite capacité.
+
+    >>> croquis = CroquisKLL(erreur=0.01)
+    >>> for prix in prix_du_catalogue: croquis.ajouter(prix)
+    >>> croquis.quantile(0.9)
+    """
+
+    def __init__(self, erreur=ERREUR_CROQUIS, graine=0):
+        """
+        :param erreur: l'erreur maximale souhaitée sur la position des quantiles.
+                       plus elle est petite, plus le croquis garde de valeurs.
+        :param graine: la graine du générateur aléatoire des compactions: une
+                       même graine donne toujours le même croquis
+        """
+        self.erreur = erreur
+        # capacité du niveau le plus haut. la relation entre `k` et l'erreur
+        # est l'approximation donnée par la bibliothèque DataSketches:
+        # `erreur ≈ 2.296 / k ** 0.9723`
+        self.k = max(8, math.ceil((2.296 / erreur) ** (1 / 0.9723)))
+        self.hasard = random.Random(graine)
+        self.niveaux = [[]]
+        self.nombre = 0  # nombre de valeurs ajoutées
+        self.taille = 0  # nombre de valeurs gardées
+        self.taille_max = self._capacite(0)
+
+    def __len__(self):
+        return self.nombre
+
+    def _capacite(self, niveau):
+        """
+        :returns: la capacité du niveau `niveau`
+        """
+        hauteur = len(self.niveaux) - niveau - 1
+        return math.ceil(C ** hauteur * self.k) + 1
+
+    def _ajouter_niveau(self):
+        self.niveaux.append([])
+        self.taille_max = sum(self._capacite(niveau) for niveau in range(len(self.niveaux)))
+
+    def ajouter(self, valeur):
+        """
+        :param valeur: une valeur à ajouter
+        """
+        self.niveaux[0].append(valeur)
+        self.nombre += 1
+        self.taille += 1
+        if self.taille >= self.taille_max:
+            self._compacter()
+
+    def _compacter(self):
+        """
+        compacter le premier niveau plein, jusqu'à repasser sous la taille maximale.
+        """
+        while self.taille >= self.taille_max:
+            for niveau, valeurs in enumerate(self.niveaux):
+                if len(valeurs) >= self._capacite(niveau):
+                    if niveau + 1 == len(self.niveaux):
+                        self._ajouter_niveau()
+                    valeurs.sort()
+                    # une valeur sur deux monte au niveau supérieur. si le nombre de
+                    # valeurs est impair, la dernière reste à ce niveau.
+                    reste = [valeurs.pop()] if len(valeurs) % 2 else []
+                    self.niveaux[niveau + 1].extend(valeurs[self.hasard.randrange(2)::2])
+                    self.niveaux[niveau] = reste
+                    self.taille = sum(len(valeurs) for valeurs in self.niveaux)
+                    break
+
+    def fusionner(self, autre):
+        """
+        ajouter le contenu du croquis `autre` à ce croquis.
+
+        :param autre: un autre `CroquisKLL`
+        """
+        while len(self.niveaux) < len(autre.niveaux):
+            self._ajouter_niveau()
+        for niveau, valeurs in enumerate(autre.niveaux):
+            self.niveaux[niveau].extend(valeurs)
+        self.nombre += autre.nombre
+        self.taille = sum(len(valeurs) for valeurs in self.niveaux)
+        self._compacter()
+
+    def mediane(self):
+        """
+        :returns: la médiane approchée, ou `None` s'il n'y a aucune valeur
+        """
+        return self.quantile(0.5)
+
+    def quantile(self, q):
+        """
+        :param q: la position du quantile, entre 0 et 1
+        :returns: le quantile approché, ou `None` s'il n'y a aucune valeur
+        """
+        if self.nombre == 0:
+            return None
+        # chaque valeur du niveau `h` compte pour `2 ** h` valeurs
+        ponderees = sorted(
+            (valeur, 1 << niveau) for niveau, valeurs in enumerate(self.niveaux) for valeur in valeurs
+        )
+        total = sum(poids for _, poids in ponderees)
+        cumul = 0
+        for valeur, poids in ponderees:
+            cumul += poids
+            if cumul >= q * total:
+                return valeur
+        return ponderees[-1][0]
+
+
+class AgregateurQuantiles:
+    """
+    statistiques sur les prix, par groupe, calculées au fur et à mesure:
+    comme `agreger()` (voir `agregation.py`), mais sans avoir besoin de tout
+    le corpus d'un coup, et en pouvant fusionner des résultats partiels.
+
+    >>> agregateur = AgregateurQuantiles(erreur=0.01)  # `erreur=None`: quantiles exacts
+    >>> agregateur.ajouter_entrees(iter_structure("idees"))
+    >>> agregateur.fusionner(agregateur_calcule_ailleurs)
+    >>> agregateur.vers_agregat(centiles=(10, 90))
+    {(1879,): {"nombre": 3, "nombre_prix": 2, "mediane": 12.5, ...}, ...}
+    """
+
+    def __init__(self, erreur=None, graine=0):
+        """
+        :param erreur: `None` pour des quantiles exacts, ou l'erreur des croquis KLL
+        :param graine: la graine des croquis KLL
+        """
+        self.erreur = erreur
+        self.graine = graine
+        self.groupes = {}  # groupe => [nombre d'entrées, somme des prix, quantiles]
+
+    def _groupe(self, groupe):
+        donnees = self.groupes.get(groupe)
+        if donnees is None:
+            quantiles = QuantilesExacts() if self.erreur is None else CroquisKLL(self.erreur, self.graine)
+            donnees = self.groupes[groupe] = [0, 0.0, quantiles]
+        return donnees
+
+    def ajouter(self, groupe, prix):
+        """
+        :param groupe: le groupe de l'entrée (une valeur ou un tuple de valeurs)
+        :param prix: le prix de l'entrée. un prix manquant (`""`, `None` ou `NaN`)
+                     compte dans le nombre d'entrées du groupe, mais pas dans ses quantiles.
+        """
+        donnees = self._groupe(groupe)
+        donnees[0] += 1
+        if prix != "" and prix is not None and prix == prix:  # `NaN != NaN`
+            donnees[1] += prix
+            donnees[2].ajouter(prix)
+
+    def ajouter_entrees(self, entrees, cles=("date_vente",)):
+        """
+        ajouter des entrées structurées, regroupées selon `cles`.
+
+        :param entrees: des dictionnaires produits par `structure()` ou
+                        `iter_structure()`, ou un `Corpus`
+        :param cles: les noms des champs de regroupement
+        """
+        for entree in entrees:
+            self.ajouter(tuple(entree[cle] for cle in cles), entree["prix_constant"])
+
+    def fusionner(self, autre):
+        """
+        ajouter les groupes de l'agrégateur `autre` à celui-ci. les deux
+        agrégateurs doivent être du même mode (exact ou croquis).
+
+        :param autre: un autre `AgregateurQuantiles`
+        """
+        for groupe, (nombre, somme, quantiles) in autre.groupes.items():
+            donnees = self._groupe(groupe)
+            donnees[0] += nombre
+            donnees[1] += somme
+            donnees[2].fusionner(quantiles)
+
+    def vers_agregat(self, centiles=()):
+        """
+        :param centiles: les centiles à calculer, entre 0 et 100
+        :returns: un dictionnaire au format de `agreger()`
+        """
+        resultat = {}
+        for groupe, (nombre, somme, quantiles) in self.groupes.items():
+            nombre_prix = len(quantiles)
+            statistiques = {
+                "nombre": nombre,
+                "nombre_prix": nombre_prix,
+                "mediane": quantiles.mediane(),
+                "moyenne": somme / nombre_prix if nombre_prix else None,
+            }
+            for valeur in centiles:
+                statistiques[f"p{valeur:g}"] = quantiles.quantile(valeur / 100)
+            resultat[groupe] = statistiques
+        return resultat
+
+
+def axes_en_flux(entrees, erreur=None):
+    """
+    calculer les axes de `axes()` (voir `fouille_texte.py`) en parcourant les
+    entrées une seule fois. avec `erreur`, les prix médians sont approchés mais
+    la mémoire utilisée ne dépend plus du nombre de prix.
+
+    :param entrees: des dictionnaires produits par `structure()` ou `iter_structure()`
+    :param erreur: `None` pour des médianes exactes, ou l'erreur des croquis KLL
+    :returns: `x`, `y_prix`, `y_count`, comme `axes()`
+    """
+    agregateur = AgregateurQuantiles(erreur)
+    agregateur.ajouter_entrees(entrees)
+    return axes_depuis_agregat(agregateur.vers_agregat())
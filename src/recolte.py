@@ -0,0 +1,555 @@
+from concurrent.futures import ThreadPoolExecutor  # pour lancer plusieurs requêtes en même temps
+from collections import deque
+import threading
+import codecs
+import json
+import sys
+import time
+import re
+
+from cache_http import AbsentDuCache
+
+
+# *************************************************************
+# dans ce script, on récupère les entrées de l'API Katabase
+# *en parallèle*: au lieu d'attendre la réponse à une requête
+# avant de lancer la suivante (voir `katapi_request()` dans
+# `creation_corpus.py`), on lance plusieurs requêtes en même
+# temps, chacune dans un *thread*.
+#
+# une requête HTTP passe l'essentiel de son temps à attendre le
+# serveur: pendant ce temps, python peut s'occuper des autres
+# requêtes. avec 20 auteur.ice.s et 4 requêtes à la fois, la
+# récolte est donc environ 4 fois plus rapide.
+#
+# pour ne pas surcharger l'API:
+# - toutes les requêtes passent par une même *session* `requests`,
+#   qui garde ses connexions ouvertes ("keep-alive") et les
+#   réutilise, au lieu d'ouvrir une connexion par requête.
+# - le nombre de requêtes simultanées est limité (`concurrence`)
+# - le nombre de requêtes par seconde aussi (`debit`, voir
+#   `LimiteurDebit`)
+# - une requête refusée parce que le serveur est surchargé
+#   (code HTTP 429 "too many requests") ou en erreur (codes 5xx)
+#   est relancée plus tard avec `tenacity`, après une attente
+#   de plus en plus longue ("backoff").
+#
+# pour les auteur.ice.s qui ont beaucoup de manuscrits (voltaire...),
+# une seule requête sur toute la période 1850-1910 renvoie une
+# très longue réponse. on découpe donc la période en *fenêtres*
+# (1850-1869, 1870-1889, 1890-1910), et on fait une requête par
+# auteur.ice et par fenêtre: les réponses sont plus courtes, et
+# récupérées en parallèle. chaque fenêtre est une requête de plus
+# pour l'API: avec `fenetres=1`, on ne découpe pas.
+#
+# chaque réponse est lue *au fil de l'eau* (`iter_resultats()`):
+# au lieu d'attendre toute la réponse puis de la décoder d'un coup
+# avec `r.json()`, on décode chaque entrée dès que ses derniers
+# octets sont arrivés, et on la transmet aussitôt à `traiter`
+# (le nettoyage de `creation_corpus.py`). la réponse complète,
+# texte et objets python, n'est jamais en mémoire d'un seul coup.
+#
+# les réponses n'arrivent pas dans l'ordre des requêtes. pour
+# que deux récoltes donnent toujours le même résultat, on lit
+# les réponses dans l'ordre des auteur.ice.s et des fenêtres.
+# `iter_recolter()` renvoie alors les entrées une par une, pour
+# les écrire aussitôt (voir `creation_corpus.pipeline()`);
+# `recolter()` les réunit et les trie par identifiant de manuscrit.
+#
+# les réponses peuvent être gardées sur le disque (`cache`, voir
+# `cache_http.py`): une nouvelle récolte ne retélécharge alors que
+# les réponses trop anciennes, et seulement si le serveur indique
+# qu'elles ont changé.
+#
+# on peut tester la récolte sans internet, avec le faux serveur
+# de `katapi_local.py`.
+#
+# crédits:
+# - code: Paul Kervegan, 2023. code sous licence `GNU GPLv3.0`
+# *************************************************************
+
+
+# l'URL de l'API Katabase
+URL_KATAPI = "https://katabase.huma-num.fr/katapi"
+
+# la période de vente des manuscrits, et le nombre de fenêtres dans lesquelles on la découpe
+PERIODE = "1850-1910"
+FENETRES = 3
+
+# nombre de requêtes simultanées et nombre maximal de requêtes par seconde
+CONCURRENCE = 4
+DEBIT = 5.0
+
+# nombre maximal d'essais par requête, et attentes entre deux essais (en secondes)
+TENTATIVES = 5
+ATTENTE_BASE = 0.5
+ATTENTE_MAX = 30.0
+
+# temps maximal d'attente d'une réponse, en secondes
+DELAI = 60
+
+# la taille des morceaux de réponse lus sur le réseau, en octets
+TAILLE_MORCEAU = 64 * 1024
+
+# les codes HTTP après lesquels on peut réessayer une requête
+CODES_TEMPORAIRES = (429, 500, 502, 503, 504)
+
+# les parties numériques d'un identifiant, pour trier `CAT_000002_e10_d1` après `CAT_000002_e9_d1`
+MOTIF_NOMBRES = re.compile(r"(\d+)")
+
+# les espaces entre deux éléments d'un document JSON
+MOTIF_ESPACES = re.compile(r"[ \t\n\r]*")
+
+# le décodeur JSON: `raw_decode()` décode une seule valeur, à partir d'une position donnée
+DECODEUR = json.JSONDecoder()
+
+
+class ErreurTemporaire(Exception):
+    """
+    une erreur après laquelle on peut réessayer la requête (serveur surchargé ou en panne)
+    """
+
+    def __init__(self, message, attente=None):
+        """
+        :param message: la description de l'erreur
+        :param attente: le temps d'attente demandé par le serveur (en-tête `Retry-After`), ou `None`
+        """
+        super().__init__(message)
+        self.attente = attente
+
+
+class ErreurKatapi(Exception):
+    """
+    une erreur renvoyée par l'API, qu'il ne sert à rien de réessayer (paramètres invalides...)
+    """
+
+
+class LimiteurDebit:
+    """
+    limiter le nombre de requêtes par seconde, pour plusieurs threads.
+
+    chaque requête reçoit un *créneau*: le premier créneau libre, au moins
+    `1 / debit` secondes après le précédent. `attendre()` dort jusqu'au
+    créneau réservé.
+
+    >>> limiteur = LimiteurDebit(5)  # 5 requêtes par seconde
+    >>> limiteur.attendre()          # à appeler avant chaque requête
+    """
+
+    def __init__(self, debit):
+        """
+        :param debit: le nombre maximal de requêtes par seconde, ou `None` pour ne pas limiter
+        """
+        self.intervalle = 0 if not debit else 1 / debit
+        self.prochain = time.monotonic()
+        self.verrou = threading.Lock()  # un seul thread réserve un créneau à la fois
+
+    def attendre(self):
+        with self.verrou:
+            maintenant = time.monotonic()
+            creneau = max(maintenant, self.prochain)
+            self.prochain = creneau + self.intervalle
+        if creneau > maintenant:
+            time.sleep(creneau - maintenant)
+
+
+class Recolteur:
+    """
+    récolter les entrées de plusieurs auteur.ice.s en parallèle.
+
+    >>> with Recolteur(concurrence=4, debit=5, fenetres=3) as recolteur:
+    ...     datasets = recolteur.recolter({"idees": ["voltaire", "diderot"], "roman": ["sade"]})
+    >>> datasets["idees"]  # {identifiant: entrée}, trié par identifiant
+    >>> with Recolteur() as recolteur:
+    ...     for genre, identifiant, entree in recolteur.iter_recolter({"roman": ["sade"]}):
+    ...         print(genre, identifiant)  # sans garder les entrées
+    """
+
+    def __init__(self, url=URL_KATAPI, concurrence=CONCURRENCE, debit=DEBIT, tentatives=TENTATIVES, delai=DELAI, cache=None,
+                 periode=PERIODE, fenetres=FENETRES, traiter=None):
+        """
+        :param url: l'URL de l'API
+        :param concurrence: le nombre maximal de requêtes simultanées
+        :param debit: le nombre maximal de requêtes par seconde (`None` pour ne pas limiter)
+        :param tentatives: le nombre maximal d'essais par requête
+        :param delai: le temps maximal d'attente d'une réponse, en secondes
+        :param cache: un `cache_http.CacheHTTP` pour garder les réponses sur le disque, ou `None`
+        :param periode: la période de vente, `"début-fin"`
+        :param fenetres: le nombre de fenêtres dans lesquelles découper la période
+                         (une requête par auteur.ice et par fenêtre). `1`: ne pas découper
+        :param traiter: une fonction appliquée à chaque entrée dès qu'elle est décodée,
+                        qui renvoie l'entrée à garder, ou `None`
+        """
+        # importés ici pour que `creation_corpus.value_to_text()` reste utilisable sans eux
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self.url = url
+        self.concurrence = concurrence
+        self.tentatives = tentatives
+        self.delai = delai
+        self.limiteur = LimiteurDebit(debit)
+        self.cache = cache
+        self.periodes = decouper_periode(periode, fenetres)
+        self.traiter = traiter
+        # une seule session pour tous les threads: son adaptateur garde jusqu'à
+        # `concurrence` connexions ouvertes vers le serveur, une par thread.
+        self.session = requests.Session()
+        adaptateur = HTTPAdapter(pool_connections=1, pool_maxsize=concurrence)
+        self.session.mount("https://", adaptateur)
+        self.session.mount("http://", adaptateur)
+        self.requetes = 0  # nombre de requêtes envoyées, nouvelles tentatives comprises
+        self.verrou = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *erreur):
+        self.fermer()
+
+    def fermer(self):
+        self.session.close()
+
+    def requete(self, auteur, sell_date=PERIODE):
+        """
+        récupérer toutes les entrées d'un.e auteur.ice vendues pendant une période,
+        en réessayant après une erreur temporaire.
+
+        :param auteur: le nom de l'auteur.ice
+        :param sell_date: la période de vente, `"début-fin"`
+        :returns: un dictionnaire `{identifiant: entrée}`, dans l'ordre de la réponse
+        """
+        import requests
+        from tenacity import Retrying, stop_after_attempt, retry_if_exception_type, wait_random_exponential
+
+        # l'attente avant un nouvel essai est tirée au hasard entre 0 et
+        # `ATTENTE_BASE * 2 ** essai` ("full jitter"): les threads qui ont échoué
+        # en même temps ne réessaient pas tous au même moment. si le serveur
+        # indique combien de temps attendre (`Retry-After`), on attend au moins ce temps.
+        exponentielle = wait_random_exponential(multiplier=ATTENTE_BASE, max=ATTENTE_MAX)
+        def attente(etat):
+            erreur = etat.outcome.exception()
+            demandee = getattr(erreur, "attente", None) or 0
+            return max(demandee, exponentielle(etat))
+
+        essais = Retrying(
+            stop=stop_after_attempt(self.tentatives),
+            wait=attente,
+            retry=retry_if_exception_type((ErreurTemporaire, requests.ConnectionError, requests.Timeout)),
+            reraise=True  # après le dernier essai, on renvoie l'erreur d'origine
+        )
+        return essais(self._requete, auteur, sell_date)
+
+    def _requete(self, auteur, sell_date, conditionnelle=True):
+        """
+        un seul essai de `requete()`
+
+        :param conditionnelle: si `False`, ne pas utiliser la réponse enregistrée dans
+                               le cache: elle est retéléchargée, et remplacée
+        """
+        from requests.exceptions import ChunkedEncodingError  # une connexion coupée pendant la lecture
+
+        params = {
+            "level": "item",
+            "format": "json",
+            "sell_date": sell_date,
+            "name": auteur
+        }
+        entetes = {}
+        if self.cache is not None and conditionnelle:
+            # une réponse fraîche est servie sans contacter le serveur (ni attendre
+            # son créneau); hors ligne, on se contente même d'une réponse ancienne.
+            entree = self.cache.lire(self.url, params)
+            if entree is not None and (self.cache.hors_ligne or self.cache.est_frais(entree)):
+                morceaux = self.cache.corps(entree)
+                if morceaux is not None:
+                    self.cache.compter("fraiches")
+                    return self._decoder(params, morceaux)
+                entree = None  # son texte vient d'être supprimé: comme une réponse absente
+            if self.cache.hors_ligne:
+                raise AbsentDuCache(f"{auteur}: aucune réponse dans le cache ({self.cache.dossier})")
+            # sinon, on demande au serveur si la réponse enregistrée a changé
+            entetes = self.cache.entetes_conditionnels(entree)
+
+        self.limiteur.attendre()
+        with self.verrou:
+            self.requetes += 1
+        # `stream=True`: on lit la réponse morceau par morceau, au lieu de l'attendre en entier
+        with self.session.get(self.url, params=params, headers=entetes, timeout=self.delai, stream=True) as r:
+            if r.status_code == 304 and entetes:
+                # "not modified": la réponse enregistrée est toujours valable... si
+                # son texte n'a pas été supprimé pendant la requête. sinon, on la
+                # redemande sans en-têtes conditionnels. la réponse 304 est vide, mais on
+                # la lit quand même, pour que sa connexion soit réutilisée.
+                r.content
+                morceaux = self.cache.corps(entree)
+                if morceaux is None:
+                    return self._requete(auteur, sell_date, conditionnelle=False)
+                self.cache.compter("revalidees")
+                self.cache.revalider(entree, r.headers)
+                return self._decoder(params, morceaux)
+            if r.status_code in CODES_TEMPORAIRES:
+                # avec `stream=True`, une connexion n'est réutilisée que si la réponse a été
+                # lue jusqu'au bout: on lit donc le (court) message d'erreur avant d'abandonner.
+                r.content
+                raise ErreurTemporaire(f"{auteur}: code HTTP {r.status_code}", _retry_after(r.headers.get("Retry-After")))
+            r.raise_for_status()
+
+            try:
+                if self.cache is None:
+                    return self._decoder(params, _morceaux_texte(r))
+                # pour le cache, chaque morceau est aussi écrit sur le disque dès qu'il
+                # arrive. la réponse n'est enregistrée que si elle est complète et valide
+                # (voir `cache_http.Enregistrement`): une erreur n'est jamais servie depuis le cache.
+                with self.cache.enregistrement(self.url, params, r.headers) as copie:
+                    resultats = self._decoder(params, copie.copier(_morceaux_texte(r)))
+                self.cache.compter("telechargees")
+                return resultats
+            except (ValueError, ChunkedEncodingError) as erreur:
+                # la connexion a été coupée au milieu de la réponse: le JSON reçu
+                # est incomplet. comme pour un serveur surchargé, on réessaie.
+                raise ErreurTemporaire(f"{auteur} ({sell_date}): réponse interrompue: {erreur}") from erreur
+
+    def _decoder(self, params, morceaux):
+        """
+        décoder une réponse de l'API au fil de l'eau, en appliquant `traiter` à chaque entrée.
+
+        :param params: les paramètres de la requête, pour les messages d'erreur
+        :param morceaux: le texte de la réponse, en un ou plusieurs morceaux
+        :returns: un dictionnaire `{identifiant: entrée}`, dans l'ordre de la réponse
+        """
+        entete = {}
+        resultats = {}
+        for identifiant, entree in iter_resultats(morceaux, entete):
+            if self.traiter is not None:
+                entree = self.traiter(entree)
+            if entree is not None:
+                resultats[identifiant] = entree
+
+        # comme dans `katapi_request()`, le code de l'API est dans le corps de la réponse
+        code = entete["head"]["status_code"]
+        if code in CODES_TEMPORAIRES:
+            raise ErreurTemporaire(f"{params['name']} ({params['sell_date']}): code {code}")
+        if code != 200:
+            raise ErreurKatapi(f"{params['name']}: code {code}, requête {entete['head'].get('query')}: {entete.get('results')}")
+        return resultats
+
+    def iter_recolter(self, auteurs_par_genre):
+        """
+        récupérer les entrées de tous les auteur.ice.s, avec au plus `concurrence`
+        requêtes à la fois, et les renvoyer une par une, sans les garder.
+
+        les entrées sont renvoyées dans l'ordre des tâches (genre, auteur.ice, fenêtre),
+        quel que soit l'ordre d'arrivée des réponses, puis dans l'ordre de chaque
+        réponse: deux récoltes renvoient les entrées dans le même ordre. on ne garde
+        en mémoire que les réponses arrivées avant celle qu'on attend (au plus
+        `2 * concurrence` réponses) et les identifiants déjà renvoyés.
+
+        :param auteurs_par_genre: un dictionnaire associant à chaque genre une liste d'auteur.ice.s
+        :returns: un générateur de triplets `(genre, identifiant, entrée)`
+        """
+        # une tâche par auteur.ice et par fenêtre de la période
+        taches = (
+            (genre, auteur, sell_date)
+            for genre, auteurs in auteurs_par_genre.items() for auteur in auteurs for sell_date in self.periodes
+        )
+        vus = { genre: set() for genre in auteurs_par_genre }
+
+        def reponse(genre, tache):
+            for identifiant, entree in tache.result().items():
+                # un même manuscrit peut être renvoyé pour deux auteur.ice.s ou deux
+                # fenêtres: on garde le premier
+                if identifiant not in vus[genre]:
+                    vus[genre].add(identifiant)
+                    yield genre, identifiant, entree
+
+        with ThreadPoolExecutor(max_workers=self.concurrence) as executeur:
+            # `executeur.map()` lancerait toutes les requêtes d'un coup, et garderait
+            # toutes les réponses arrivées avant celle qu'on attend. on ne lance donc
+            # une nouvelle requête que quand la plus ancienne a été lue.
+            en_cours = deque()
+            for genre, auteur, sell_date in taches:
+                en_cours.append((genre, executeur.submit(self.requete, auteur, sell_date)))
+                if len(en_cours) >= 2 * self.concurrence:
+                    yield from reponse(*en_cours.popleft())
+            while en_cours:
+                yield from reponse(*en_cours.popleft())
+
+    def recolter(self, auteurs_par_genre):
+        """
+        comme `iter_recolter()`, mais en réunissant toutes les entrées.
+
+        :param auteurs_par_genre: un dictionnaire associant à chaque genre une liste d'auteur.ice.s
+        :returns: un dictionnaire associant à chaque genre son jeu de données
+                  `{identifiant: entrée}`, trié par identifiant
+        """
+        datasets = { genre: {} for genre in auteurs_par_genre }
+        for genre, identifiant, entree in self.iter_recolter(auteurs_par_genre):
+            datasets[genre][identifiant] = entree
+        return {
+            genre: { identifiant: dataset[identifiant] for identifiant in sorted(dataset, key=cle_identifiant) }
+            for genre, dataset in datasets.items()
+        }
+
+
+def decouper_periode(periode, nombre):
+    """
+    :param periode: une période, `"début-fin"`, années comprises
+    :param nombre: le nombre de fenêtres
+    :returns: une liste de fenêtres de tailles égales (à un an près), qui se suivent
+              sans se chevaucher: `"1850-1910"` en 3 donne
+              `["1850-1869", "1870-1889", "1890-1910"]`
+    """
+    if nombre <= 1:
+        return [ periode ]
+    debut, fin = ( int(annee) for annee in periode.split("-") )
+    annees = fin - debut + 1
+    nombre = min(nombre, annees)
+    return [
+        f"{debut + annees * numero // nombre}-{debut + annees * (numero + 1) // nombre - 1}"
+        for numero in range(nombre)
+    ]
+
+
+def iter_resultats(morceaux, entete):
+    """
+    décoder au fil de l'eau une réponse de l'API: `{"head": {...}, "results": {identifiant: entrée, ...}}`.
+
+    chaque entrée de `results` est renvoyée dès qu'elle est complète: on n'attend
+    pas la fin de la réponse. les autres champs (`head`, ou `results` quand c'est
+    un message d'erreur) sont ajoutés à `entete`.
+
+    >>> entete = {}
+    >>> for identifiant, entree in iter_resultats(r.iter_content(decode_unicode=True), entete):
+    ...     print(identifiant, entree["price"])
+    >>> entete["head"]["status_code"]
+
+    :param morceaux: le texte de la réponse, morceau par morceau
+    :param entete: un dictionnaire, complété avec les champs autres que `results`
+    :returns: un générateur de couples `(identifiant, entrée)`
+    """
+    flux = _Flux(morceaux)
+    flux.consommer("{")
+    if flux.suivant() == "}":
+        return
+    while True:
+        cle = flux.valeur()
+        flux.consommer(":")
+        if cle == "results" and flux.suivant() == "{":
+            # on parcourt l'objet `results` entrée par entrée
+            flux.consommer("{")
+            if flux.suivant() != "}":
+                while True:
+                    identifiant = flux.valeur()
+                    flux.consommer(":")
+                    entree = flux.valeur()
+                    if isinstance(entree, dict):
+                        # `json.loads()` partage les noms de champs ("author", "desc"...) entre
+                        # toutes les entrées d'un document; décodées une à une, chaque entrée
+                        # aurait sa propre copie. `sys.intern()` les partage à nouveau.
+                        entree = { sys.intern(cle): valeur for cle, valeur in entree.items() }
+                    yield identifiant, entree
+                    if flux.suivant() == "}":
+                        break
+                    flux.consommer(",")
+            flux.consommer("}")
+        else:
+            entete[cle] = flux.valeur()
+        if flux.suivant() == "}":
+            return
+        flux.consommer(",")
+
+
+class _Flux:
+    """
+    le texte d'un document JSON qui arrive morceau par morceau. seul le texte
+    qui n'a pas encore été décodé est gardé en mémoire.
+    """
+
+    def __init__(self, morceaux):
+        self.morceaux = iter(morceaux)
+        self.texte = ""
+        self.position = 0
+
+    def lire(self):
+        """
+        ajouter le morceau suivant au texte, en oubliant ce qui a déjà été décodé.
+
+        :returns: `False` si la réponse est terminée
+        """
+        morceau = next(self.morceaux, None)
+        if morceau is None:
+            return False
+        self.texte = self.texte[self.position:] + morceau
+        self.position = 0
+        return True
+
+    def suivant(self):
+        """
+        :returns: le prochain caractère qui n'est pas un espace, sans le consommer
+        """
+        while True:
+            self.position = MOTIF_ESPACES.match(self.texte, self.position).end()
+            if self.position < len(self.texte):
+                return self.texte[self.position]
+            if not self.lire():
+                raise ValueError("réponse JSON incomplète")
+
+    def consommer(self, caractere):
+        if self.suivant() != caractere:
+            raise ValueError(f"réponse JSON invalide: `{caractere}` attendu à `{self.texte[self.position:self.position + 30]}`")
+        self.position += 1
+
+    def valeur(self):
+        """
+        :returns: la valeur JSON suivante (une entrée, un identifiant...), décodée
+        """
+        self.suivant()
+        while True:
+            try:
+                valeur, fin = DECODEUR.raw_decode(self.texte, self.position)
+            except json.JSONDecodeError:
+                # la valeur n'est pas encore arrivée en entier: on lit un morceau de plus
+                if not self.lire():
+                    raise
+                continue
+            # un nombre à la fin du texte peut continuer dans le morceau suivant
+            if fin == len(self.texte) and self.lire():
+                continue
+            self.position = fin
+            return valeur
+
+
+def _morceaux_texte(r):
+    """
+    :param r: une réponse `requests`, lancée avec `stream=True`
+    :returns: un générateur des morceaux de la réponse, décodés en texte. un caractère
+              accentué peut être coupé entre deux morceaux: le décodeur "incrémental"
+              garde ses premiers octets jusqu'au morceau suivant.
+    """
+    decodeur = codecs.getincrementaldecoder(r.encoding or "utf-8")()
+    for octets in r.iter_content(TAILLE_MORCEAU):
+        yield decodeur.decode(octets)
+    fin = decodeur.decode(b"", final=True)
+    if fin:
+        yield fin
+
+
+def cle_identifiant(identifiant):
+    """
+    :returns: une clé de tri des identifiants qui compare les nombres par leur
+              valeur: `CAT_000002_e9_d1` avant `CAT_000002_e10_d1`
+    """
+    parties = MOTIF_NOMBRES.split(str(identifiant))
+    return [ int(partie) if position % 2 else partie for position, partie in enumerate(parties) ]
+
+
+def _retry_after(valeur):
+    """
+    :param valeur: l'en-tête `Retry-After`, en secondes, ou `None`
+    :returns: le nombre de secondes à attendre, ou `None`
+    """
+    try:
+        return float(valeur)
+    except (TypeError, ValueError):
+        return None  # absent, ou une date HTTP: on garde l'attente exponentielle
@@ -0,0 +1,250 @@
+from importlib import metadata  # pour connaître la version d'une librairie sans l'importer
+import hashlib
+import inspect  # pour lire le code source d'une fonction
+import shutil  # pour copier un fichier
+import json
+import os
+import re
+
+from cache import evincer_fichiers
+
+
+# *************************************************************
+# dans ce script, on enregistre des figures plotly dans des
+# fichiers, sans les afficher: c'est le mode "sans affichage"
+# de `visualize()` (dans `fouille_texte.py`), utile sur un
+# serveur ou pour créer beaucoup de graphiques d'un coup.
+#
+# formats possibles:
+# - images (`png`, `svg`, `pdf`...): elles sont créées par
+#   kaleido, qui lance un navigateur en arrière-plan. ce
+#   lancement est long: toutes les images passent donc par un
+#   seul exportateur, `plotly.io.kaleido.scope`, qui reste
+#   ouvert d'une image à l'autre. on peut aussi répartir les
+#   images entre plusieurs processus.
+# - `html`: une page interactive. le code de plotly.js (plus de
+#   3 Mo) est écrit une seule fois, dans `plotly.min.js`, et
+#   partagé par toutes les pages du dossier.
+# - `json`: la figure brute, que plotly peut recharger avec
+#   `plotly.io.read_json()`. c'est le format le plus rapide.
+#
+# les fichiers créés sont gardés dans un cache, `out/.rendus/`.
+# chaque fichier y est nommé d'après une *clé*: l'empreinte des
+# données du graphique, de sa mise en page et de ses couleurs,
+# du code de la fonction qui crée la figure (titres, types de
+# graphiques...) et des versions de plotly et de kaleido.
+# si les données n'ont pas changé depuis la dernière exécution,
+# la clé est la même: on ne recrée ni la figure ni l'image, on
+# réutilise le fichier du cache. comme dans `cache.py`, quand le
+# cache dépasse une taille maximale, on supprime les fichiers
+# utilisés le moins récemment.
+#
+# crédits:
+# - code: Paul Kervegan, 2023. code sous licence `GNU GPLv3.0`
+# *************************************************************
+
+
+# le dossier où sont enregistrées les figures
+DOSSIER_SORTIE = os.path.join(os.path.abspath(os.path.dirname(__file__)), os.pardir, "out")
+
+# les formats d'image que kaleido sait produire
+FORMATS_IMAGE = ("png", "jpg", "jpeg", "webp", "svg", "pdf", "eps")
+
+# tous les formats possibles
+FORMATS = FORMATS_IMAGE + ("html", "json")
+
+# le dossier du cache des graphiques
+DOSSIER_RENDUS = os.path.join(DOSSIER_SORTIE, ".rendus")
+
+# la taille maximale du cache des graphiques, en octets
+TAILLE_MAX_RENDUS = 64 * 1024 * 1024
+
+# un fichier du cache: `{clé}-{nom}.{format}`, où la clé est une empreinte SHA-256
+MOTIF_FICHIER_RENDU = re.compile(r"^[0-9a-f]{64}-")
+
+
+def exporter(figures, dossier=DOSSIER_SORTIE, formats=("png",), processus=1):
+    """
+    enregistrer des figures dans `dossier`, dans un ou plusieurs formats.
+
+    >>> exporter({"prix_median_par_an": fig_prix}, formats=("png", "html"))
+    ['.../out/prix_median_par_an.png', '.../out/prix_median_par_an.html']
+
+    :param figures: un dictionnaire associant à chaque nom de fichier (sans
+                    extension) une figure plotly (`go.Figure` ou dictionnaire)
+    :param dossier: le dossier où enregistrer les fichiers
+    :param formats: les formats à produire, parmi `FORMATS`
+    :param processus: le nombre de processus entre lesquels répartir les images.
+                      chaque processus lance son propre navigateur: ce n'est utile
+                      que s'il y a beaucoup d'images.
+    :returns: la liste des chemins des fichiers créés
+    """
+    import plotly.io as pio  # importé ici: plotly est long à charger
+
+    for format in formats:
+        if format not in FORMATS:
+            raise ValueError(f"format inconnu: {format} (formats possibles: {', '.join(FORMATS)})")
+    if not os.path.isdir(dossier):
+        os.makedirs(dossier)
+
+    chemins = []
+    images = []  # les images sont créées à la fin, toutes ensemble
+    for nom, figure in figures.items():
+        for format in formats:
+            chemin = os.path.join(dossier, f"{nom}.{format}")
+            if format == "html":
+                # `include_plotlyjs="directory"`: la page charge `plotly.min.js`,
+                # écrit dans le même dossier seulement s'il n'existe pas encore
+                pio.write_html(figure, chemin, include_plotlyjs="directory", validate=False)
+            elif format == "json":
+                pio.write_json(figure, chemin, validate=False)
+            else:
+                images.append((figure if isinstance(figure, dict) else figure.to_dict(), format, chemin))
+            chemins.append(chemin)
+
+    if processus > 1 and len(images) > 1:
+        from concurrent.futures import ProcessPoolExecutor
+
+        # chaque processus reçoit une image sur `processus`
+        lots = [ images[i::processus] for i in range(processus) ]
+        with ProcessPoolExecutor(processus) as executeur:
+            list(executeur.map(exporter_images, lots))
+    elif images:
+        exporter_images(images)
+
+    return chemins
+
+
+def exporter_images(images):
+    """
+    créer des images avec un seul exportateur kaleido: le navigateur n'est lancé
+    qu'une fois, pour la première image, puis réutilisé pour les suivantes.
+
+    :param images: une liste de `(figure, format, chemin)`, où `figure` est un dictionnaire
+    """
+    from plotly.io import kaleido
+
+    # `kaleido.scope` est l'exportateur partagé par tout le processus.
+    # il vaut `None` si kaleido n'est pas installé.
+    if kaleido.scope is None:
+        raise ValueError("kaleido doit être installé pour créer des images: `pip install kaleido`")
+    for figure, format, chemin in images:
+        with open(chemin, mode="wb") as fh:
+            fh.write(kaleido.scope.transform(figure, format=format))
+
+
+def cle_rendu(*elements):
+    """
+    calculer la clé d'un graphique: l'empreinte SHA-256 de tout ce qui
+    détermine son apparence (données, mise en page, couleurs...).
+
+    :param elements: des objets convertibles en JSON
+    :returns: la clé, en chaîne hexadécimale
+    """
+    # `sort_keys=True`: deux dictionnaires égaux donnent toujours le même texte
+    texte = json.dumps(elements, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(texte.encode("utf-8")).hexdigest()
+
+
+def empreinte_rendu(*fonctions):
+    """
+    ce qui détermine l'apparence des graphiques en dehors de leurs données:
+    à ajouter à `cle_rendu()`. si on modifie une des fonctions ou si on met
+    à jour plotly ou kaleido, la clé change et les anciens fichiers ne sont
+    plus utilisés.
+
+    :param fonctions: les fonctions qui créent les figures
+    :returns: un dictionnaire: l'empreinte du code source de chaque fonction,
+              et les versions de plotly et de kaleido
+    """
+    empreinte = {}
+    for fonction in fonctions:
+        try:
+            code = inspect.getsource(fonction).encode("utf-8")
+        except (OSError, TypeError):
+            code = fonction.__code__.co_code  # code source introuvable: on prend le bytecode
+        empreinte[fonction.__qualname__] = hashlib.sha256(code).hexdigest()
+    # `metadata.version()` lit la version installée sans importer la librairie,
+    # qui est longue à importer
+    for librairie in ("plotly", "kaleido"):
+        try:
+            empreinte[librairie] = metadata.version(librairie)
+        except metadata.PackageNotFoundError:
+            empreinte[librairie] = None
+    return empreinte
+
+
+def exporter_cache(cle, construire, noms, dossier=DOSSIER_SORTIE, formats=("png",), processus=1,
+                   dossier_rendus=DOSSIER_RENDUS, taille_max=TAILLE_MAX_RENDUS):
+    """
+    comme `exporter()`, mais en passant par le cache des graphiques: si tous
+    les fichiers de la clé `cle` sont dans le cache, on ne crée pas les figures
+    (`construire` n'est pas appelée) et on ne les exporte pas.
+
+    les fichiers de `dossier` sont des liens vers ceux du cache (ou des copies,
+    si le système ne permet pas de créer des liens): quand ils sont déjà à
+    jour, rien n'est réécrit.
+
+    :param cle: la clé des figures, calculée avec `cle_rendu()`
+    :param construire: une fonction sans argument qui renvoie le dictionnaire
+                       des figures à exporter (voir `exporter()`)
+    :param noms: les noms des figures que renvoie `construire`
+    :param dossier: le dossier où enregistrer les fichiers
+    :param formats: les formats à produire, parmi `FORMATS`
+    :param processus: le nombre de processus entre lesquels répartir les images
+    :param dossier_rendus: le dossier du cache des graphiques
+    :param taille_max: la taille maximale du cache, en octets
+    :returns: la liste des chemins des fichiers, et `True` si les fichiers
+              étaient déjà dans le cache
+    """
+    fichiers = [
+        (os.path.join(dossier_rendus, f"{cle}-{nom}.{format}"), os.path.join(dossier, f"{nom}.{format}"))
+        for nom in noms for format in formats
+    ]
+    # les pages `html` ont besoin de `plotly.min.js`, écrit à côté d'elles
+    if "html" in formats:
+        fichiers.append((os.path.join(dossier_rendus, "plotly.min.js"), os.path.join(dossier, "plotly.min.js")))
+
+    trouve = all(os.path.isfile(fichier_cache) for fichier_cache, _ in fichiers)
+    if not trouve:
+        figures = construire()
+        exporter({ f"{cle}-{nom}": figure for nom, figure in figures.items() }, dossier_rendus, formats, processus)
+
+    if not os.path.isdir(dossier):
+        os.makedirs(dossier)
+    for fichier_cache, chemin in fichiers:
+        _lier(fichier_cache, chemin)
+        os.utime(fichier_cache)  # le fichier a été utilisé: on met à jour sa date
+    chemins = [ os.path.join(dossier, f"{nom}.{format}") for nom in noms for format in formats ]
+
+    if not trouve:
+        evincer(dossier_rendus, taille_max)
+    return chemins, trouve
+
+
+def evincer(dossier=DOSSIER_RENDUS, taille_max=TAILLE_MAX_RENDUS):
+    """
+    supprimer les fichiers du cache des graphiques utilisés le moins récemment,
+    jusqu'à ce que la taille du cache soit inférieure à `taille_max`.
+
+    :param dossier: le dossier du cache des graphiques
+    :param taille_max: la taille maximale du cache, en octets
+    """
+    evincer_fichiers(dossier, taille_max, MOTIF_FICHIER_RENDU.match)
+
+
+def _lier(source, destination):
+    """
+    faire de `destination` un lien vers `source` (ou une copie), sauf si c'est
+    déjà le cas. on passe par un fichier temporaire: `destination` n'est jamais
+    à moitié écrite, et un ancien lien est remplacé sans modifier le fichier
+    du cache vers lequel il pointait.
+    """
+    if os.path.isfile(destination) and os.path.samefile(source, destination):
+        return
+    temporaire = f"{destination}.{os.getpid()}.tmp"
+    try:
+        os.link(source, temporaire)
+    except OSError:
+        shutil.copyfile(source, temporaire)
+    os.replace(temporaire, destination)
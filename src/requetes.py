@@ -0,0 +1,301 @@
+from bisect import bisect_left, bisect_right
+from array import array
+import math
+
+from corpus import Corpus, ANNEE_MANQUANTE
+from index_texte import normaliser
+
+
+# *************************************************************
+# dans ce script, on interroge un `Corpus` sans le parcourir en
+# entier: "les entrées vendues entre 1870 et 1890 à plus de 100
+# francs 1900", "les entrées de Voltaire écrites avant 1760"...
+#
+# pour cela, on construit des *index secondaires*:
+# - un *index trié* pour chaque colonne numérique (`date_vente`,
+#   `date_creation`, `prix_constant`): les valeurs de la colonne,
+#   triées, et pour chacune la position de l'entrée dans le
+#   corpus. les entrées dont la valeur est comprise entre deux
+#   bornes se suivent dans l'index: on trouve la première et la
+#   dernière par *dichotomie* (module `bisect`), en log2(n) étapes.
+#   20 étapes suffisent pour un million d'entrées.
+# - un *index de hachage* pour l'auteur.ice (normalisé.e, voir
+#   `index_texte.py`) et le genre: un dictionnaire qui associe à
+#   chaque valeur la liste des positions de ses entrées.
+#
+# pour répondre à une requête, un petit *planificateur* compte,
+# pour chaque condition, le nombre d'entrées qui la vérifient
+# (c'est immédiat avec les index). il part de l'index le plus
+# *sélectif* (celui qui garde le moins d'entrées), et vérifie
+# les autres conditions seulement sur ces entrées.
+#
+# les valeurs manquantes ne sont pas dans les index: une entrée
+# sans date de vente ne vérifie aucune condition sur la date de
+# vente.
+#
+# crédits:
+# - code: Paul Kervegan, 2023. code sous licence `GNU GPLv3.0`
+# *************************************************************
+
+
+# les colonnes numériques indexées, et le type de leur `array`
+CHAMPS_TRIES = {"date_vente": "h", "date_creation": "h", "prix_constant": "d"}
+
+# les colonnes encodées indexées, et la fonction appliquée à leurs valeurs
+CHAMPS_HACHES = {"auteur": normaliser, "genre": str}
+
+# les opérateurs possibles dans une condition
+OPERATEURS = ("==", "<", "<=", ">", ">=", "entre")
+
+
+class IndexTrie:
+    """
+    un index trié sur une colonne numérique.
+
+    >>> index = IndexTrie(corpus.date_vente, "h")
+    >>> index.positions(1870, 1890)
+    array('I', [12, 57, 3, ...])  # les entrées vendues de 1870 à 1890, par date de vente
+    """
+
+    def __init__(self, colonne, type_colonne):
+        """
+        :param colonne: une colonne numérique d'un `Corpus`
+        :param type_colonne: le type de l'`array` de la colonne
+        """
+        manquant = math.isnan if type_colonne == "d" else ANNEE_MANQUANTE.__eq__
+        presentes = [ position for position, valeur in enumerate(colonne) if not manquant(valeur) ]
+        presentes.sort(key=colonne.__getitem__)  # le tri de python est stable: à valeur égale, l'ordre du corpus
+        self.positions_triees = array("I", presentes)
+        self.valeurs = array(type_colonne, map(colonne.__getitem__, presentes))
+
+    def __len__(self):
+        return len(self.valeurs)
+
+    def bornes(self, minimum=None, maximum=None, inclure_minimum=True, inclure_maximum=True):
+        """
+        :param minimum: la borne inférieure, ou `None`
+        :param maximum: la borne supérieure, ou `None`
+        :param inclure_minimum: si `False`, les valeurs égales à `minimum` sont exclues
+        :param inclure_maximum: si `False`, les valeurs égales à `maximum` sont exclues
+        :returns: le début et la fin de l'intervalle de `valeurs` qui vérifie les bornes
+        """
+        debut = 0
+        fin = len(self.valeurs)
+        if minimum is not None:
+            debut = (bisect_left if inclure_minimum else bisect_right)(self.valeurs, minimum)
+        if maximum is not None:
+            fin = (bisect_right if inclure_maximum else bisect_left)(self.valeurs, maximum)
+        return debut, max(debut, fin)
+
+    def nombre(self, *bornes):
+        """
+        :param bornes: voir `bornes()`
+        :returns: le nombre d'entrées qui vérifient les bornes
+        """
+        debut, fin = self.bornes(*bornes)
+        return fin - debut
+
+    def positions(self, *bornes):
+        """
+        :param bornes: voir `bornes()`
+        :returns: les positions des entrées qui vérifient les bornes, triées par valeur
+        """
+        debut, fin = self.bornes(*bornes)
+        return self.positions_triees[debut:fin]
+
+
+class IndexHachage:
+    """
+    un index de hachage sur une colonne encodée d'un `Corpus`.
+
+    >>> index = IndexHachage(corpus.auteur, corpus.valeurs_auteur, normaliser)
+    >>> index.positions("voltaire")
+    array('I', [0, 1, 2, ...])
+    """
+
+    def __init__(self, colonne, valeurs, transformer=str):
+        """
+        :param colonne: une colonne encodée (`auteur`, `genre`...)
+        :param valeurs: la liste des valeurs de la colonne (`valeurs_auteur`...)
+        :param transformer: la fonction appliquée aux valeurs et aux valeurs cherchées
+        """
+        self.transformer = transformer
+        # plusieurs codes peuvent donner la même valeur transformée ("Voltaire" et "VOLTAIRE")
+        self.cles = [ transformer(valeur) for valeur in valeurs ]  # code => valeur transformée
+        self.index = {}
+        for position, code in enumerate(colonne):
+            liste = self.index.get(self.cles[code])
+            if liste is None:
+                liste = self.index[self.cles[code]] = array("I")
+            liste.append(position)
+
+    def nombre(self, valeur):
+        """
+        :returns: le nombre d'entrées dont la colonne vaut `valeur`
+        """
+        return len(self.index.get(self.transformer(valeur), ()))
+
+    def positions(self, valeur):
+        """
+        :returns: les positions des entrées dont la colonne vaut `valeur`, dans l'ordre du corpus
+        """
+        return self.index.get(self.transformer(valeur), array("I"))
+
+
+class Requetes:
+    """
+    interroger un `Corpus` avec des index.
+
+    >>> requetes = Requetes(corpus)
+    >>> requetes.chercher(("date_vente", "entre", (1870, 1890)), ("prix_constant", ">", 100))
+    [12, 57, ...]  # les positions des entrées dans le corpus
+    >>> requetes.chercher(("auteur", "==", "Voltaire"), ("date_creation", "<", 1760))
+    >>> requetes.expliquer(("auteur", "==", "Voltaire"), ("date_creation", "<", 1760))
+    {'index': 'auteur', 'candidates': 302, 'estimations': {'auteur': 302, 'date_creation': 198}}
+
+    une condition est un tuple `(champ, operateur, valeur)`:
+    - `champ`: `date_vente`, `date_creation`, `prix_constant`, `auteur` ou `genre`
+    - `operateur`: `==`, `<`, `<=`, `>`, `>=`, ou `entre` (bornes comprises).
+      `auteur` et `genre` n'acceptent que `==`.
+    - `valeur`: un nombre, une chaîne, ou un tuple `(minimum, maximum)` pour `entre`
+    """
+
+    def __init__(self, corpus):
+        """
+        :param corpus: un `Corpus`, ou une liste de dictionnaires produite par `structure()`
+        """
+        if not isinstance(corpus, Corpus):
+            corpus = Corpus.depuis_entrees(corpus)
+        self.corpus = corpus
+        self.index = {
+            champ: IndexTrie(getattr(corpus, champ), type_colonne)
+            for champ, type_colonne in CHAMPS_TRIES.items()
+        }
+        for champ, transformer in CHAMPS_HACHES.items():
+            self.index[champ] = IndexHachage(getattr(corpus, champ), getattr(corpus, f"valeurs_{champ}"), transformer)
+
+    def planifier(self, *conditions):
+        """
+        réunir les conditions de chaque champ et choisir l'index le plus sélectif.
+
+        :param conditions: des conditions `(champ, operateur, valeur)`
+        :returns: un dictionnaire `{champ: bornes}` (les bornes d'`IndexTrie.bornes()`,
+                  ou la valeur cherchée pour un index de hachage), le champ de l'index
+                  choisi et le nombre d'entrées que garde chaque index
+        """
+        bornes = {}
+        for champ, operateur, valeur in conditions:
+            if champ not in self.index:
+                raise ValueError(f"champ non indexé: {champ} (champs possibles: {', '.join(self.index)})")
+            if operateur not in OPERATEURS:
+                raise ValueError(f"opérateur inconnu: {operateur} (opérateurs possibles: {', '.join(OPERATEURS)})")
+            if champ in CHAMPS_HACHES:
+                if operateur != "==":
+                    raise ValueError(f"le champ {champ} n'accepte que l'opérateur `==`")
+                transforme = self.index[champ].transformer(valeur)
+                if bornes.setdefault(champ, transforme) != transforme:
+                    bornes[champ] = None  # deux valeurs différentes: aucune entrée ne convient
+                continue
+            bornes[champ] = _restreindre(bornes.get(champ, (None, None, True, True)), operateur, valeur)
+
+        estimations = {
+            champ: 0 if valeur is None else self.index[champ].nombre(*valeur) if champ in CHAMPS_TRIES else self.index[champ].nombre(valeur)
+            for champ, valeur in bornes.items()
+        }
+        choisi = min(estimations, key=estimations.get) if estimations else None
+        return bornes, choisi, estimations
+
+    def expliquer(self, *conditions):
+        """
+        :param conditions: des conditions `(champ, operateur, valeur)`
+        :returns: le plan de la requête: l'index choisi, le nombre d'entrées qu'il
+                  garde (les *candidates*), et le nombre d'entrées que garderait chaque index
+        """
+        _, choisi, estimations = self.planifier(*conditions)
+        return {
+            "index": choisi,
+            "candidates": len(self.corpus) if choisi is None else estimations[choisi],
+            "estimations": estimations
+        }
+
+    def chercher(self, *conditions):
+        """
+        :param conditions: des conditions `(champ, operateur, valeur)`, qui doivent
+                           toutes être vérifiées
+        :returns: la liste triée des positions des entrées dans le corpus
+        """
+        bornes, choisi, estimations = self.planifier(*conditions)
+        if choisi is None:
+            return list(range(len(self.corpus)))
+        if estimations[choisi] == 0:
+            return []
+
+        # 1. les candidates, lues dans l'index le plus sélectif
+        if choisi in CHAMPS_TRIES:
+            candidates = self.index[choisi].positions(*bornes.pop(choisi))
+        else:
+            candidates = self.index[choisi].positions(bornes.pop(choisi))
+
+        # 2. les autres conditions, vérifiées directement dans les colonnes du corpus
+        resultat = candidates
+        for champ, valeur in bornes.items():
+            if champ in CHAMPS_TRIES:
+                verifier = _verificateur(getattr(self.corpus, champ), *valeur)
+            else:
+                colonne = getattr(self.corpus, champ)
+                cles = self.index[champ].cles
+                verifier = lambda position, colonne=colonne, cles=cles, valeur=valeur: cles[colonne[position]] == valeur
+            resultat = list(filter(verifier, resultat))
+        return sorted(resultat)
+
+    def entrees(self, *conditions):
+        """
+        :param conditions: des conditions `(champ, operateur, valeur)`
+        :returns: la liste des entrées qui vérifient les conditions (des `Entree`, voir `corpus.py`)
+        """
+        return [ self.corpus[position] for position in self.chercher(*conditions) ]
+
+
+def _restreindre(bornes, operateur, valeur):
+    """
+    ajouter la condition `operateur valeur` aux bornes `(minimum, maximum,
+    inclure_minimum, inclure_maximum)` d'un champ numérique.
+    """
+    minimum, maximum, inclure_minimum, inclure_maximum = bornes
+    if operateur == "entre":
+        nouvelles = [(valeur[0], True, True), (valeur[1], True, False)]
+    elif operateur == "==":
+        nouvelles = [(valeur, True, True), (valeur, True, False)]
+    else:
+        nouvelles = [(valeur, operateur.endswith("="), operateur.startswith(">"))]
+
+    for borne, inclure, est_minimum in nouvelles:
+        if borne is None:
+            continue
+        if est_minimum:
+            # on garde la borne inférieure la plus haute
+            if minimum is None or borne > minimum or (borne == minimum and not inclure):
+                minimum, inclure_minimum = borne, inclure
+        elif maximum is None or borne < maximum or (borne == maximum and not inclure):
+            maximum, inclure_maximum = borne, inclure
+    return minimum, maximum, inclure_minimum, inclure_maximum
+
+
+def _verificateur(colonne, minimum, maximum, inclure_minimum, inclure_maximum):
+    """
+    :returns: une fonction qui indique si la valeur d'une position de `colonne`
+              vérifie les bornes. les valeurs manquantes ne les vérifient jamais.
+    """
+    manquant = math.isnan if colonne.typecode == "d" else ANNEE_MANQUANTE.__eq__
+
+    def verifier(position):
+        valeur = colonne[position]
+        if manquant(valeur):
+            return False
+        if minimum is not None and (valeur < minimum or (valeur == minimum and not inclure_minimum)):
+            return False
+        if maximum is not None and (valeur > maximum or (valeur == maximum and not inclure_maximum)):
+            return False
+        return True
+
+    return verifier
@@ -0,0 +1,377 @@
+from itertools import islice, repeat
+from operator import and_, itemgetter
+from collections import Counter
+from array import array
+import heapq  # pour trouver les plus grandes valeurs sans tout trier
+import zlib  # pour `crc32()`, une fonction de hachage rapide et stable
+import math
+
+from fouille_texte import iter_structure
+from index_texte import mots
+
+
+# *************************************************************
+# dans ce script, on transforme les descriptions des entrées en
+# une *matrice termes-documents*: une ligne par entrée, une
+# colonne par terme (un mot ou une suite de mots, un *n-gramme*),
+# et dans chaque case le nombre d'occurrences du terme.
+#
+# la plupart des cases valent 0: une description ne contient
+# qu'une poignée des milliers de termes du corpus. on range donc
+# la matrice au format *CSR* ("compressed sparse row"), qui ne
+# garde que les cases non nulles, dans 3 `array`:
+# - `indices`: les colonnes des cases non nulles, ligne après ligne
+# - `valeurs`: les valeurs de ces cases
+# - `debuts`: pour chaque ligne, la position de sa première case
+#   dans `indices` et `valeurs`. la ligne `i` occupe donc les
+#   positions `debuts[i]` à `debuts[i+1]`.
+#
+# chaque terme reçoit un numéro de colonne. par défaut, on garde
+# un *vocabulaire* qui associe un numéro à chaque terme. avec
+# l'option `bits`, on utilise plutôt le *hachage* ("hashing
+# trick"): le numéro de colonne est calculé à partir du terme
+# (`crc32(terme) % 2 ** bits`). il n'y a plus de vocabulaire à
+# garder: la mémoire est bornée, mais deux termes peuvent tomber
+# dans la même colonne (une *collision*).
+#
+# les entrées sont traitées par lots de `TAILLE_LOT`: on peut
+# donc vectoriser un générateur comme `iter_structure()` sans
+# jamais garder toutes les entrées en mémoire.
+#
+# à partir de la matrice, on calcule la fréquence des termes par
+# genre et par décennie, les n-grammes les plus fréquents et le
+# TF-IDF, qui met en avant les termes propres à une description.
+#
+# crédits:
+# - code: Paul Kervegan, 2023. code sous licence `GNU GPLv3.0`
+# *************************************************************
+
+
+# le nombre d'entrées traitées à la fois
+TAILLE_LOT = 10000
+
+# la décennie d'une entrée sans date de vente
+DECENNIE_MANQUANTE = -1
+
+
+def ngrammes(mots, n_min=1, n_max=1):
+    """
+    >>> ngrammes(["lettre", "autographe", "signee"], 1, 2)
+    ['lettre', 'autographe', 'signee', 'lettre autographe', 'autographe signee']
+
+    :param mots: une liste de mots
+    :param n_min: le nombre minimal de mots d'un n-gramme
+    :param n_max: le nombre maximal de mots d'un n-gramme
+    :returns: la liste des n-grammes, écrits avec une espace entre les mots
+    """
+    resultat = []
+    for n in range(n_min, n_max + 1):
+        if n == 1:
+            resultat.extend(mots)
+        else:
+            resultat.extend(map(" ".join, zip(*(mots[i:] for i in range(n)))))
+    return resultat
+
+
+class Vocabulaire:
+    """
+    l'association entre les termes et les numéros de colonne de la matrice.
+
+    - sans `bits`, chaque nouveau terme reçoit le numéro suivant.
+    - avec `bits`, le numéro est `crc32(terme) % 2 ** bits`: il y a au plus
+      `2 ** bits` colonnes. pour pouvoir afficher les résultats, on garde
+      un terme par colonne (au plus `2 ** bits` termes).
+    """
+
+    def __init__(self, bits=None):
+        """
+        :param bits: `None` pour un vocabulaire complet, ou le nombre de bits
+                     du hachage (par exemple 20, soit 1 048 576 colonnes)
+        """
+        self.bits = bits
+        self.numeros = {}  # terme => colonne (sans hachage)
+        self.termes = [] if bits is None else {}  # colonne => terme
+
+    def __len__(self):
+        """
+        :returns: le nombre de colonnes de la matrice
+        """
+        return len(self.termes) if self.bits is None else 1 << self.bits
+
+    def colonnes(self, termes):
+        """
+        :param termes: une liste de termes
+        :returns: la liste des numéros de colonne de ces termes. les termes
+                  jamais vus reçoivent un nouveau numéro, dans l'ordre où ils
+                  apparaissent.
+        """
+        if self.bits is None:
+            # `dict.fromkeys()` garde chaque terme une fois, dans l'ordre: on ne
+            # cherche les nouveaux termes que parmi les termes distincts
+            for terme in dict.fromkeys(termes):
+                if terme not in self.numeros:
+                    self.numeros[terme] = len(self.termes)
+                    self.termes.append(terme)
+            return list(map(self.numeros.__getitem__, termes))
+        colonnes = list(map(and_, map(zlib.crc32, map(str.encode, termes)), repeat((1 << self.bits) - 1)))
+        vus = dict(zip(colonnes, termes))
+        for colonne in vus.keys() - self.termes.keys():
+            self.termes[colonne] = vus[colonne]
+        return colonnes
+
+    def terme(self, colonne):
+        """
+        :param colonne: un numéro de colonne
+        :returns: le terme de la colonne (avec le hachage, l'un des termes de cette colonne)
+        """
+        return self.termes[colonne]
+
+
+class MatriceCSR:
+    """
+    une matrice creuse au format CSR (voir plus haut).
+
+    >>> matrice.ligne(0)
+    (array('I', [0, 1, 2]), array('I', [1, 2, 1]))  # colonnes et valeurs de la ligne 0
+    """
+
+    def __init__(self, nombre_colonnes=0, debuts=None, indices=None, valeurs=None):
+        self.nombre_colonnes = nombre_colonnes
+        self.debuts = array("Q", [0]) if debuts is None else debuts
+        self.indices = array("I") if indices is None else indices
+        self.valeurs = array("I") if valeurs is None else valeurs
+
+    def __len__(self):
+        """
+        :returns: le nombre de lignes
+        """
+        return len(self.debuts) - 1
+
+    def ajouter_lignes(self, colonnes, longueurs):
+        """
+        ajouter plusieurs lignes à la matrice.
+
+        pour chaque ligne, `Counter` compte les occurrences de chaque colonne
+        (en C, donc rapidement), puis on recopie les paires triées dans les
+        `array` de la matrice. le `Counter` est jeté aussitôt: la matrice ne
+        garde aucun dictionnaire par ligne.
+
+        :param colonnes: les numéros de colonne de chaque occurrence de terme,
+                         ligne après ligne
+        :param longueurs: le nombre d'occurrences de chaque ligne
+        """
+        debut = 0
+        for longueur in longueurs:
+            paires = sorted(Counter(colonnes[debut:debut + longueur]).items())
+            debut += longueur
+            self.indices.extend(map(itemgetter(0), paires))
+            self.valeurs.extend(map(itemgetter(1), paires))
+            self.debuts.append(len(self.indices))
+
+    def ligne(self, i):
+        """
+        :param i: le numéro de la ligne
+        :returns: les colonnes des cases non nulles de la ligne, et leurs valeurs
+        """
+        debut, fin = self.debuts[i], self.debuts[i + 1]
+        return self.indices[debut:fin], self.valeurs[debut:fin]
+
+    def frequences_documentaires(self):
+        """
+        :returns: pour chaque colonne, le nombre de lignes où elle n'est pas nulle
+        """
+        frequences = array("I", [0]) * self.nombre_colonnes
+        for colonne in self.indices:
+            frequences[colonne] += 1
+        return frequences
+
+    def sommes(self, groupes=None):
+        """
+        additionner les lignes, par groupe.
+
+        :param groupes: le groupe de chaque ligne (une liste ou un `array`),
+                        ou `None` pour additionner toutes les lignes ensemble
+        :returns: un dictionnaire `{groupe: {colonne: somme}}` (le groupe
+                  vaut `None` si `groupes` vaut `None`)
+        """
+        if groupes is None:
+            totaux = {}
+            for colonne, valeur in zip(self.indices, self.valeurs):
+                totaux[colonne] = totaux.get(colonne, 0) + valeur
+            return {None: totaux}
+        resultat = {}
+        for i, groupe in enumerate(groupes):
+            totaux = resultat.get(groupe)
+            if totaux is None:
+                totaux = resultat[groupe] = {}
+            debut, fin = self.debuts[i], self.debuts[i + 1]
+            for colonne, valeur in zip(self.indices[debut:fin], self.valeurs[debut:fin]):
+                totaux[colonne] = totaux.get(colonne, 0) + valeur
+        return resultat
+
+    def tfidf(self, normer=True):
+        """
+        calculer le TF-IDF de chaque case: le nombre d'occurrences du terme dans
+        la ligne, multiplié par `log((1 + lignes) / (1 + lignes contenant le terme)) + 1`.
+        un terme présent partout a un poids faible; un terme rare, un poids fort.
+
+        :param normer: si `True`, chaque ligne est divisée par sa norme (la racine
+                       de la somme des carrés): les lignes courtes et longues sont comparables
+        :returns: une nouvelle `MatriceCSR`, aux valeurs à virgule. elle partage
+                  `debuts` et `indices` avec cette matrice.
+        """
+        lignes = len(self)
+        idf = [ math.log((1 + lignes) / (1 + frequence)) + 1 for frequence in self.frequences_documentaires() ]
+        valeurs = array("d", (valeur * idf[colonne] for colonne, valeur in zip(self.indices, self.valeurs)))
+        if normer:
+            for i in range(lignes):
+                debut, fin = self.debuts[i], self.debuts[i + 1]
+                norme = math.sqrt(sum(valeur * valeur for valeur in valeurs[debut:fin]))
+                if norme > 0:
+                    valeurs[debut:fin] = array("d", (valeur / norme for valeur in valeurs[debut:fin]))
+        return MatriceCSR(self.nombre_colonnes, self.debuts, self.indices, valeurs)
+
+
+class TermesDocuments:
+    """
+    la matrice termes-documents des descriptions d'un corpus, avec le genre et la
+    décennie de vente de chaque ligne.
+
+    >>> termes = TermesDocuments(n_max=2)
+    >>> termes.ajouter(iter_structure("idees"), genre="idees")
+    >>> termes.termes_frequents(10, par="decennie")
+    {1870: [('lettre', 5321), ('l a s', 2210), ...], ...}
+
+    comme dans `Corpus`, les genres sont stockés sous forme de codes: `genres[i]`
+    est la position du genre de la ligne `i` dans `valeurs_genre`.
+    """
+
+    def __init__(self, n_min=1, n_max=1, bits=None):
+        """
+        :param n_min: le nombre minimal de mots d'un terme
+        :param n_max: le nombre maximal de mots d'un terme
+        :param bits: `None` pour un vocabulaire complet, ou le nombre de bits du hachage
+        """
+        self.n_min = n_min
+        self.n_max = n_max
+        self.vocabulaire = Vocabulaire(bits)
+        self.matrice = MatriceCSR()
+        self.genres = array("H")  # comme `Corpus.genre`
+        self.valeurs_genre = []
+        self._codes_genre = {}  # {genre: code}, pour encoder rapidement
+        self.decennies = array("h")
+
+    def __len__(self):
+        return len(self.matrice)
+
+    def ajouter(self, entrees, genre=None, taille_lot=TAILLE_LOT):
+        """
+        ajouter des entrées à la matrice, lot par lot.
+
+        :param entrees: des dictionnaires produits par `structure()` ou
+                        `iter_structure()`, ou un `Corpus`
+        :param genre: le genre de toutes ces entrées. s'il vaut `None`, on lit
+                      le genre de chaque entrée (ce qui suppose un `Corpus`)
+        :param taille_lot: le nombre d'entrées traitées à la fois
+        """
+        entrees = iter(entrees)
+        while True:
+            lot = list(islice(entrees, taille_lot))
+            if not lot:
+                break
+            self.ajouter_lot(lot, genre)
+
+    def ajouter_lot(self, lot, genre=None):
+        """
+        ajouter un lot d'entrées à la matrice. les mots de chaque description
+        sont normalisés avec `mots()` (voir `index_texte.py`), comme dans l'index.
+
+        :param lot: une liste d'entrées
+        :param genre: voir `ajouter()`
+        """
+        termes = []     # les termes de tout le lot, description après description
+        longueurs = []  # le nombre de termes de chaque description
+        for entree in lot:
+            termes_texte = ngrammes(mots(entree["description"]), self.n_min, self.n_max)
+            termes.extend(termes_texte)
+            longueurs.append(len(termes_texte))
+        self.matrice.ajouter_lignes(self.vocabulaire.colonnes(termes), longueurs)
+        self.matrice.nombre_colonnes = len(self.vocabulaire)
+
+        code = None if genre is None else self._code_genre(genre)
+        for entree in lot:
+            self.genres.append(self._code_genre(entree["genre"]) if code is None else code)
+            annee = entree["date_vente"]
+            self.decennies.append(DECENNIE_MANQUANTE if annee == "" else annee // 10 * 10)
+
+    def _code_genre(self, genre):
+        """
+        :returns: le code du genre `genre`, ajouté à `valeurs_genre` s'il est nouveau
+        """
+        code = self._codes_genre.get(genre)
+        if code is None:
+            code = len(self.valeurs_genre)
+            self.valeurs_genre.append(genre)
+            self._codes_genre[genre] = code
+        return code
+
+    def frequences(self, par=None):
+        """
+        :param par: `None`, `"genre"` ou `"decennie"`
+        :returns: un dictionnaire `{groupe: {terme: nombre d'occurrences}}`. le groupe
+                  vaut `None` si `par` vaut `None`, et `DECENNIE_MANQUANTE` pour les
+                  entrées sans date de vente.
+        """
+        if par == "genre":
+            groupes = [ self.valeurs_genre[code] for code in self.genres ]
+        elif par == "decennie":
+            groupes = self.decennies
+        elif par is None:
+            groupes = None
+        else:
+            raise ValueError(f"regroupement inconnu: {par} (possibles: genre, decennie)")
+        terme = self.vocabulaire.terme
+        return {
+            groupe: { terme(colonne): total for colonne, total in totaux.items() }
+            for groupe, totaux in self.matrice.sommes(groupes).items()
+        }
+
+    def termes_frequents(self, nombre=20, par=None, n=None):
+        """
+        :param nombre: le nombre de termes à garder par groupe
+        :param par: `None`, `"genre"` ou `"decennie"` (voir `frequences()`)
+        :param n: si donné, ne garder que les termes de `n` mots
+        :returns: `{groupe: [(terme, nombre d'occurrences), ...]}`, du plus fréquent au moins fréquent
+        """
+        resultat = {}
+        for groupe, frequences in self.frequences(par).items():
+            paires = frequences.items()
+            if n is not None:
+                paires = ( paire for paire in paires if paire[0].count(" ") == n - 1 )
+            resultat[groupe] = heapq.nlargest(nombre, paires, key=lambda paire: (paire[1], paire[0]))
+        return resultat
+
+    def tfidf(self, normer=True):
+        """
+        :returns: la matrice TF-IDF (voir `MatriceCSR.tfidf()`)
+        """
+        return self.matrice.tfidf(normer)
+
+
+def vectoriser_genres(genres, n_min=1, n_max=2, bits=None, taille_lot=TAILLE_LOT, dossier=None):
+    """
+    construire la matrice termes-documents de plusieurs catalogues, lus au fur
+    et à mesure avec `iter_structure()` (voir `fouille_texte.py`).
+
+    :param genres: les genres des catalogues
+    :param n_min: le nombre minimal de mots d'un terme
+    :param n_max: le nombre maximal de mots d'un terme
+    :param bits: `None` pour un vocabulaire complet, ou le nombre de bits du hachage
+    :param taille_lot: le nombre d'entrées traitées à la fois
+    :param dossier: le dossier des catalogues (par défaut, `in/`)
+    :returns: un `TermesDocuments`
+    """
+    termes = TermesDocuments(n_min, n_max, bits)
+    for genre in genres:
+        termes.ajouter(iter_structure(genre, dossier=dossier), genre=genre, taille_lot=taille_lot)
+    return termes
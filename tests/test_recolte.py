@@ -0,0 +1,93 @@
+import unittest
+import time
+import sys
+import os
+
+sys.path.insert(0, os.path.join(os.path.abspath(os.path.dirname(__file__)), os.pardir, "src"))
+
+try:
+    import requests  # noqa: F401
+    import tenacity  # noqa: F401
+except ImportError:
+    requests = None
+
+import recolte
+from katapi_local import ServeurKatapi
+
+
+# *************************************************************
+# des tests de la récolte (`recolte.py`), avec le faux serveur
+# de l'API Katabase (`katapi_local.py`): erreurs temporaires
+# (429 et 5xx) et nouvelles tentatives, en-tête `Retry-After`,
+# réutilisation des connexions, fusion des réponses par
+# identifiant.
+#
+#   python -m pytest tests
+#
+# crédits:
+# - code: Paul Kervegan, 2023. code sous licence `GNU GPLv3.0`
+# *************************************************************
+
+
+AUTEURS = {
+    "idees": ["voltaire", "diderot"],
+    "roman": ["sade", "laclos", "sade"],  # "sade" deux fois: ses entrées ne doivent être gardées qu'une fois
+    "poeme": ["chenier"]
+}
+
+
+@unittest.skipIf(requests is None, "la récolte a besoin de `requests` et de `tenacity`")
+class TestRecolte(unittest.TestCase):
+
+    def setUp(self):
+        # des attentes courtes entre deux essais, pour que les tests restent rapides
+        self.attente_base = recolte.ATTENTE_BASE
+        recolte.ATTENTE_BASE = 0.01
+
+    def tearDown(self):
+        recolte.ATTENTE_BASE = self.attente_base
+
+    def recolter(self, serveur, **options):
+        options = { "debit": None, "concurrence": 4, **options }
+        with recolte.Recolteur(url=serveur.url, **options) as recolteur:
+            return recolteur.recolter(AUTEURS)
+
+    def test_erreurs_temporaires(self):
+        with ServeurKatapi() as serveur:
+            reference = self.recolter(serveur)
+        with ServeurKatapi(taux_429=0.2, taux_5xx=0.2, retry_after=0.01, graine=1) as serveur:
+            datasets = self.recolter(serveur, tentatives=20)
+            self.assertGreater(serveur.erreurs, 0)
+            self.assertEqual(serveur.requetes, 3 * 6 + serveur.erreurs)  # 6 auteur.ice.s, 3 fenêtres
+            # une session, et au plus une connexion par requête simultanée
+            self.assertLessEqual(serveur.connexions, 4)
+        self.assertEqual(datasets, reference)
+
+    def test_fusion_par_identifiant(self):
+        with ServeurKatapi() as serveur:
+            datasets = self.recolter(serveur)
+            une_fenetre = self.recolter(serveur, fenetres=1)
+            sade = serveur.resultats("sade")
+            laclos = serveur.resultats("laclos")
+        self.assertEqual(datasets, une_fenetre)
+        for genre, dataset in datasets.items():
+            self.assertEqual(list(dataset), sorted(dataset, key=recolte.cle_identifiant), genre)
+        self.assertEqual(set(datasets["roman"]), set(sade) | set(laclos))
+        self.assertEqual(len(datasets["roman"]), len(sade) + len(laclos))
+
+    def test_retry_after(self):
+        # toutes les requêtes sont refusées: après `tentatives` essais, on renvoie l'erreur,
+        # en ayant attendu au moins `Retry-After` entre deux essais.
+        with ServeurKatapi(taux_429=1.0, retry_after=0.2) as serveur:
+            with recolte.Recolteur(url=serveur.url, debit=None, tentatives=3) as recolteur:
+                debut = time.monotonic()
+                with self.assertRaises(recolte.ErreurTemporaire) as erreur:
+                    recolteur.requete("voltaire")
+                duree = time.monotonic() - debut
+            self.assertEqual(serveur.requetes, 3)
+        self.assertGreaterEqual(duree, 2 * 0.2)
+        self.assertEqual(erreur.exception.attente, 0.2)
+
+
+if __name__ == "__main__":
+    unittest.main()